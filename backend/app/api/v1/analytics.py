@@ -0,0 +1,122 @@
+"""
+Palmlion Regional Analytics API
+City dashboard aggregates for Lagos, Nairobi, Joburg, Accra and Kampala
+"""
+from typing import Dict, List, Literal, Optional
+
+from fastapi import APIRouter, Query
+from pydantic import BaseModel
+
+from app.core.analytics import ALL_REGIONS, regional_analytics
+from app.core.reach import fan_reach
+
+router = APIRouter()
+
+Window = Literal["1h", "24h", "7d"]
+ReachWindow = Literal["1d", "7d", "30d"]
+
+
+class HistogramBin(BaseModel):
+    """Fans whose latest score falls in [min_score, max_score)"""
+    min_score: int
+    max_score: Optional[int] = None
+    fans: int
+
+
+class RegionAnalyticsResponse(BaseModel):
+    """Rolling activity and score distribution for one region"""
+    region: str
+    window: str
+    action_volume: int
+    active_fans: int
+    platform_mix: Dict[str, int]
+    action_mix: Dict[str, int]
+    scored_fans: int
+    tiers: Dict[str, int]
+    score_histogram: List[HistogramBin]
+
+
+class RegionsResponse(BaseModel):
+    """Every region's aggregates for one window"""
+    window: str
+    regions: List[RegionAnalyticsResponse]
+
+
+class ArtistReachResponse(BaseModel):
+    """Estimated unique fans of one artist over a window of days"""
+    artist_name: str
+    region: str
+    window: str
+    start_date: str
+    end_date: str
+    standard_error: float
+    unique_fans: int
+    by_action: Dict[str, int]
+    by_region: Dict[str, int]
+
+
+class ArtistReach(BaseModel):
+    """One artist's estimated unique fans"""
+    artist_name: str
+    unique_fans: int
+
+
+class ReachRankingResponse(BaseModel):
+    """Artists ranked by estimated unique fans over a window of days"""
+    region: str
+    window: str
+    start_date: str
+    end_date: str
+    standard_error: float
+    artists: List[ArtistReach]
+
+
+@router.get("/regions", response_model=RegionsResponse)
+async def list_regions(window: Window = "24h") -> dict:
+    """
+    Aggregates for every region seen so far, plus the "all" rollup
+
+    Served from running totals; nothing is scanned per request.
+    """
+    names = [ALL_REGIONS, *regional_analytics.regions()]
+    return {
+        "window": window,
+        "regions": [regional_analytics.snapshot(name, window) for name in names],
+    }
+
+
+@router.get("/regions/{region}", response_model=RegionAnalyticsResponse)
+async def get_region(region: str, window: Window = "24h") -> dict:
+    """Aggregates for one region; regions without activity report zeros"""
+    return regional_analytics.snapshot(region, window)
+
+
+@router.get("/reach", response_model=ReachRankingResponse)
+async def list_artist_reach(
+    window: ReachWindow = "7d",
+    region: Optional[str] = None,
+    limit: int = Query(default=20, le=100),
+) -> dict:
+    """
+    Artists ranked by unique fans who acted for them in the window
+
+    Estimated from daily HyperLogLog sketches merged over the window's
+    days (and regions, without a region filter).
+    """
+    return await fan_reach.top(window, region, limit)
+
+
+@router.get("/reach/{artist_name}", response_model=ArtistReachResponse)
+async def get_artist_reach(
+    artist_name: str,
+    window: ReachWindow = "7d",
+    region: Optional[str] = None,
+) -> dict:
+    """
+    Unique fans who streamed, shared, tipped... for an artist in the window
+
+    unique_fans counts each fan once across action types and regions;
+    by_action and by_region break it down, and a fan active in several
+    of them appears in each. Estimates, within about standard_error.
+    """
+    return await fan_reach.reach(artist_name, window, region)
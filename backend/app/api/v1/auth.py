@@ -2,18 +2,27 @@
 Palmlion Authentication API
 Phone/Telegram/WhatsApp registration for African superfans
 """
+import hmac
+import time
 from datetime import datetime
 from typing import Optional
 from uuid import uuid4
 
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, HTTPException, Request, status
 from pydantic import BaseModel
 
+from app.core.config import settings
+from app.core.security import sign_access_token
+from app.core.sms import SMSQueueFullError, sms_dispatcher
+from app.core.state import USERS, state_backend
+
 router = APIRouter()
 
-# Demo user store
-users_db: dict = {}
-otp_store: dict = {}
+# State backend namespaces
+OTPS = "otp"
+TELEGRAM_IDS = "telegram_ids"
+
+OTP_TTL_SECONDS = 300
 
 
 class PhoneRegister(BaseModel):
@@ -43,6 +52,15 @@ class UserResponse(BaseModel):
     region: str
     conviction_tier: str
     created_at: str
+    # Signed user token for the realtime socket; None until JWT_SECRET_KEY is set
+    access_token: Optional[str] = None
+
+
+def _access_token(user_id: str) -> Optional[str]:
+    if not settings.access_tokens_allowed:
+        return None
+    expires_at = int(time.time()) + settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    return sign_access_token(settings.JWT_SECRET_KEY, user_id, expires_at)
 
 
 @router.post("/register/phone")
@@ -63,26 +81,86 @@ async def register_phone(data: PhoneRegister):
     # Generate OTP
     import random
     otp = str(random.randint(100000, 999999))
-    otp_store[data.phone] = {
-        "code": otp,
-        "region": data.region,
-        "expires": datetime.utcnow().timestamp() + 300,  # 5 min
-    }
-
-    # In production, send via Africa's Talking
-    print(f"[Palmlion] OTP for {data.phone}: {otp}")
+    await state_backend.set(
+        OTPS,
+        data.phone,
+        {
+            "code": otp,
+            "region": data.region,
+            "expires": datetime.utcnow().timestamp() + OTP_TTL_SECONDS,
+        },
+        ttl=OTP_TTL_SECONDS,
+    )
+
+    # Queue for Africa's Talking - never wait on the SMS gateway here
+    try:
+        sms_id = await sms_dispatcher.enqueue(data.phone, f"Your Palmlion code is {otp}")
+    except SMSQueueFullError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="SMS delivery is busy, try again shortly",
+        )
 
     return {
         "message": "OTP sent",
         "phone": data.phone[:6] + "****",
-        "expires_in": 300,
+        "expires_in": OTP_TTL_SECONDS,
+        "sms_id": sms_id,
+    }
+
+
+@router.get("/sms/{sms_id}")
+async def get_sms_status(sms_id: str):
+    """Get delivery status of an OTP SMS"""
+    receipt = await sms_dispatcher.get_receipt(sms_id)
+    if not receipt:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="SMS not found",
+        )
+    return {
+        "sms_id": receipt.message_id,
+        "status": receipt.status.value,
+        "attempts": receipt.attempts,
+        "error": receipt.error,
+        "updated_at": receipt.updated_at,
     }
 
 
+@router.post("/sms/delivery-report")
+async def sms_delivery_report(request: Request, token: Optional[str] = None):
+    """
+    Africa's Talking delivery report callback
+
+    Configured as the SMS delivery report URL in the Africa's Talking
+    dashboard, with AFRICAS_TALKING_CALLBACK_TOKEN as its token query
+    parameter. Without a token configured only DEBUG accepts reports.
+    """
+    expected = settings.AFRICAS_TALKING_CALLBACK_TOKEN
+    if not expected:
+        if not settings.DEBUG:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Delivery report token is not configured",
+            )
+    elif not token or not hmac.compare_digest(token, expected):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid delivery report token",
+        )
+    form = await request.form()
+    receipt = await sms_dispatcher.record_delivery_report(
+        gateway_message_id=form.get("id", ""),
+        status=form.get("status", ""),
+        failure_reason=form.get("failureReason"),
+    )
+    return {"recorded": receipt is not None}
+
+
 @router.post("/verify-otp", response_model=UserResponse)
 async def verify_otp(data: OTPVerify):
     """Verify OTP and complete registration"""
-    stored = otp_store.get(data.phone)
+    stored = await state_backend.get(OTPS, data.phone)
 
     if not stored:
         raise HTTPException(
@@ -102,6 +180,13 @@ async def verify_otp(data: OTPVerify):
             detail="Invalid OTP",
         )
 
+    # Consume the OTP; only one worker can win a concurrent double submit
+    if await state_backend.pop(OTPS, data.phone) is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No OTP found for this phone",
+        )
+
     # Create user
     user_id = str(uuid4())
     user = {
@@ -111,12 +196,10 @@ async def verify_otp(data: OTPVerify):
         "conviction_tier": "starter",
         "created_at": datetime.utcnow().isoformat(),
     }
-    users_db[user_id] = user
-
-    # Clean up OTP
-    del otp_store[data.phone]
+    await state_backend.set(USERS, user_id, user)
 
-    return UserResponse(**user)
+    # Validated once, by the route's response_model
+    return {**user, "access_token": _access_token(user_id)}
 
 
 @router.post("/register/telegram", response_model=UserResponse)
@@ -126,15 +209,16 @@ async def register_telegram(data: TelegramRegister):
 
     Used for #PalmDash missions and bot interactions.
     """
-    # Check if already registered
-    for user in users_db.values():
-        if user.get("telegram_id") == data.telegram_id:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Telegram already registered",
-            )
-
+    # Claim the Telegram id first so concurrent registrations can't both succeed
     user_id = str(uuid4())
+    if not await state_backend.set_if_absent(
+        TELEGRAM_IDS, data.telegram_id, {"user_id": user_id}
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Telegram already registered",
+        )
+
     user = {
         "id": user_id,
         "telegram_id": data.telegram_id,
@@ -143,15 +227,15 @@ async def register_telegram(data: TelegramRegister):
         "conviction_tier": "starter",
         "created_at": datetime.utcnow().isoformat(),
     }
-    users_db[user_id] = user
+    await state_backend.set(USERS, user_id, user)
 
-    return UserResponse(**user)
+    return {**user, "access_token": _access_token(user_id)}
 
 
 @router.get("/me")
 async def get_current_user(user_id: str):
     """Get current user profile"""
-    user = users_db.get(user_id)
+    user = await state_backend.get(USERS, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -4,35 +4,119 @@ African superfan conviction metrics and leaderboards
 """
 from datetime import datetime, timedelta
 from decimal import Decimal
-from typing import Optional
+from typing import Dict, List, Optional
 from uuid import UUID
 
 from fastapi import APIRouter, Query
+from pydantic import BaseModel
 
-from app.core.conviction import (
-    ActionType,
-    ConvictionAction,
-    ConvictionScore,
-    Platform,
-    calculate_conviction_score,
-)
+from app.core.actions import action_store
+from app.core.artists import artist_matrix
+from app.core.cache import CachePolicy
+from app.core.config import settings
+from app.core.conviction import ActionType, calculate_conviction_score
 
 router = APIRouter()
 
-# Demo conviction data
-demo_actions = {
-    "demo-user-1": [
-        ConvictionAction(ActionType.STREAM, Platform.BOOMPLAY, datetime.utcnow() - timedelta(days=1), True),
-        ConvictionAction(ActionType.STREAM, Platform.BOOMPLAY, datetime.utcnow() - timedelta(days=1), True),
-        ConvictionAction(ActionType.STREAM, Platform.AUDIOMACK, datetime.utcnow() - timedelta(days=2), True),
-        ConvictionAction(ActionType.SHARE, Platform.TELEGRAM, datetime.utcnow() - timedelta(days=3), True),
-        ConvictionAction(ActionType.MISSION, Platform.TELEGRAM, datetime.utcnow() - timedelta(days=5), True),
-        ConvictionAction(ActionType.TIP, Platform.MTN_MUSIC, datetime.utcnow() - timedelta(days=7), True),
-    ]
+# GET routes served by the response cache, relative to this router
+CACHED_ROUTES = {
+    "/tiers": CachePolicy(ttl=settings.CACHE_TTL_TIERS),
+    "/leaderboard": CachePolicy(ttl=settings.CACHE_TTL_LEADERBOARD),
 }
 
 
-@router.get("/score")
+class ConvictionScoreResponse(BaseModel):
+    """Current conviction score"""
+    user_id: str
+    conviction_score: float
+    impact_power: float
+    tier: str
+    percentile: float
+    action_count: int
+    consistency_rating: str
+    streak_days: int
+
+
+class ScoreBreakdownResponse(BaseModel):
+    """Conviction score components"""
+    user_id: str
+    total_score: float
+    platform_breakdown: Dict[str, int]
+    components: Dict[str, int]
+    platform_weights: Dict[str, float]
+
+
+class HistoryPoint(BaseModel):
+    """Daily conviction score"""
+    date: str
+    score: float
+
+
+class ConvictionHistoryResponse(BaseModel):
+    """Conviction score history"""
+    user_id: str
+    period_days: int
+    history: List[HistoryPoint]
+
+
+class LeaderboardEntry(BaseModel):
+    """Leaderboard row"""
+    rank: int
+    display_name: str
+    score: float
+    tier: str
+    region: str
+
+
+class LeaderboardResponse(BaseModel):
+    """Regional conviction leaderboard"""
+    leaderboard: List[LeaderboardEntry]
+    total_participants: int
+    region_filter: Optional[str] = None
+    updated_at: str
+
+
+class ArtistFan(BaseModel):
+    """Superfan row for one artist"""
+    rank: int
+    user_id: str
+    score: float
+
+
+class ArtistSuperfansResponse(BaseModel):
+    """An artist's top fans by artist-scoped conviction"""
+    artist_name: str
+    fans: List[ArtistFan]
+    total_fans: int
+    total_conviction: float
+
+
+class FanArtist(BaseModel):
+    """One artist in a fan's ranking"""
+    rank: int
+    artist_name: str
+    score: float
+
+
+class FanArtistsResponse(BaseModel):
+    """A fan's artists ranked by their conviction for each"""
+    user_id: str
+    artists: List[FanArtist]
+
+
+class Tier(BaseModel):
+    """Tier threshold and benefits"""
+    name: str
+    min_score: int
+    benefits: List[str]
+
+
+class TiersResponse(BaseModel):
+    """All conviction tiers"""
+    tiers: List[Tier]
+
+
+@router.get("/score", response_model=ConvictionScoreResponse)
 async def get_conviction_score(
     user_id: str = "demo-user-1",
 ) -> dict:
@@ -41,8 +125,7 @@ async def get_conviction_score(
 
     Conviction measures dedication via African platform verification.
     """
-    actions = demo_actions.get(user_id, [])
-    score = calculate_conviction_score(actions)
+    score = await action_store.score(user_id)
 
     return {
         "user_id": user_id,
@@ -56,14 +139,14 @@ async def get_conviction_score(
     }
 
 
-@router.get("/breakdown")
+@router.get("/breakdown", response_model=ScoreBreakdownResponse)
 async def get_score_breakdown(
     user_id: str = "demo-user-1",
 ) -> dict:
     """
     Get detailed breakdown of conviction score components
     """
-    actions = demo_actions.get(user_id, [])
+    actions = await action_store.get(user_id)
     score = calculate_conviction_score(actions)
 
     return {
@@ -86,7 +169,7 @@ async def get_score_breakdown(
     }
 
 
-@router.get("/history")
+@router.get("/history", response_model=ConvictionHistoryResponse)
 async def get_conviction_history(
     user_id: str = "demo-user-1",
     days: int = Query(default=30, le=90),
@@ -111,7 +194,7 @@ async def get_conviction_history(
     }
 
 
-@router.get("/leaderboard")
+@router.get("/leaderboard", response_model=LeaderboardResponse)
 async def get_leaderboard(
     region: Optional[str] = None,
     limit: int = Query(default=50, le=100),
@@ -140,7 +223,44 @@ async def get_leaderboard(
     }
 
 
-@router.get("/tiers")
+@router.get("/artists/{artist_name}/superfans", response_model=ArtistSuperfansResponse)
+async def get_artist_superfans(
+    artist_name: str,
+    limit: int = Query(default=50, le=500),
+) -> dict:
+    """
+    Get an artist's superfans
+
+    Ranks fans by conviction from actions tagged with this artist.
+    """
+    result = artist_matrix.top_fans(artist_name, limit)
+    return {
+        **result,
+        "fans": [
+            {"rank": rank, "user_id": user_id, "score": score}
+            for rank, (user_id, score) in enumerate(result["fans"], start=1)
+        ],
+    }
+
+
+@router.get("/artists", response_model=FanArtistsResponse)
+async def get_fan_artists(
+    user_id: str = "demo-user-1",
+    limit: int = Query(default=20, le=100),
+) -> dict:
+    """Get the artists a fan has the most conviction for"""
+    return {
+        "user_id": user_id,
+        "artists": [
+            {"rank": rank, "artist_name": artist_name, "score": score}
+            for rank, (artist_name, score) in enumerate(
+                artist_matrix.fan_artists(user_id, limit), start=1
+            )
+        ],
+    }
+
+
+@router.get("/tiers", response_model=TiersResponse)
 async def get_tier_thresholds() -> dict:
     """Get conviction tier thresholds and benefits"""
     return {
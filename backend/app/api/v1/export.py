@@ -2,33 +2,38 @@
 Palmlion Export API
 Export conviction data to Convicta and trigger Issuance mints
 """
-from datetime import datetime, timedelta
-from typing import Optional
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Optional
 
-import httpx
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 
+from app.api.v1.analytics import ReachWindow
+from app.api.v1.missions import mission_catalog
+from app.core.actions import action_store
+from app.core.changes import ChangeCursorExpiredError, export_changes
 from app.core.config import settings
-from app.core.conviction import (
-    ActionType,
-    ConvictionAction,
-    Platform,
-    calculate_conviction_score,
-    export_to_convicta,
+from app.core.conviction import export_to_convicta
+from app.core.export import (
+    COLUMNAR_MEDIA_TYPE,
+    NDJSON_MEDIA_TYPE,
+    encode_columnar,
+    iter_export_chunks,
+    stream_ndjson_exports,
 )
+from app.core.issuance import MintQueueFullError, mint_pipeline
+from app.core.metrics import EXPORT_RECORDS
+from app.core.outbox import convicta_outbox, convicta_pusher
+from app.core.progress import progress_backend
+from app.core.reach import fan_reach
 
 router = APIRouter()
 
-# Demo actions for export
-demo_actions = {
-    "demo-user-1": [
-        ConvictionAction(ActionType.STREAM, Platform.BOOMPLAY, datetime.utcnow() - timedelta(days=1), True),
-        ConvictionAction(ActionType.STREAM, Platform.AUDIOMACK, datetime.utcnow() - timedelta(days=2), True),
-        ConvictionAction(ActionType.SHARE, Platform.TELEGRAM, datetime.utcnow() - timedelta(days=3), True),
-        ConvictionAction(ActionType.MISSION, Platform.TELEGRAM, datetime.utcnow() - timedelta(days=5), True),
-    ]
-}
+
+async def score_for_export(user_id: str) -> dict:
+    return export_to_convicta(user_id, await action_store.score(user_id))
 
 
 class ExportRequest(BaseModel):
@@ -41,17 +46,161 @@ class BatchExportRequest(BaseModel):
     user_ids: list[str]
 
 
-@router.get("/conviction/{user_id}")
+class ConvictaConviction(BaseModel):
+    """Palmlion conviction block of a Convicta record"""
+    score: float
+    impact_power: float
+    tier: str
+    percentile: float
+    action_count: int
+    platform_breakdown: Dict[str, int]
+    consistency_rating: str
+    streak_days: int
+
+
+class ConvictaRecord(BaseModel):
+    """One user's conviction record in convicta_v1 format"""
+    user_id: str
+    palmlion_conviction: ConvictaConviction
+    region: str
+    timestamp: str
+    convicta_user_id: Optional[str] = None
+
+
+class ConvictaChange(ConvictaRecord):
+    """Changed record with its position in the change log"""
+    change_seq: int
+
+
+class ConvictionExportResponse(BaseModel):
+    """Single user export"""
+    export_format: str
+    data: ConvictaRecord
+    generated_at: str
+
+
+class PushResponse(BaseModel):
+    """Record queued to the Convicta outbox"""
+    queued: bool
+    outbox_id: str
+    mode: str
+    data: ConvictaRecord
+
+
+class BatchPushResponse(BaseModel):
+    """Records queued to the Convicta outbox"""
+    queued: int
+    mode: str
+
+
+class OutboxStatusResponse(BaseModel):
+    """Outbox backlog and delivery statistics"""
+    enabled: bool
+    running: bool
+    in_flight_batches: int
+    pushed_records: int
+    log_bytes: int
+    committed_offset: int
+    pending_bytes: int
+
+
+class BatchExportResponse(BaseModel):
+    """Batch export"""
+    batch_size: int
+    exports: List[ConvictaRecord]
+    generated_at: str
+
+
+class ChangesResponse(BaseModel):
+    """Page of the delta export"""
+    export_format: str
+    changes: List[ConvictaChange]
+    count: int
+    cursor: int
+    epoch: str
+    has_more: bool
+    generated_at: str
+
+
+class ConvictaReach(BaseModel):
+    """An artist's estimated unique fans over a window in convicta_v1 format"""
+    artist_name: str
+    region: str
+    window: str
+    start_date: str
+    end_date: str
+    unique_fans: int
+    unique_fans_by_action: Dict[str, int]
+    unique_fans_by_region: Dict[str, int]
+    estimator: str
+    standard_error: float
+
+
+class ReachExportResponse(BaseModel):
+    """Artist reach export"""
+    export_format: str
+    data: ConvictaReach
+    generated_at: str
+
+
+class IssuanceMintPayload(BaseModel):
+    """Mint request as sent to Issuance"""
+    source: str
+    idempotency_key: str
+    user_id: str
+    artist_name: str
+    completion_id: str
+    stake_percentage: float
+    wallet_address: str
+    timestamp: str
+
+
+class MintTriggerResponse(BaseModel):
+    """Queued or existing mint for a completion"""
+    triggered: bool
+    duplicate: bool
+    mint_id: str
+    status: str
+    mint_request: IssuanceMintPayload
+    mode: str
+
+
+class MintStatusResponse(BaseModel):
+    """Mint request state"""
+    user_id: str
+    artist_name: str
+    completion_id: str
+    stake_percentage: float
+    wallet_address: str
+    mint_id: str
+    status: str
+    attempts: int
+    issuance_id: Optional[str] = None
+    error: Optional[str] = None
+    created_at: str
+    updated_at: str
+
+
+class MintPipelineStatusResponse(BaseModel):
+    """Mint queue depth and counts by status"""
+    queued: int
+    in_flight_batches: int
+    by_status: Dict[str, int]
+    mode: str
+
+
+@router.get(
+    "/conviction/{user_id}",
+    response_model=ConvictionExportResponse,
+    response_model_exclude_none=True,
+)
 async def export_conviction_data(user_id: str) -> dict:
     """
     Export conviction data for a user
 
     Used by Convicta to pull African superfan metrics.
     """
-    actions = demo_actions.get(user_id, [])
-    score = calculate_conviction_score(actions)
-
-    export_data = export_to_convicta(user_id, score)
+    export_data = await score_for_export(user_id)
 
     return {
         "export_format": "convicta_v1",
@@ -60,7 +209,11 @@ async def export_conviction_data(user_id: str) -> dict:
     }
 
 
-@router.post("/conviction/{user_id}/push")
+@router.post(
+    "/conviction/{user_id}/push",
+    response_model=PushResponse,
+    response_model_exclude_none=True,
+)
 async def push_to_convicta(
     user_id: str,
     request: ExportRequest,
@@ -68,65 +221,86 @@ async def push_to_convicta(
     """
     Push conviction data to Convicta webhook
 
-    Triggers real-time update of user's Impact Power in Convicta.
+    Triggers real-time update of user's Impact Power in Convicta. The record
+    is written to a durable outbox first, so it survives restarts and
+    Convicta outages.
     """
-    actions = demo_actions.get(user_id, [])
-    score = calculate_conviction_score(actions)
-    export_data = export_to_convicta(user_id, score)
+    export_data = await score_for_export(user_id)
 
     # Add Convicta user ID mapping if provided
     if request.convicta_user_id:
         export_data["convicta_user_id"] = request.convicta_user_id
 
-    # Push to Convicta webhook
-    if settings.CONVICTA_API_URL and settings.CONVICTA_API_KEY:
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{settings.CONVICTA_API_URL}/api/v1/webhooks/palmlion/conviction",
-                    json=export_data,
-                    headers={
-                        "X-Webhook-Signature": settings.CONVICTA_WEBHOOK_SECRET,
-                        "Content-Type": "application/json",
-                    },
-                    timeout=30.0,
-                )
-
-                return {
-                    "pushed": True,
-                    "convicta_response": response.status_code,
-                    "data": export_data,
-                }
-        except Exception as e:
-            return {
-                "pushed": False,
-                "error": str(e),
-                "data": export_data,
-            }
-
-    # Demo mode - no actual push
+    # Durably queue for the background pusher instead of posting inline
+    outbox_id = await asyncio.to_thread(convicta_outbox.append, export_data)
+    convicta_pusher.notify()
+
     return {
-        "pushed": False,
-        "mode": "demo",
-        "message": "CONVICTA_API_URL not configured",
+        "queued": True,
+        "outbox_id": outbox_id,
+        "mode": "live" if convicta_pusher.enabled else "demo",
         "data": export_data,
     }
 
 
-@router.post("/batch")
+@router.post("/batch/columnar")
+async def batch_export_columnar(request: BatchExportRequest) -> Response:
+    """
+    Batch export as a compact PLCX columnar snapshot
+
+    Tiers, consistency ratings and platform names are dictionary-encoded
+    and numeric fields are packed arrays; see app.core.export for the
+    layout. Intended for full-population snapshots; the JSON endpoints
+    remain available.
+    """
+    scores = await action_store.score_many(request.user_ids)
+    rows = [(user_id, scores[user_id]) for user_id in request.user_ids]
+    return Response(
+        content=encode_columnar(rows),
+        media_type=COLUMNAR_MEDIA_TYPE,
+        headers={"X-Batch-Size": str(len(rows))},
+    )
+
+
+@router.post("/batch/push", response_model=BatchPushResponse)
+async def batch_push_to_convicta(request: BatchExportRequest) -> dict:
+    """
+    Queue conviction data for many users to the Convicta webhook
+
+    Records are appended to the outbox in chunks and delivered in batches.
+    """
+    queued = 0
+    async for chunk in iter_export_chunks(
+        request.user_ids,
+        action_store.score_many,
+        settings.EXPORT_STREAM_CHUNK_SIZE,
+    ):
+        await asyncio.to_thread(convicta_outbox.append_many, chunk)
+        queued += len(chunk)
+    convicta_pusher.notify()
+
+    return {
+        "queued": queued,
+        "mode": "live" if convicta_pusher.enabled else "demo",
+    }
+
+
+@router.get("/outbox", response_model=OutboxStatusResponse)
+async def get_outbox_status() -> dict:
+    """Convicta outbox backlog and delivery statistics"""
+    return convicta_pusher.stats()
+
+
+@router.post("/batch", response_model=BatchExportResponse, response_model_exclude_none=True)
 async def batch_export(request: BatchExportRequest) -> dict:
     """
     Batch export conviction data for multiple users
 
     Used for periodic sync with Convicta.
     """
-    exports = []
-
-    for user_id in request.user_ids:
-        actions = demo_actions.get(user_id, [])
-        score = calculate_conviction_score(actions)
-        export_data = export_to_convicta(user_id, score)
-        exports.append(export_data)
+    scores = await action_store.score_many(request.user_ids)
+    exports = [export_to_convicta(user_id, scores[user_id]) for user_id in request.user_ids]
+    EXPORT_RECORDS.inc("json", amount=len(exports))
 
     return {
         "batch_size": len(exports),
@@ -135,36 +309,146 @@ async def batch_export(request: BatchExportRequest) -> dict:
     }
 
 
-@router.post("/trigger-mint/{user_id}")
+@router.post("/batch/stream")
+async def batch_export_stream(request: BatchExportRequest) -> StreamingResponse:
+    """
+    Stream batch export as NDJSON, one user per line
+
+    Scores users in chunks as the client reads, so memory stays flat
+    regardless of batch size. Preferred for full Convicta syncs.
+    """
+    return StreamingResponse(
+        stream_ndjson_exports(
+            request.user_ids,
+            action_store.score_many,
+            settings.EXPORT_STREAM_CHUNK_SIZE,
+        ),
+        media_type=NDJSON_MEDIA_TYPE,
+        headers={"X-Batch-Size": str(len(request.user_ids))},
+    )
+
+
+@router.get("/changes", response_model=ChangesResponse, response_model_exclude_none=True)
+async def export_changes_since(
+    since: int = Query(default=0, ge=0),
+    epoch: Optional[str] = None,
+    limit: int = Query(default=1000, ge=1, le=10_000),
+) -> dict:
+    """
+    Delta export for Convicta sync
+
+    Returns users whose conviction changed significantly after the `since`
+    cursor, as actions arrive. Pass the returned cursor and epoch on the
+    next call; keep paging while has_more is true. A 410 means the change
+    log was reset or rotated since the cursor was issued: run a full batch
+    export, then start again from since=0.
+    """
+    try:
+        records, cursor, has_more, epoch = await export_changes.changes_since(
+            since, limit, epoch
+        )
+    except ChangeCursorExpiredError as e:
+        raise HTTPException(status_code=410, detail=str(e))
+
+    return {
+        "export_format": "convicta_v1",
+        "changes": records,
+        "count": len(records),
+        "cursor": cursor,
+        "epoch": epoch,
+        "has_more": has_more,
+        "generated_at": datetime.utcnow().isoformat(),
+    }
+
+
+@router.get("/reach/{artist_name}", response_model=ReachExportResponse)
+async def export_artist_reach(
+    artist_name: str,
+    window: ReachWindow = "7d",
+    region: Optional[str] = None,
+) -> dict:
+    """
+    Export an artist's unique-fan reach
+
+    Used by Convicta to show labels how many distinct fans streamed,
+    shared or tipped in a region over the last 1, 7 or 30 days.
+    """
+    reach = await fan_reach.reach(artist_name, window, region)
+    return {
+        "export_format": "convicta_v1",
+        "data": {
+            "artist_name": reach["artist_name"],
+            "region": reach["region"],
+            "window": reach["window"],
+            "start_date": reach["start_date"],
+            "end_date": reach["end_date"],
+            "unique_fans": reach["unique_fans"],
+            "unique_fans_by_action": reach["by_action"],
+            "unique_fans_by_region": reach["by_region"],
+            "estimator": "hyperloglog",
+            "standard_error": reach["standard_error"],
+        },
+        "generated_at": datetime.utcnow().isoformat(),
+    }
+
+
+@router.post("/trigger-mint/{user_id}", response_model=MintTriggerResponse)
 async def trigger_issuance_mint(
     user_id: str,
-    artist_name: str,
     stake_percentage: float,
     wallet_address: str,
+    mission_id: str,
+    artist_name: Optional[str] = None,
 ) -> dict:
     """
     Trigger fractional IP mint via Issuance
 
-    Called when a user completes qualifying missions.
+    Called when a user completes qualifying missions; 409 until the user
+    has completed the mission. The stake is in the mission's artist; an
+    artist_name naming someone else is refused with 409. Idempotent per
+    (user, mission): repeated calls return the original mint, from any
+    worker.
     """
-    mint_trigger = {
-        "source": "palmlion",
-        "user_id": user_id,
-        "artist_name": artist_name,
-        "stake_percentage": stake_percentage,
-        "wallet_address": wallet_address,
-        "timestamp": datetime.utcnow().isoformat(),
-    }
+    mission = mission_catalog.get(mission_id)
+    if not mission:
+        raise HTTPException(status_code=404, detail="Mission not found")
+    progress = await progress_backend.get_user_progress(user_id, [mission_id])
+    if progress.get(mission_id, 0) < mission.threshold:
+        raise HTTPException(status_code=409, detail="Mission not completed")
+    if artist_name is not None and artist_name.strip().lower() != mission.artist_name.lower():
+        raise HTTPException(status_code=409, detail="Mission is for another artist")
 
-    # In production, would call Issuance API
-    # async with httpx.AsyncClient() as client:
-    #     response = await client.post(
-    #         f"{settings.ISSUANCE_API_URL}/api/v1/mint/fractional",
-    #         json=mint_trigger,
-    #     )
+    try:
+        mint, created = await mint_pipeline.trigger(
+            user_id=user_id,
+            artist_name=mission.artist_name,
+            completion_id=mission_id,
+            stake_percentage=stake_percentage,
+            wallet_address=wallet_address,
+        )
+    except MintQueueFullError:
+        raise HTTPException(status_code=503, detail="Mint queue is full, retry shortly")
 
     return {
-        "triggered": True,
-        "mint_request": mint_trigger,
-        "message": "Mint trigger sent to Issuance (demo mode)",
+        "triggered": created,
+        "duplicate": not created,
+        "mint_id": mint.mint_id,
+        "status": mint.status.value,
+        "mint_request": mint.to_issuance(),
+        "mode": "demo" if mint_pipeline.demo_mode else "live",
     }
+
+
+@router.get("/mint/{mint_id}", response_model=MintStatusResponse)
+async def get_mint_status(mint_id: str) -> dict:
+    """Get the status of a triggered mint"""
+    mint = await mint_pipeline.get(mint_id)
+    if not mint:
+        raise HTTPException(status_code=404, detail="Mint not found")
+    return mint.to_dict()
+
+
+@router.get("/mints", response_model=MintPipelineStatusResponse)
+async def get_mint_pipeline_status() -> dict:
+    """Mint queue depth and counts by status"""
+    return mint_pipeline.stats()
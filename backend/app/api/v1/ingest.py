@@ -0,0 +1,128 @@
+"""
+Palmlion Ingestion API
+Bulk partner events from Boomplay, Audiomack and other platform webhooks
+"""
+import asyncio
+import hmac
+from typing import Dict, Optional
+
+from fastapi import APIRouter, Header, HTTPException, Request
+from pydantic import BaseModel
+
+from app.core.config import settings
+from app.core.export import NDJSON_MEDIA_TYPE
+from app.core.ingest import (
+    EVENTS_MEDIA_TYPE,
+    IngestBackpressureError,
+    ingest_pipeline,
+    iter_binary_batches,
+    iter_ndjson_batches,
+)
+from app.core.state import USERS, state_backend
+
+router = APIRouter()
+
+
+class IngestResponse(BaseModel):
+    """Outcome of one bulk ingestion request; accepted events are durable"""
+    received: int
+    accepted: int
+    duplicates: int
+    rejected: Dict[str, int]
+    wal_offset: int
+
+
+class IngestStatusResponse(BaseModel):
+    """Write-ahead log and applier progress"""
+    running: bool
+    wal_bytes: int
+    applied_offset: int
+    pending_bytes: int
+    group_commits: int
+    batches: int
+    applied_events: int
+    apply_failures: int
+    apply_stalled: bool
+    wal_failed: bool
+    known_proofs: int
+
+
+def _authorize(authorization: Optional[str]) -> None:
+    """Partners send the ingestion key; without one configured only DEBUG accepts events"""
+    if not settings.INGEST_API_KEY:
+        if settings.DEBUG:
+            return  # demo mode
+        raise HTTPException(status_code=503, detail="Ingestion key is not configured")
+    expected = f"Bearer {settings.INGEST_API_KEY}"
+    if not authorization or not hmac.compare_digest(authorization, expected):
+        raise HTTPException(status_code=401, detail="Invalid ingestion key")
+
+
+@router.post("/events", response_model=IngestResponse)
+async def ingest_events(
+    request: Request,
+    authorization: Optional[str] = Header(default=None),
+) -> dict:
+    """
+    Ingest a stream of partner events
+
+    The body is NDJSON (application/x-ndjson, one event per line with
+    user_id, action_type, platform, timestamp, proof_hash and optionally
+    verified, artist_name and region) or concatenated PLEV batches
+    (application/vnd.palmlion.events, see app.core.ingest). Events are
+    validated and deduplicated on proof_hash in chunks as the body
+    arrives; the response is sent once every accepted event is in the
+    fsynced write-ahead log. A 503 with Retry-After means the log is
+    behind: resend the whole body, as events already taken now count as
+    duplicates.
+    """
+    _authorize(authorization)
+    media_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if media_type == EVENTS_MEDIA_TYPE:
+        batches = iter_binary_batches(request.stream())
+    elif media_type == NDJSON_MEDIA_TYPE:
+        batches = iter_ndjson_batches(request.stream(), settings.INGEST_CHUNK_EVENTS)
+    else:
+        raise HTTPException(
+            status_code=415, detail=f"Send {NDJSON_MEDIA_TYPE} or {EVENTS_MEDIA_TYPE}"
+        )
+
+    totals = {"received": 0, "accepted": 0, "duplicates": 0}
+    rejected: Dict[str, int] = {}
+    commits = []
+    try:
+        async for batch, received in batches:
+            totals["received"] += received
+            missing = batch.users_without_region()
+            if missing:
+                users = await state_backend.get_many(USERS, missing)
+                batch.fill_regions({u: doc.get("region") for u, doc in users.items()})
+            counts, commit = await ingest_pipeline.submit(batch)
+            for outcome, count in counts.items():
+                if outcome in totals:
+                    totals[outcome] += count
+                else:
+                    rejected[outcome] = rejected.get(outcome, 0) + count
+            if commit is not None:
+                commits.append(commit)
+        offsets = await asyncio.gather(*commits)
+    except ValueError as e:
+        await asyncio.gather(*commits, return_exceptions=True)
+        raise HTTPException(status_code=400, detail=str(e))
+    except IngestBackpressureError as e:
+        await asyncio.gather(*commits, return_exceptions=True)
+        raise HTTPException(
+            status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)}
+        )
+
+    return {
+        **totals,
+        "rejected": rejected,
+        "wal_offset": max(offsets, default=ingest_pipeline.stats()["wal_bytes"]),
+    }
+
+
+@router.get("/status", response_model=IngestStatusResponse)
+async def get_ingest_status() -> dict:
+    """Write-ahead log, group commit and applier statistics"""
+    return ingest_pipeline.stats()
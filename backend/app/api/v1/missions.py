@@ -2,13 +2,23 @@
 Palmlion Missions API
 #PalmDash missions for Telegram/WhatsApp
 """
+import hashlib
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import List, Optional
 from uuid import UUID, uuid4
 
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
+from app.core.cache import CachePolicy
+from app.core.config import settings
+from app.core.lifecycle import MISSION_COMPLETED, MISSION_EXPIRED, mission_lifecycle
+from app.core.missions import MissionCatalog, MissionSnapshot
+from app.core.progress import progress_backend
+from app.core.realtime import realtime_hub
+from app.core.state import USERS, state_backend
+from app.core.trending import trending_engine
+
 router = APIRouter()
 
 # Demo missions
@@ -57,8 +67,50 @@ demo_missions = {
     },
 }
 
-# User progress
-user_progress: dict = {}
+mission_catalog = MissionCatalog()
+
+# State backend namespace of claimed mission proofs
+PROOFS = "mission_proofs"
+
+# GET routes served by the response cache, relative to this router. The feed
+# carries per-user progress, so it is private and only briefly reused.
+CACHED_ROUTES = {
+    "": CachePolicy(
+        ttl=settings.CACHE_TTL_MISSIONS,
+        version=lambda: mission_catalog.version,
+        private=True,
+    ),
+}
+
+
+def register_mission(mission: dict) -> MissionSnapshot:
+    """Add a mission to the catalog and schedule its expiry"""
+    snapshot = mission_catalog.upsert(mission)
+    if mission_lifecycle.schedule_expiry(snapshot.id, snapshot.expires_at):
+        snapshot = mission_catalog.update(snapshot.id, status="expired")
+    return snapshot
+
+
+def on_lifecycle_event(event: str, mission_id: str, payload: dict) -> None:
+    """Apply lifecycle transitions to the catalog and notify subscribers"""
+    if event == MISSION_EXPIRED:
+        mission_catalog.update(mission_id, status="expired")
+        realtime_hub.publish(f"mission:{mission_id}", {"status": "expired"})
+    elif event == MISSION_COMPLETED:
+        realtime_hub.publish(f"user:{payload['user_id']}", {mission_id: {"status": "completed"}})
+
+
+mission_lifecycle.add_listener(on_lifecycle_event)
+
+for _mission in demo_missions.values():
+    register_mission(_mission)
+
+
+def progress_status(mission: MissionSnapshot, current: Optional[int]) -> str:
+    """User-facing status for a progress value; None means not started"""
+    if current is None:
+        return "available"
+    return "completed" if current >= mission.threshold else "in_progress"
 
 
 class MissionSubmission(BaseModel):
@@ -69,57 +121,130 @@ class MissionSubmission(BaseModel):
     platform_user_id: Optional[str] = None
 
 
-@router.get("")
+class MissionResponse(BaseModel):
+    """Mission with the requesting user's progress"""
+    id: str
+    title: str
+    description: str
+    artist_name: str
+    mission_type: str
+    platform: str
+    threshold: int
+    reward_conviction_points: int
+    reward_multiplier: float
+    expires_at: Optional[str] = None
+    status: str
+    participants: int
+    user_progress: int
+    user_status: str
+
+
+class MissionDetailResponse(MissionResponse):
+    """Mission details with completion percentage"""
+    percentage: float
+
+
+class MissionListResponse(BaseModel):
+    """Mission feed"""
+    missions: List[MissionResponse]
+    total: int
+    active: int
+
+
+class MissionReward(BaseModel):
+    """Reward granted by the completing submission"""
+    conviction_points: int
+    multiplier: float
+
+
+class SubmissionResponse(BaseModel):
+    """Result of a proof submission; reward fields only on completion"""
+    verified: bool
+    mission_id: str
+    increment: int
+    current_progress: int
+    threshold: int
+    percentage: float
+    completed: Optional[bool] = None
+    reward: Optional[MissionReward] = None
+    convicta_export: Optional[str] = None
+
+
+class MissionVerificationResponse(BaseModel):
+    """User verification status for a mission"""
+    mission_id: str
+    status: str
+    current_progress: int
+    threshold: int
+    verified: bool
+
+
+@router.get("", response_model=MissionListResponse)
 async def get_missions(
     user_id: str = "demo-user-1",
     platform: Optional[str] = None,
     mission_type: Optional[str] = None,
+    artist: Optional[str] = None,
+    status: Optional[str] = None,
 ) -> dict:
     """
     Get available #PalmDash missions
 
     Missions are distributed via Telegram and WhatsApp.
     """
-    missions = list(demo_missions.values())
+    view = mission_catalog.query(
+        platform=platform,
+        mission_type=mission_type,
+        artist_name=artist,
+        status=status,
+    )
 
-    if platform:
-        missions = [m for m in missions if m["platform"].lower() == platform.lower()]
-    if mission_type:
-        missions = [m for m in missions if m["mission_type"].lower() == mission_type.lower()]
-
-    # Add user progress
-    for mission in missions:
-        progress_key = f"{user_id}:{mission['id']}"
-        progress = user_progress.get(progress_key, {"current": 0, "status": "available"})
-        mission["user_progress"] = progress["current"]
-        mission["user_status"] = progress["status"]
+    # Join user progress onto per-request copies, never the shared snapshots
+    mission_ids = [m.id for m in view.missions]
+    progress_by_mission = await progress_backend.get_user_progress(user_id, mission_ids)
+    participants = await progress_backend.get_participants(mission_ids)
+    missions = []
+    for mission in view.missions:
+        current = progress_by_mission.get(mission.id)
+        missions.append({
+            **mission.payload,
+            "participants": mission.participants + participants.get(mission.id, 0),
+            "user_progress": current or 0,
+            "user_status": progress_status(mission, current),
+        })
 
     return {
         "missions": missions,
         "total": len(missions),
-        "active": len([m for m in missions if m["status"] == "active"]),
+        "active": view.active,
     }
 
 
-@router.get("/{mission_id}")
+@router.get("/{mission_id}", response_model=MissionDetailResponse)
 async def get_mission(mission_id: str, user_id: str = "demo-user-1") -> dict:
     """Get mission details with user progress"""
-    mission = demo_missions.get(mission_id)
+    mission = mission_catalog.get(mission_id)
     if not mission:
         raise HTTPException(status_code=404, detail="Mission not found")
 
-    progress_key = f"{user_id}:{mission_id}"
-    progress = user_progress.get(progress_key, {"current": 0, "status": "available"})
+    progress = await progress_backend.get_user_progress(user_id, [mission_id])
+    participants = await progress_backend.get_participants([mission_id])
+    current = progress.get(mission_id)
 
     return {
-        **mission,
-        "user_progress": progress["current"],
-        "user_status": progress["status"],
-        "percentage": (progress["current"] / mission["threshold"]) * 100,
+        **mission.payload,
+        "participants": mission.participants + participants.get(mission_id, 0),
+        "user_progress": current or 0,
+        "user_status": progress_status(mission, current),
+        "percentage": ((current or 0) / mission.threshold) * 100,
     }
 
 
-@router.post("/{mission_id}/submit")
+@router.post(
+    "/{mission_id}/submit",
+    response_model=SubmissionResponse,
+    response_model_exclude_none=True,
+)
 async def submit_mission_proof(
     mission_id: str,
     submission: MissionSubmission,
@@ -132,63 +257,106 @@ async def submit_mission_proof(
     - screenshot: Screenshot of completed action
     - link: Shareable link verification
     - api_verification: Automatic via platform API
+
+    A proof that was already counted is refused with 409. Links are
+    public, so each fan may submit the same link once per mission; any
+    other proof counts once, across users and missions.
     """
-    mission = demo_missions.get(mission_id)
+    mission = mission_catalog.get(mission_id)
     if not mission:
         raise HTTPException(status_code=404, detail="Mission not found")
 
-    progress_key = f"{user_id}:{mission_id}"
+    # Progress is frozen once the lifecycle scheduler expires a mission
+    if mission.status != "active":
+        raise HTTPException(status_code=409, detail=f"Mission is {mission.status}")
 
-    # Initialize progress if not exists
-    if progress_key not in user_progress:
-        user_progress[progress_key] = {"current": 0, "status": "in_progress"}
-
-    progress = user_progress[progress_key]
+    # A public link counts once per user and mission; any other proof (a
+    # screenshot, a transaction or membership id) counts once, for whoever
+    # submits it first. Claims live in the shared state backend rather
+    # than the on-disk proof index, which only the ingest process may use.
+    proof = f"{submission.proof_type}:{submission.proof_data}"
+    proof_key = hashlib.sha256(proof.encode()).hexdigest()[:32]
+    if submission.proof_type == "link":
+        proof_key = f"{mission_id}:{user_id}:{proof_key}"
+    claimed = await state_backend.set_if_absent(
+        PROOFS,
+        proof_key,
+        {"submitted_at": datetime.utcnow().isoformat()},
+        ttl=settings.CONVICTION_LOOKBACK_DAYS * 86400,
+    )
+    if not claimed:
+        raise HTTPException(status_code=409, detail="Proof already submitted")
 
     # Simulate verification (in production, would verify via APIs)
     import random
     increment = random.randint(1, 3)
-    progress["current"] = min(progress["current"] + increment, mission["threshold"])
+
+    # Add, clamp and detect completion atomically in the progress backend
+    try:
+        update = await progress_backend.increment(
+            user_id, mission_id, increment, mission.threshold
+        )
+    except BaseException:
+        await state_backend.delete(PROOFS, proof_key)
+        raise
+    if update.started:
+        await progress_backend.add_participant(mission_id)
+
+    region = ((await state_backend.get(USERS, user_id)) or {}).get("region")
+    trending_engine.record_mission(region, mission_id, mission.artist_name)
+
+    status = progress_status(mission, update.current)
+    realtime_hub.publish(
+        f"user:{user_id}", {mission_id: {"progress": update.current, "status": status}}
+    )
+    if update.started and realtime_hub.has_subscribers(f"mission:{mission_id}"):
+        participants = await progress_backend.get_participants([mission_id])
+        realtime_hub.publish(
+            f"mission:{mission_id}",
+            {"participants": mission.participants + participants.get(mission_id, 0)},
+        )
 
     result = {
         "verified": True,
         "mission_id": mission_id,
-        "increment": increment,
-        "current_progress": progress["current"],
-        "threshold": mission["threshold"],
-        "percentage": (progress["current"] / mission["threshold"]) * 100,
+        "increment": update.applied,
+        "current_progress": update.current,
+        "threshold": mission.threshold,
+        "percentage": (update.current / mission.threshold) * 100,
     }
 
-    # Check completion
-    if progress["current"] >= mission["threshold"]:
-        progress["status"] = "completed"
+    # Rewards are granted once, by the submission that completed the mission
+    if update.completed:
         result["completed"] = True
+    if update.just_completed:
+        mission_lifecycle.emit(MISSION_COMPLETED, mission_id, {"user_id": user_id})
         result["reward"] = {
-            "conviction_points": mission["reward_conviction_points"],
-            "multiplier": mission["reward_multiplier"],
+            "conviction_points": mission.reward_conviction_points,
+            "multiplier": mission.reward_multiplier,
         }
         result["convicta_export"] = "Conviction data will be exported to Convicta"
 
     return result
 
 
-@router.get("/{mission_id}/verify")
+@router.get("/{mission_id}/verify", response_model=MissionVerificationResponse)
 async def check_verification_status(
     mission_id: str,
     user_id: str = "demo-user-1",
 ) -> dict:
     """Check verification status for a mission"""
-    mission = demo_missions.get(mission_id)
+    mission = mission_catalog.get(mission_id)
     if not mission:
         raise HTTPException(status_code=404, detail="Mission not found")
 
-    progress_key = f"{user_id}:{mission_id}"
-    progress = user_progress.get(progress_key, {"current": 0, "status": "available"})
+    progress = await progress_backend.get_user_progress(user_id, [mission_id])
+    current = progress.get(mission_id)
+    status = progress_status(mission, current)
 
     return {
         "mission_id": mission_id,
-        "status": progress["status"],
-        "current_progress": progress["current"],
-        "threshold": mission["threshold"],
-        "verified": progress["status"] == "completed",
+        "status": status,
+        "current_progress": current or 0,
+        "threshold": mission.threshold,
+        "verified": status == "completed",
     }
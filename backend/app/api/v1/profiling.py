@@ -0,0 +1,79 @@
+"""
+Palmlion Profiling API
+Start time-window profiles and fetch request profiles as collapsed stacks or speedscope JSON
+"""
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field
+
+from app.core.config import settings
+from app.core.profiling import profiler, verify_profile_token
+
+router = APIRouter()
+
+
+class WindowRequest(BaseModel):
+    """Profile every thread on this worker for a fixed window"""
+    seconds: float = Field(default=10.0, gt=0)
+    interval_ms: Optional[float] = Field(default=None, gt=0)
+    label: str = "window"
+
+
+def require_token(token: Optional[str]) -> None:
+    """Profiling endpoints take the same signed token as the profile header"""
+    if not settings.profiling_allowed:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    if not verify_profile_token(settings.SECRET_KEY, token):
+        raise HTTPException(status_code=403, detail="Invalid or expired profile token")
+
+
+@router.post("/window")
+async def start_window(
+    request: WindowRequest,
+    x_palmlion_profile: Optional[str] = Header(default=None),
+) -> dict:
+    """
+    Sample all threads for `seconds` (capped by PROFILING_MAX_SECONDS)
+
+    Spans from every request handled during the window are recorded too.
+    """
+    require_token(x_palmlion_profile)
+    profile = profiler.start(
+        request.label,
+        seconds=request.seconds,
+        interval=request.interval_ms / 1000 if request.interval_ms else None,
+    )
+    return {"profile_id": profile.id, "seconds": min(request.seconds, profiler.max_seconds)}
+
+
+@router.get("")
+async def list_profiles(x_palmlion_profile: Optional[str] = Header(default=None)) -> dict:
+    """Running and recently finished profiles, newest first"""
+    require_token(x_palmlion_profile)
+    return {"profiles": profiler.summaries()}
+
+
+@router.get("/{profile_id}")
+async def get_profile(
+    profile_id: str,
+    format: str = Query(default="speedscope", pattern="^(speedscope|collapsed|summary)$"),
+    x_palmlion_profile: Optional[str] = Header(default=None),
+):
+    """
+    Fetch a profile
+
+    speedscope: open at https://www.speedscope.app
+    collapsed: feed to flamegraph.pl or similar
+    """
+    require_token(x_palmlion_profile)
+    profile = profiler.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+
+    if format == "collapsed":
+        return PlainTextResponse(profile.to_collapsed())
+    if format == "summary":
+        return profile.summary()
+    return profile.to_speedscope()
@@ -0,0 +1,48 @@
+"""
+Palmlion Realtime API
+WebSocket subscriptions for leaderboards, missions and user progress
+"""
+from typing import Optional
+
+from fastapi import APIRouter, WebSocket
+
+from app.core.config import settings
+from app.core.realtime import realtime_hub
+from app.core.security import verify_access_token
+
+router = APIRouter()
+
+
+# Policy violation: the access token was rejected
+CLOSE_POLICY_VIOLATION = 1008
+
+
+@router.websocket("/ws")
+async def realtime_socket(websocket: WebSocket, token: Optional[str] = None):
+    """
+    Live updates instead of polling /missions and /conviction/leaderboard
+
+    Send {"action": "subscribe", "topics": [...]} with topics such as
+    "leaderboard:lagos", "mission:mission-1" or "user:{user_id}".
+    Updates arrive as {"type": "update", "topic", "seq", "data"} where
+    data holds only the fields that changed since the last update;
+    leaderboard topics send the current top fans as "top", by display
+    name and rank.
+    User topics need ?token= with the access_token from registration,
+    and only the token's own user topic is accepted. Tokens are refused
+    outright while JWT_SECRET_KEY is the default.
+    """
+    user_id = None
+    if token is not None:
+        if settings.access_tokens_allowed:
+            user_id = verify_access_token(settings.JWT_SECRET_KEY, token)
+        if user_id is None:
+            await websocket.close(code=CLOSE_POLICY_VIOLATION)
+            return
+    await realtime_hub.serve(websocket, user_id)
+
+
+@router.get("/stats")
+async def realtime_stats() -> dict:
+    """Connection and fan-out statistics for this node"""
+    return realtime_hub.stats()
@@ -1,14 +1,56 @@
 """
 Palmlion API v1 Router
 """
+import importlib
+from typing import Dict, Iterable, List, Optional
+
 from fastapi import APIRouter
 
-from app.api.v1 import auth, conviction, missions, verification, export
+from app.core.cache import CachePolicy
+
+# name -> (module, prefix, tags); modules are only imported when mounted
+ROUTERS = {
+    "auth": ("app.api.v1.auth", "/auth", ["Authentication"]),
+    "conviction": ("app.api.v1.conviction", "/conviction", ["Conviction"]),
+    "missions": ("app.api.v1.missions", "/missions", ["Missions"]),
+    "verification": ("app.api.v1.verification", "/verify", ["Verification"]),
+    "export": ("app.api.v1.export", "/export", ["Export"]),
+    "analytics": ("app.api.v1.analytics", "/analytics", ["Analytics"]),
+    "trending": ("app.api.v1.trending", "/trending", ["Trending"]),
+    "ingest": ("app.api.v1.ingest", "/ingest", ["Ingestion"]),
+    "realtime": ("app.api.v1.realtime", "/realtime", ["Realtime"]),
+    "profiling": ("app.api.v1.profiling", "/admin/profiling", ["Admin"]),
+}
+
+
+def _resolve(enabled: Optional[Iterable[str]]) -> List[str]:
+    names = list(enabled or ROUTERS)
+    unknown = [name for name in names if name not in ROUTERS]
+    if unknown:
+        raise ValueError(f"Unknown routers: {', '.join(unknown)}")
+    return names
+
+
+def build_api_router(enabled: Optional[Iterable[str]] = None) -> APIRouter:
+    """Mount the named routers, or all of them when enabled is empty"""
+    names = _resolve(enabled)
+    api_router = APIRouter()
+    for name in names:
+        module, prefix, tags = ROUTERS[name]
+        router = importlib.import_module(module).router
+        api_router.include_router(router, prefix=prefix, tags=tags)
+    return api_router
 
-api_router = APIRouter()
 
-api_router.include_router(auth.router, prefix="/auth", tags=["Authentication"])
-api_router.include_router(conviction.router, prefix="/conviction", tags=["Conviction"])
-api_router.include_router(missions.router, prefix="/missions", tags=["Missions"])
-api_router.include_router(verification.router, prefix="/verify", tags=["Verification"])
-api_router.include_router(export.router, prefix="/export", tags=["Export"])
+def cache_policies(
+    enabled: Optional[Iterable[str]] = None,
+    prefix: str = "",
+) -> Dict[str, CachePolicy]:
+    """Full path -> CachePolicy for the CACHED_ROUTES of every mounted router"""
+    policies = {}
+    for name in _resolve(enabled):
+        module, router_prefix, _ = ROUTERS[name]
+        cached = getattr(importlib.import_module(module), "CACHED_ROUTES", {})
+        for path, policy in cached.items():
+            policies[prefix + router_prefix + path] = policy
+    return policies
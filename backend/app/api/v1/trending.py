@@ -0,0 +1,76 @@
+"""
+Palmlion Trending API
+Rising artists, tracks and missions per city, from streaming sketches
+"""
+from datetime import datetime
+from typing import List, Literal
+
+from fastapi import APIRouter, Query
+from pydantic import BaseModel
+
+from app.core.analytics import ALL_REGIONS
+from app.core.config import settings
+from app.core.trending import trending_engine
+
+router = APIRouter()
+
+Kind = Literal["artist", "track", "mission"]
+
+
+class TrendingItem(BaseModel):
+    """One trending artist, track or mission"""
+    rank: int
+    name: str
+    recent_count: int
+    baseline_count: int
+    expected_count: float
+    score: float
+
+
+class TrendingResponse(BaseModel):
+    """Fastest-rising items in a region"""
+    region: str
+    kind: str
+    window_seconds: float
+    baseline_seconds: float
+    items: List[TrendingItem]
+    generated_at: str
+
+
+def _trending(region: str, kind: str, limit: int) -> dict:
+    return {
+        "region": region.strip().lower() or ALL_REGIONS,
+        "kind": kind,
+        "window_seconds": settings.TRENDING_WINDOW_SECONDS,
+        "baseline_seconds": settings.TRENDING_BASELINE_SECONDS,
+        "items": [
+            {"rank": rank, **item}
+            for rank, item in enumerate(trending_engine.top(region, kind, limit), start=1)
+        ],
+        "generated_at": datetime.utcnow().isoformat(),
+    }
+
+
+@router.get("", response_model=TrendingResponse)
+async def get_trending(
+    kind: Kind = "artist",
+    limit: int = Query(default=10, le=50),
+) -> dict:
+    """
+    Get what is trending across every region
+
+    Counts in the trending window are Count-Min estimates, compared with
+    the rate over the baseline window; score is the excess in standard
+    deviations, so a spike ranks above a steady favourite.
+    """
+    return _trending(ALL_REGIONS, kind, limit)
+
+
+@router.get("/{region}", response_model=TrendingResponse)
+async def get_region_trending(
+    region: str,
+    kind: Kind = "artist",
+    limit: int = Query(default=10, le=50),
+) -> dict:
+    """Get what is trending in one city"""
+    return _trending(region, kind, limit)
@@ -3,15 +3,17 @@ Palmlion Verification API
 Link and verify streaming accounts
 """
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
+from app.core.state import state_backend
+
 router = APIRouter()
 
-# Linked accounts store
-linked_accounts: dict = {}
+# Linked accounts, keyed "{user_id}:{platform}"
+LINKED_ACCOUNTS = "linked_accounts"
 
 
 class LinkBoomplayRequest(BaseModel):
@@ -33,7 +35,47 @@ class VerifyStreamRequest(BaseModel):
     min_plays: int
 
 
-@router.post("/boomplay")
+class LinkAccountResponse(BaseModel):
+    """Linked account confirmation"""
+    linked: bool
+    platform: str
+    platform_user_id: str
+    message: str
+
+
+class LinkedAccount(BaseModel):
+    """Link status for one platform"""
+    platform: str
+    linked: bool
+    verified: bool
+    linked_at: Optional[str] = None
+
+
+class AccountStatusResponse(BaseModel):
+    """Link status across platforms"""
+    user_id: str
+    accounts: List[LinkedAccount]
+    total_linked: int
+
+
+class StreamVerificationResponse(BaseModel):
+    """Stream count verification result"""
+    verified: bool
+    platform: str
+    track_id: str
+    play_count: int
+    required: int
+    verified_at: Optional[str] = None
+
+
+class OAuthURLResponse(BaseModel):
+    """OAuth authorization URL for account linking"""
+    platform: str
+    oauth_url: str
+    redirect_uri: str
+
+
+@router.post("/boomplay", response_model=LinkAccountResponse)
 async def link_boomplay(
     data: LinkBoomplayRequest,
     user_id: str = "demo-user-1",
@@ -46,12 +88,12 @@ async def link_boomplay(
     account_key = f"{user_id}:boomplay"
 
     # In production, would validate via Boomplay OAuth
-    linked_accounts[account_key] = {
+    await state_backend.set(LINKED_ACCOUNTS, account_key, {
         "platform": "boomplay",
         "platform_user_id": data.boomplay_user_id,
         "verified": True,
         "linked_at": datetime.utcnow().isoformat(),
-    }
+    })
 
     return {
         "linked": True,
@@ -61,7 +103,7 @@ async def link_boomplay(
     }
 
 
-@router.post("/audiomack")
+@router.post("/audiomack", response_model=LinkAccountResponse)
 async def link_audiomack(
     data: LinkAudiomackRequest,
     user_id: str = "demo-user-1",
@@ -73,12 +115,12 @@ async def link_audiomack(
     """
     account_key = f"{user_id}:audiomack"
 
-    linked_accounts[account_key] = {
+    await state_backend.set(LINKED_ACCOUNTS, account_key, {
         "platform": "audiomack",
         "platform_user_id": data.audiomack_url_slug,
         "verified": True,
         "linked_at": datetime.utcnow().isoformat(),
-    }
+    })
 
     return {
         "linked": True,
@@ -88,15 +130,15 @@ async def link_audiomack(
     }
 
 
-@router.get("/status")
+@router.get("/status", response_model=AccountStatusResponse)
 async def get_verification_status(user_id: str = "demo-user-1") -> dict:
     """Get all linked account statuses"""
     platforms = ["boomplay", "audiomack", "mtn_music", "telegram", "whatsapp"]
     statuses = []
+    accounts = await state_backend.get_many(LINKED_ACCOUNTS, [f"{user_id}:{p}" for p in platforms])
 
     for platform in platforms:
-        account_key = f"{user_id}:{platform}"
-        account = linked_accounts.get(account_key)
+        account = accounts.get(f"{user_id}:{platform}")
 
         statuses.append({
             "platform": platform,
@@ -112,7 +154,7 @@ async def get_verification_status(user_id: str = "demo-user-1") -> dict:
     }
 
 
-@router.post("/streams")
+@router.post("/streams", response_model=StreamVerificationResponse)
 async def verify_streams(
     data: VerifyStreamRequest,
     user_id: str = "demo-user-1",
@@ -123,7 +165,7 @@ async def verify_streams(
     Used for mission verification.
     """
     account_key = f"{user_id}:{data.platform}"
-    account = linked_accounts.get(account_key)
+    account = await state_backend.get(LINKED_ACCOUNTS, account_key)
 
     if not account:
         raise HTTPException(
@@ -146,7 +188,7 @@ async def verify_streams(
     }
 
 
-@router.get("/oauth/{platform}")
+@router.get("/oauth/{platform}", response_model=OAuthURLResponse)
 async def get_oauth_url(
     platform: str,
     redirect_uri: str = "https://palmlion.ai/callback",
@@ -0,0 +1,317 @@
+"""
+Palmlion Action Store
+Verified conviction actions per user, in the shared state backend or the segment log
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence
+from uuid import uuid4
+
+from app.core.analytics import HORIZON, RegionalAnalytics, regional_analytics
+from app.core.artists import ArtistConvictionMatrix, artist_matrix
+from app.core.changes import ChangeTracker, export_changes
+from app.core.config import settings
+from app.core.conviction import (
+    ActionType,
+    ConvictionAction,
+    ConvictionScore,
+    Platform,
+    calculate_conviction_score,
+    determine_conviction_tier,
+    export_to_convicta,
+)
+from app.core.leaderboard import Leaderboard, leaderboard
+from app.core.reach import FanReach, fan_reach
+from app.core.segments import DAY_US, EPOCH, ActionLog, action_log, record_weights
+from app.core.state import USERS, StateBackend, state_backend
+from app.core.trending import TrendingEngine, trending_engine
+
+ACTIONS = "actions"
+SEEDS = "seeds"
+
+# Broadcast channel carrying appends and scores to the other workers' rollups
+ROLLUPS = "rollups"
+
+# Users read per backend round trip while restoring
+RESTORE_BATCH = 1000
+
+logger = logging.getLogger("palmlion.actions")
+
+
+class ActionStore:
+    """
+    Append-only action lists keyed by user id
+
+    get_many() fetches a whole batch of users in one backend round trip,
+    which is what the export endpoints score from. Appends are counted
+    towards the regional analytics rollups and trending sketches and,
+    when tagged with an artist, the artist conviction matrix and the
+    unique-fan reach sketches. The user is then re-scored: the new score
+    moves their tier and histogram entry in the regional rollups and their
+    leaderboard rank, which is pushed to subscribers, and a significant
+    move goes into the export change log.
+
+    With a segment log (ACTION_STORE=segments) actions are kept there
+    instead, and score()/score_many() read the user's records straight
+    from the mapped partitions rather than rebuilding action objects.
+
+    The regional rollups and the artist matrix live in each process, so
+    restore() rebuilds them (and re-ranks every fan, whose scores decayed while down) from
+    the stored actions on start. With a shared backend, every rescore()
+    also broadcasts the appends and scores since the last one, and start()
+    listens for the other workers' so each worker's rollups cover them all.
+    """
+
+    def __init__(
+        self,
+        backend: StateBackend,
+        analytics: RegionalAnalytics,
+        artists: ArtistConvictionMatrix,
+        trending: TrendingEngine,
+        reach: FanReach,
+        changes: ChangeTracker,
+        leaderboard: Leaderboard,
+        log: Optional[ActionLog] = None,
+    ):
+        self.backend = backend
+        self.analytics = analytics
+        self.artists = artists
+        self.trending = trending
+        self.reach = reach
+        self.changes = changes
+        self.leaderboard = leaderboard
+        self.log = log
+        self.node_id = uuid4().hex
+        self._unshared: List[list] = []
+        self._listener: Optional[asyncio.Task] = None
+
+    def open(self) -> None:
+        if self.log is not None:
+            self.log.open()
+
+    def close(self) -> None:
+        if self.log is not None:
+            self.log.close()
+
+    async def start(self) -> None:
+        if self.backend.shared and self._listener is None:
+            self._listener = asyncio.create_task(self._listen_loop())
+
+    async def stop(self) -> None:
+        if self._listener is None:
+            return
+        self._listener.cancel()
+        try:
+            await self._listener
+        except asyncio.CancelledError:
+            pass
+        self._listener = None
+
+    @property
+    def durable(self) -> bool:
+        """Whether appended actions outlive the process once sync() returns"""
+        return self.log is not None or self.backend.durable
+
+    def sync(self) -> None:
+        """Make appended actions durable; blocking, so callers run it in a thread"""
+        if self.log is not None:
+            self.log.sync()
+
+    async def get(self, user_id: str) -> List[ConvictionAction]:
+        if self.log is not None:
+            return self.log.actions(user_id)
+        actions = await self.backend.get_list(ACTIONS, user_id)
+        return [ConvictionAction.from_dict(a) for a in actions]
+
+    async def get_many(self, user_ids: Sequence[str]) -> Dict[str, List[ConvictionAction]]:
+        if self.log is not None:
+            return {user_id: self.log.actions(user_id) for user_id in dict.fromkeys(user_ids)}
+        lists = await self.backend.get_lists(ACTIONS, list(dict.fromkeys(user_ids)))
+        return {
+            user_id: [ConvictionAction.from_dict(a) for a in actions]
+            for user_id, actions in lists.items()
+        }
+
+    async def append(
+        self,
+        user_id: str,
+        actions: Sequence[ConvictionAction],
+        region: Optional[str] = None,
+        rescore: bool = True,
+    ) -> int:
+        """
+        Store actions, counting them towards the rollups of the fan's region
+
+        Pass rescore=False when appending for many users at once and call
+        rescore() for all of them afterwards, with the region of each.
+        """
+        if self.log is not None:
+            self.log.append(user_id, actions)
+            length = self.log.count(user_id)
+        else:
+            length = await self.backend.append(ACTIONS, user_id, [a.to_dict() for a in actions])
+        self.analytics.record_actions(user_id, region, actions)
+        self.artists.add(user_id, actions)
+        self.trending.record_actions(region, actions)
+        await self.reach.record_actions(user_id, region, actions)
+        if self.backend.shared:
+            self._unshared.append([user_id, region, [a.to_dict() for a in actions]])
+        if rescore:
+            await self.rescore({user_id: region})
+        return length
+
+    async def rescore(self, regions: Dict[str, Optional[str]]) -> None:
+        """
+        Score users whose actions changed, given as user id -> region
+
+        Updates the regional score distribution and the leaderboards, and
+        logs significant moves for delta syncs.
+        """
+        scores = await self.score_many(list(regions))
+        for user_id, score in scores.items():
+            self.analytics.record_score(user_id, regions[user_id], score.score, score.tier)
+        if self.backend.shared:
+            actions, self._unshared = self._unshared, []
+            await self.backend.broadcast(ROLLUPS, {
+                "node": self.node_id,
+                "actions": actions,
+                "scores": [
+                    [user_id, regions[user_id], score.score, score.tier]
+                    for user_id, score in scores.items()
+                ],
+            })
+        await self.leaderboard.update(scores, regions)
+        await self.changes.observe_many(
+            {user_id: export_to_convicta(user_id, score) for user_id, score in scores.items()}
+        )
+
+    async def _listen_loop(self) -> None:
+        while True:
+            try:
+                async for message in self.backend.listen(ROLLUPS):
+                    if message.get("node") != self.node_id:
+                        self._receive(message)
+            except Exception:
+                logger.exception("Rollups channel dropped, resubscribing")
+                await asyncio.sleep(1.0)
+
+    def _receive(self, message: dict) -> None:
+        """Another worker's appends and scores, counted as if they were made here"""
+        for user_id, region, actions in message.get("actions", ()):
+            actions = [ConvictionAction.from_dict(a) for a in actions]
+            self.analytics.record_actions(user_id, region, actions)
+            self.artists.add(user_id, actions)
+        for user_id, region, score, tier in message.get("scores", ()):
+            self.analytics.record_score(user_id, region, score, tier)
+
+    async def _regions(self, user_ids: Sequence[str]) -> Dict[str, Optional[str]]:
+        regions: Dict[str, Optional[str]] = {}
+        for start in range(0, len(user_ids), RESTORE_BATCH):
+            batch = user_ids[start:start + RESTORE_BATCH]
+            users = await self.backend.get_many(USERS, batch)
+            regions.update((user_id, (users.get(user_id) or {}).get("region")) for user_id in batch)
+        return regions
+
+    async def restore(self) -> None:
+        """
+        Rebuild the regional rollups from the stored actions and re-rank
+        every fan; run on start, before anything is appended
+        """
+        if self.log is not None:
+            await self._restore_log()
+            return
+        cutoff = datetime.utcnow() - timedelta(seconds=HORIZON)
+        user_ids = await self.backend.list_keys(ACTIONS)
+        for start in range(0, len(user_ids), RESTORE_BATCH):
+            batch = user_ids[start:start + RESTORE_BATCH]
+            regions = await self._regions(batch)
+            scores = {}
+            for user_id, actions in (await self.get_many(batch)).items():
+                region = regions[user_id]
+                recent = [a for a in actions if a.timestamp >= cutoff]
+                self.analytics.record_actions(user_id, region, recent)
+                self.artists.add(user_id, actions)
+                score = calculate_conviction_score(actions)
+                self.analytics.record_score(user_id, region, score.score, score.tier)
+                scores[user_id] = score.score
+            await self.leaderboard.rank(scores, regions)
+
+    async def _restore_log(self) -> None:
+        # One scan scores everyone; the rollups need only the last HORIZON and
+        # the artist matrix every live record
+        user_ids = self.log.user_ids()
+        regions = await self._regions(user_ids)
+        scores = dict.fromkeys(user_ids, 0.0)
+        scored, totals = self.log.score_all()
+        scores.update(zip(scored, totals.tolist()))
+        for user_id, score in scores.items():
+            # Every user in the log has had actions, so no score means dormant
+            tier = determine_conviction_tier(score) if score else "dormant"
+            self.analytics.record_score(user_id, regions[user_id], score, tier)
+        await self.leaderboard.rank(scores, regions)
+
+        records = self.log.since(0)
+        tagged = records[(records["verified"] != 0) & (records["artist"] != 0)]
+        self.artists.load(
+            user_ids,
+            self.log.artist_names(),
+            tagged["user"],
+            tagged["artist"] - 1,
+            tagged["timestamp"] // DAY_US,
+            record_weights(tagged),
+        )
+        since = int((datetime.utcnow() - EPOCH).total_seconds() - HORIZON) * 1_000_000
+        records = records[(records["verified"] != 0) & (records["timestamp"] >= since)]
+        self.analytics.load(
+            user_ids,
+            [regions[user_id] for user_id in user_ids],
+            records["user"],
+            records["timestamp"] / 1_000_000,
+            records["platform"],
+            records["action"],
+        )
+
+    async def score(self, user_id: str) -> ConvictionScore:
+        if self.log is not None:
+            return self.log.score(user_id)
+        return calculate_conviction_score(await self.get(user_id))
+
+    async def score_many(self, user_ids: Sequence[str]) -> Dict[str, ConvictionScore]:
+        """Scores for a batch of users, fetched in one round trip"""
+        if self.log is not None:
+            return {user_id: self.log.score(user_id) for user_id in dict.fromkeys(user_ids)}
+        lists = await self.get_many(user_ids)
+        return {user_id: calculate_conviction_score(actions) for user_id, actions in lists.items()}
+
+    async def seed_demo(self) -> None:
+        """Give demo-user-1 its sample history once per deployment, not once per worker"""
+        if self.log is not None and self.log.count("demo-user-1"):
+            return
+        if not await self.backend.set_if_absent(SEEDS, "demo-actions", {"seeded": True}):
+            return
+        now = datetime.utcnow()
+        actions = [
+            ConvictionAction(ActionType.STREAM, Platform.BOOMPLAY, now - timedelta(days=1), True),
+            ConvictionAction(ActionType.STREAM, Platform.BOOMPLAY, now - timedelta(days=1), True),
+            ConvictionAction(ActionType.STREAM, Platform.AUDIOMACK, now - timedelta(days=2), True),
+            ConvictionAction(ActionType.SHARE, Platform.TELEGRAM, now - timedelta(days=3), True),
+            ConvictionAction(ActionType.MISSION, Platform.TELEGRAM, now - timedelta(days=5), True),
+            ConvictionAction(ActionType.TIP, Platform.MTN_MUSIC, now - timedelta(days=7), True),
+        ]
+        artists = ["Burna Boy", "Burna Boy", "Tems", "Burna Boy", "Burna Boy", "Tems"]
+        for action, artist_name in zip(actions, artists):
+            action.artist_name = artist_name
+        await self.append("demo-user-1", actions)
+
+
+action_store = ActionStore(
+    state_backend,
+    regional_analytics,
+    artist_matrix,
+    trending_engine,
+    fan_reach,
+    export_changes,
+    leaderboard,
+    action_log if settings.ACTION_STORE == "segments" else None,
+)
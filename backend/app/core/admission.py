@@ -0,0 +1,250 @@
+"""
+Palmlion Admission Control
+Adaptive per-route-class concurrency limits and load shedding
+"""
+import asyncio
+import json
+import math
+import re
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Optional, Sequence, Tuple
+
+from app.core.config import settings
+from app.core.metrics import ADMISSION_LIMIT, ADMISSION_QUEUED, ADMISSION_SHED
+
+# Longest Retry-After we advertise, in seconds
+MAX_RETRY_AFTER = 30
+
+
+@dataclass(frozen=True)
+class RouteClass:
+    """Concurrency budget shared by a group of routes"""
+    name: str
+    initial_limit: int
+    max_limit: int
+    target_latency: float  # seconds; slower completions shrink the limit
+    max_queue: int
+    queue_timeout: float  # seconds a request may wait for a slot
+    min_limit: int = 1
+
+
+# (method or None for any, path regex relative to the API prefix, class name or None
+# to exempt). First match wins; paths outside the API prefix are never limited.
+ROUTE_RULES: Tuple[Tuple[Optional[str], str, Optional[str]], ...] = (
+    (None, r"/conviction/tiers", None),
+    (None, r"/admin/.*", None),
+    (None, r"/realtime/.*", None),
+    ("POST", r"/missions/[^/]+/submit", "writes"),
+    ("POST", r"/verify/.*", "writes"),
+    ("POST", r"/auth/.*", "writes"),
+    (None, r"/export/batch.*", "bulk"),
+    ("POST", r"/ingest/.*", "bulk"),
+    ("POST", r"/export/.*", "writes"),
+    (None, r".*", "reads"),
+)
+
+
+def default_route_classes() -> Sequence[RouteClass]:
+    timeout = settings.ADMISSION_QUEUE_TIMEOUT_MS / 1000
+    return (
+        RouteClass(
+            "writes",
+            initial_limit=32,
+            max_limit=settings.ADMISSION_WRITE_MAX_CONCURRENCY,
+            target_latency=0.25,
+            max_queue=settings.ADMISSION_WRITE_MAX_CONCURRENCY // 2,
+            queue_timeout=timeout,
+        ),
+        RouteClass(
+            "bulk",
+            initial_limit=4,
+            max_limit=settings.ADMISSION_BULK_MAX_CONCURRENCY,
+            target_latency=5.0,
+            max_queue=settings.ADMISSION_BULK_MAX_CONCURRENCY,
+            queue_timeout=timeout * 4,
+        ),
+        RouteClass(
+            "reads",
+            initial_limit=128,
+            max_limit=settings.ADMISSION_READ_MAX_CONCURRENCY,
+            target_latency=0.1,
+            max_queue=settings.ADMISSION_READ_MAX_CONCURRENCY // 2,
+            queue_timeout=timeout,
+        ),
+    )
+
+
+class OverloadedError(Exception):
+    """Raised when a request cannot be admitted"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    AIMD concurrency limiter with a bounded FIFO wait queue
+
+    Each completion at or under the target latency raises the limit by
+    1/limit, about +1 per limit's worth of requests, but only while the
+    limit is actually in use. A slower completion multiplies it by
+    `backoff`, at most once per target latency, so a burst of slow
+    responses counts as one congestion signal. Requests that find the
+    limit reached wait in the queue until their deadline; a full queue
+    or a missed deadline is shed.
+    """
+
+    def __init__(self, route_class: RouteClass, backoff: float = 0.9):
+        self.route_class = route_class
+        self.backoff = backoff
+        self.limit = float(route_class.initial_limit)
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._latency = route_class.target_latency
+        self._last_decrease = 0.0
+        ADMISSION_LIMIT.set(self.limit, route_class.name)
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        """Seconds until the current queue should have drained"""
+        drain = self._latency * (len(self._waiters) + 1) / max(self.limit, 1.0)
+        return min(MAX_RETRY_AFTER, max(1, math.ceil(drain)))
+
+    async def acquire(self) -> None:
+        """Wait for a slot or raise OverloadedError"""
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return
+        name = self.route_class.name
+        if len(self._waiters) >= self.route_class.max_queue:
+            raise OverloadedError("queue_full", self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        ADMISSION_QUEUED.set(len(self._waiters), name)
+        try:
+            await asyncio.wait_for(future, self.route_class.queue_timeout)
+        except asyncio.TimeoutError:
+            raise OverloadedError("queue_timeout", self.retry_after())
+        except asyncio.CancelledError:
+            # Client went away; hand back a slot granted in the meantime
+            if future.done() and not future.cancelled():
+                self.release(0.0)
+            raise
+        finally:
+            if not future.done() or future.cancelled():
+                try:
+                    self._waiters.remove(future)
+                except ValueError:
+                    pass
+            ADMISSION_QUEUED.set(len(self._waiters), name)
+
+    def release(self, latency: float) -> None:
+        """Return a slot and feed the request's latency into the limit"""
+        saturated = self.in_flight >= int(self.limit)
+        self.in_flight -= 1
+        self._latency += 0.2 * (latency - self._latency)
+
+        rc = self.route_class
+        now = time.monotonic()
+        if latency > rc.target_latency:
+            if now - self._last_decrease >= rc.target_latency:
+                self.limit = max(float(rc.min_limit), self.limit * self.backoff)
+                self._last_decrease = now
+        elif saturated:
+            self.limit = min(float(rc.max_limit), self.limit + 1 / self.limit)
+        ADMISSION_LIMIT.set(round(self.limit, 2), rc.name)
+
+        while self._waiters and self.in_flight < int(self.limit):
+            future = self._waiters.popleft()
+            if future.done():
+                continue
+            self.in_flight += 1
+            future.set_result(None)
+
+    def stats(self) -> dict:
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "latency_ms": round(self._latency * 1000, 3),
+        }
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware applying admission control before routing
+
+    Requests are classified by ROUTE_RULES. A shed request gets an
+    immediate 503 with Retry-After and never reaches the handler, so
+    saturated write paths cannot starve reads or the exempt routes.
+    Latency is measured from admission to the end of the response body.
+    """
+
+    def __init__(
+        self,
+        app,
+        prefix: str = "",
+        route_classes: Optional[Sequence[RouteClass]] = None,
+        rules: Sequence[Tuple[Optional[str], str, Optional[str]]] = ROUTE_RULES,
+    ):
+        self.app = app
+        self.prefix = prefix
+        self.controllers: Dict[str, AdmissionController] = {
+            rc.name: AdmissionController(rc) for rc in (route_classes or default_route_classes())
+        }
+        self.rules = [(method, re.compile(pattern), name) for method, pattern, name in rules]
+
+    def classify(self, method: str, path: str) -> Optional[AdmissionController]:
+        if not path.startswith(self.prefix):
+            return None
+        relative = path[len(self.prefix):]
+        for rule_method, pattern, name in self.rules:
+            if (rule_method is None or rule_method == method) and pattern.fullmatch(relative):
+                return self.controllers[name] if name is not None else None
+        return None
+
+    async def __call__(self, scope, receive, send):
+        controller = None
+        if scope["type"] == "http":
+            controller = self.classify(scope["method"], scope["path"])
+        if controller is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await controller.acquire()
+        except OverloadedError as e:
+            ADMISSION_SHED.inc(controller.route_class.name, e.reason)
+            await _shed(send, e.retry_after)
+            return
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            controller.release(time.perf_counter() - start)
+
+
+async def _shed(send, retry_after: int) -> None:
+    body = json.dumps({
+        "error": "Service overloaded",
+        "detail": "Too many requests in flight, retry shortly",
+    }).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 503,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(retry_after).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
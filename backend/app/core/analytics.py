@@ -0,0 +1,364 @@
+"""
+Palmlion Regional Analytics
+Incremental per-region rollups for city dashboards
+"""
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+from app.core.conviction import ActionType, ConvictionAction, Platform
+from app.core.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+# Window name -> (span in seconds, number of buckets)
+WINDOWS: Dict[str, Tuple[int, int]] = {
+    "1h": (3600, 60),
+    "24h": (86400, 96),
+    "7d": (7 * 86400, 168),
+}
+
+# Seconds of activity any window covers
+HORIZON = max(span for span, _ in WINDOWS.values())
+
+# Lower edges of the score histogram bins; the last bin is open-ended
+SCORE_BINS = (0, 10, 25, 50, 100, 250, 500, 1000)
+
+# Rollup across every region, including fans without one
+ALL_REGIONS = "all"
+
+FANS = "fans"
+ACTIONS = "actions"
+
+
+def _epoch(timestamp: datetime) -> float:
+    """Action timestamps are naive UTC"""
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.timestamp()
+
+
+def _score_bin(score: float) -> int:
+    for index in range(len(SCORE_BINS) - 1, -1, -1):
+        if score >= SCORE_BINS[index]:
+            return index
+    return 0
+
+
+class RollingCounter:
+    """
+    Counts per key over a sliding window of fixed-width buckets
+
+    totals always holds the sum of the live buckets: a bucket's counts are
+    subtracted when the window slides past it, so reads never walk the
+    buckets and each bucket is expired at most once.
+    """
+
+    __slots__ = ("width", "size", "_head", "_slots", "_buckets", "totals")
+
+    def __init__(self, span: float, buckets: int):
+        self.width = span / buckets
+        self.size = buckets
+        self._head: Optional[int] = None
+        self._slots = [-1] * buckets
+        self._buckets: List[Dict[str, int]] = [{} for _ in range(buckets)]
+        self.totals: Dict[str, int] = {}
+
+    def _expire(self, index: int, slot: int) -> None:
+        bucket = self._buckets[index]
+        for key, count in bucket.items():
+            remaining = self.totals.get(key, 0) - count
+            if remaining:
+                self.totals[key] = remaining
+            else:
+                self.totals.pop(key, None)
+        bucket.clear()
+        self._slots[index] = slot
+
+    def advance(self, now: float) -> None:
+        head = int(now // self.width)
+        if self._head is None:
+            self._head = head
+            return
+        if head <= self._head:
+            return
+        for slot in range(max(self._head + 1, head - self.size + 1), head + 1):
+            self._expire(slot % self.size, slot)
+        self._head = head
+
+    def add(self, at: float, key: str, count: int, now: float) -> bool:
+        """Count an event at time `at`; False when it is already outside the window"""
+        self.advance(now)
+        slot = min(int(at // self.width), self._head)
+        if slot <= self._head - self.size:
+            return False
+        self._add(slot, key, count)
+        return True
+
+    def add_many(
+        self, at: "np.ndarray", codes: "np.ndarray", keys: Sequence[str], now: float
+    ) -> None:
+        """Count one event per element of `at` under keys[code], a bucket at a time"""
+        self.advance(now)
+        slots = np.minimum(at // self.width, self._head).astype(np.int64)
+        live = slots > self._head - self.size
+        merged, counts = np.unique(
+            slots[live] * len(keys) + codes[live].astype(np.int64), return_counts=True
+        )
+        for value, count in zip(merged.tolist(), counts.tolist()):
+            slot, code = divmod(value, len(keys))
+            self._add(slot, keys[code], count)
+
+    def _add(self, slot: int, key: str, count: int) -> None:
+        index = slot % self.size
+        if self._slots[index] != slot:
+            self._expire(index, slot)
+        bucket = self._buckets[index]
+        bucket[key] = bucket.get(key, 0) + count
+        total = self.totals.get(key, 0) + count
+        if total:
+            self.totals[key] = total
+        else:
+            self.totals.pop(key, None)
+
+
+class RegionRollup:
+    """
+    Aggregates for one region
+
+    Activity (action volume, platform and action mix, active fans) is
+    kept per rolling window. Tier counts and the score histogram describe
+    the latest score of every fan scored in the region. Active fans are
+    counted exactly: each fan sits in the bucket of their last action, and
+    moves when they act again.
+    """
+
+    def __init__(self):
+        self.windows = {name: RollingCounter(*shape) for name, shape in WINDOWS.items()}
+        self.tiers: Dict[str, int] = {}
+        self.histogram = [0] * len(SCORE_BINS)
+        self._last_seen: Dict[str, float] = {}
+        self._prune_at = 1024
+
+    def record_action(self, user_id: str, action: ConvictionAction, now: float) -> None:
+        at = _epoch(action.timestamp)
+        keys = (ACTIONS, f"platform:{action.platform.value}", f"action:{action.action_type.value}")
+        for counter in self.windows.values():
+            for key in keys:
+                counter.add(at, key, 1, now)
+
+        previous = self._last_seen.get(user_id)
+        if previous is not None and previous >= at:
+            return
+        self._last_seen[user_id] = at
+        for counter in self.windows.values():
+            if counter.add(at, FANS, 1, now) and previous is not None:
+                counter.add(previous, FANS, -1, now)
+        if len(self._last_seen) >= self._prune_at:
+            self._prune(now)
+
+    def load(
+        self,
+        user_ids: Sequence[str],
+        users: "np.ndarray",
+        at: "np.ndarray",
+        platforms: "np.ndarray",
+        actions: "np.ndarray",
+        now: float,
+    ) -> None:
+        """
+        record_action() for many actions at once, given as arrays: users
+        index user_ids, `at` is in epoch seconds and platforms and actions
+        are positions in Platform and ActionType
+        """
+        if not len(at):
+            return
+        everything = np.zeros(len(at), np.int64)
+        platform_keys = [f"platform:{platform.value}" for platform in Platform]
+        action_keys = [f"action:{action.value}" for action in ActionType]
+        for counter in self.windows.values():
+            counter.add_many(at, everything, (ACTIONS,), now)
+            counter.add_many(at, platforms, platform_keys, now)
+            counter.add_many(at, actions, action_keys, now)
+
+        last = np.full(len(user_ids), -np.inf)
+        np.maximum.at(last, users, at)
+        seen = np.flatnonzero(last > -np.inf)
+        fans = []
+        for user_id, latest in zip([user_ids[u] for u in seen.tolist()], last[seen].tolist()):
+            previous = self._last_seen.get(user_id)
+            if previous is not None:
+                if previous >= latest:
+                    continue
+                for counter in self.windows.values():
+                    counter.add(previous, FANS, -1, now)
+            self._last_seen[user_id] = latest
+            fans.append(latest)
+        for counter in self.windows.values():
+            counter.add_many(np.array(fans), np.zeros(len(fans), np.int64), (FANS,), now)
+        if len(self._last_seen) >= self._prune_at:
+            self._prune(now)
+
+    def _prune(self, now: float) -> None:
+        """Forget fans idle for longer than the longest window"""
+        horizon = now - HORIZON
+        self._last_seen = {u: at for u, at in self._last_seen.items() if at > horizon}
+        self._prune_at = max(1024, 2 * len(self._last_seen))
+
+    def move_score(self, old: Optional[Tuple[str, int]], new: Optional[Tuple[str, int]]) -> None:
+        """Replace a fan's (tier, score bin) in the distribution"""
+        if old is not None:
+            tier, index = old
+            self.tiers[tier] -= 1
+            if not self.tiers[tier]:
+                del self.tiers[tier]
+            self.histogram[index] -= 1
+        if new is not None:
+            tier, index = new
+            self.tiers[tier] = self.tiers.get(tier, 0) + 1
+            self.histogram[index] += 1
+
+    def snapshot(self, window: str, now: float) -> dict:
+        counter = self.windows[window]
+        counter.advance(now)
+        totals = counter.totals
+        platforms, action_types = {}, {}
+        for key, count in totals.items():
+            kind, _, name = key.partition(":")
+            if kind == "platform":
+                platforms[name] = count
+            elif kind == "action":
+                action_types[name] = count
+        return {
+            "window": window,
+            "action_volume": totals.get(ACTIONS, 0),
+            "active_fans": totals.get(FANS, 0),
+            "platform_mix": platforms,
+            "action_mix": action_types,
+            "scored_fans": sum(self.histogram),
+            "tiers": dict(self.tiers),
+            "score_histogram": [
+                {
+                    "min_score": low,
+                    "max_score": SCORE_BINS[i + 1] if i + 1 < len(SCORE_BINS) else None,
+                    "fans": self.histogram[i],
+                }
+                for i, low in enumerate(SCORE_BINS)
+            ],
+        }
+
+
+class RegionalAnalytics:
+    """
+    Per-region rollups updated as actions are stored and scores change
+
+    Every update touches the fan's region and the "all" rollup, and reads
+    return the running totals, so a dashboard never scans users or
+    actions. At most ANALYTICS_MAX_REGIONS regions get a rollup; fans and
+    actions from regions beyond the cap only count towards "all". Rollups
+    live in this process: the action store rebuilds them with load() on
+    start and, with a shared backend, passes on other workers' updates.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self.clock = clock
+        self._regions: Dict[str, RegionRollup] = {ALL_REGIONS: RegionRollup()}
+        # Read from settings on first use
+        self._max_regions: Optional[int] = None
+        self._scores: Dict[str, Tuple[Optional[str], str, int]] = {}
+        self._empty = RegionRollup()
+
+    @staticmethod
+    def normalize(region: Optional[str]) -> Optional[str]:
+        region = (region or "").strip().lower()
+        return region if region and region != ALL_REGIONS else None
+
+    def _rollups(self, region: Optional[str]) -> List[RegionRollup]:
+        rollups = [self._regions[ALL_REGIONS]]
+        if region is None:
+            return rollups
+        rollup = self._regions.get(region)
+        if rollup is None:
+            if self._max_regions is None:
+                self._max_regions = settings.ANALYTICS_MAX_REGIONS
+            if len(self._regions) > self._max_regions:
+                return rollups
+            rollup = self._regions[region] = RegionRollup()
+        rollups.append(rollup)
+        return rollups
+
+    def record_actions(
+        self,
+        user_id: str,
+        region: Optional[str],
+        actions: Sequence[ConvictionAction],
+    ) -> None:
+        """Count verified actions towards the fan's region"""
+        now = self.clock()
+        rollups = self._rollups(self.normalize(region))
+        for action in actions:
+            if action.verified:
+                for rollup in rollups:
+                    rollup.record_action(user_id, action, now)
+
+    def load(
+        self,
+        user_ids: Sequence[str],
+        regions: Sequence[Optional[str]],
+        users: "np.ndarray",
+        at: "np.ndarray",
+        platforms: "np.ndarray",
+        actions: "np.ndarray",
+    ) -> None:
+        """
+        record_actions() for many verified actions at once: users index
+        user_ids and regions, the rest is as for RegionRollup.load()
+        """
+        now = self.clock()
+        self._regions[ALL_REGIONS].load(user_ids, users, at, platforms, actions, now)
+        names: Dict[str, int] = {}
+        codes = np.array(
+            [-1 if name is None else names.setdefault(name, len(names))
+             for name in map(self.normalize, regions)] or [-1],
+            np.int64,
+        )
+        in_region = codes[users]
+        for name, code in names.items():
+            rollups = self._rollups(name)[1:]
+            if not rollups:
+                continue
+            mask = in_region == code
+            if mask.any():
+                rollups[0].load(
+                    user_ids, users[mask], at[mask], platforms[mask], actions[mask], now
+                )
+
+    def record_score(self, user_id: str, region: Optional[str], score: float, tier: str) -> None:
+        """Move the fan's tier and histogram entry to their latest score"""
+        region = self.normalize(region)
+        entry = (tier, _score_bin(score))
+        previous = self._scores.get(user_id)
+        if previous is not None:
+            old_region, old_tier, old_bin = previous
+            if (old_region, old_tier, old_bin) == (region, *entry):
+                return
+            for rollup in self._rollups(old_region):
+                rollup.move_score((old_tier, old_bin), None)
+        self._scores[user_id] = (region, *entry)
+        for rollup in self._rollups(region):
+            rollup.move_score(None, entry)
+
+    def regions(self) -> List[str]:
+        return sorted(region for region in self._regions if region != ALL_REGIONS)
+
+    def snapshot(self, region: str, window: str) -> dict:
+        """Aggregates for a region (or "all") over one of WINDOWS"""
+        if window not in WINDOWS:
+            raise ValueError(f"Unknown window: {window}")
+        key = (region or "").strip().lower() or ALL_REGIONS
+        rollup = self._regions.get(key, self._empty)
+        return {"region": key, **rollup.snapshot(window, self.clock())}
+
+
+regional_analytics = RegionalAnalytics()
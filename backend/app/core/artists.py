@@ -0,0 +1,319 @@
+"""
+Palmlion Artist Conviction
+Sparse user x artist conviction matrix for per-artist superfan rankings
+"""
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+from app.core.conviction import ACTION_WEIGHTS, PLATFORM_WEIGHTS, ConvictionAction
+from app.core.lazy import lazy_import
+from app.core.profiling import traced
+
+np = lazy_import("numpy")
+
+EPOCH = datetime(1970, 1, 1)
+
+# Appends buffered as COO before they are merged into the compacted arrays
+DEFAULT_BUFFER_SIZE = 65536
+
+COLUMNS = ("artists", "users", "days", "weights")
+
+
+def _day(timestamp: datetime) -> int:
+    """Days since the epoch; action timestamps are naive UTC"""
+    return (timestamp.replace(tzinfo=None) - EPOCH).days
+
+
+def _artist_key(artist_name: str) -> str:
+    return artist_name.strip().lower()
+
+
+class ArtistConvictionMatrix:
+    """
+    Conviction per (fan, artist) as a sparse matrix
+
+    Each cell holds one entry per active day: the summed platform x action
+    weight of that fan's verified actions for that artist on that day, so
+    a million streams by a fan base collapse to fans x active days.
+
+    New actions land in a COO buffer. When it fills, buffer and matrix are
+    merged into artist-major CSR arrays (artist_indptr over entries sorted
+    by artist, fan, day) with duplicate cells summed and days older than
+    the lookback dropped; user_order and user_indptr give the same entries
+    fan-major. Queries slice one row of the compacted arrays, mask the
+    buffer, and apply the weekly decay to the whole slice at once; on the
+    day of the last compaction, artist rows come pre-summed per fan.
+    """
+
+    def __init__(self, buffer_size: int = DEFAULT_BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self._user_index: Dict[str, int] = {}
+        self._user_ids: List[str] = []
+        self._artist_index: Dict[str, int] = {}
+        self._artist_names: List[str] = []
+
+        # Compacted entries, sorted by (artist, user, day); numpy arrays once built
+        self._artists = self._users = self._days = self._weights = None
+        self._artist_indptr = self._user_indptr = self._user_order = None
+
+        # Per (artist, fan) scores as of the compaction day, artist-major
+        self._compacted_day: Optional[int] = None
+        self._pair_indptr = self._pair_users = self._pair_scores = None
+
+        # COO append buffer, allocated on first use so numpy loads lazily
+        self._buffer = None
+        self._buffered = 0
+
+    # --- ingestion ---------------------------------------------------------
+
+    def _intern_user(self, user_id: str) -> int:
+        index = self._user_index.get(user_id)
+        if index is None:
+            index = self._user_index[user_id] = len(self._user_ids)
+            self._user_ids.append(user_id)
+        return index
+
+    def _intern_artist(self, artist_name: str) -> int:
+        key = _artist_key(artist_name)
+        index = self._artist_index.get(key)
+        if index is None:
+            index = self._artist_index[key] = len(self._artist_names)
+            self._artist_names.append(artist_name.strip())
+        return index
+
+    def add(self, user_id: str, actions: Sequence[ConvictionAction]) -> int:
+        """Buffer the fan's verified, artist-tagged actions; returns how many were taken"""
+        rows = [
+            (
+                self._intern_artist(action.artist_name),
+                _day(action.timestamp),
+                PLATFORM_WEIGHTS.get(action.platform, 1.0)
+                * float(ACTION_WEIGHTS.get(action.action_type, 1)),
+            )
+            for action in actions
+            if action.verified and action.artist_name and action.artist_name.strip()
+        ]
+        if not rows:
+            return 0
+        user = self._intern_user(user_id)
+        if self._buffer is None:
+            self._buffer = {
+                "artists": np.empty(self.buffer_size, np.int32),
+                "users": np.empty(self.buffer_size, np.int32),
+                "days": np.empty(self.buffer_size, np.int32),
+                "weights": np.empty(self.buffer_size, np.float64),
+            }
+        for artist, day, weight in rows:
+            if self._buffered == self.buffer_size:
+                self.compact()
+            i = self._buffered
+            self._buffer["artists"][i] = artist
+            self._buffer["users"][i] = user
+            self._buffer["days"][i] = day
+            self._buffer["weights"][i] = weight
+            self._buffered += 1
+        return len(rows)
+
+    def load(
+        self,
+        user_ids: Sequence[str],
+        artist_names: Sequence[str],
+        users: "np.ndarray",
+        artists: "np.ndarray",
+        days: "np.ndarray",
+        weights: "np.ndarray",
+    ) -> None:
+        """
+        add() for many verified actions at once, as arrays: users index
+        user_ids, artists index artist_names, days count from the epoch and
+        weights are platform x action weights. They are merged straight
+        into the compacted arrays, along with the buffer.
+        """
+        artist_codes = np.array(
+            [self._intern_artist(name) if name.strip() else -1 for name in artist_names] or [-1],
+            np.int32,
+        )[artists]
+        tagged = artist_codes >= 0
+        users = users[tagged]
+        user_codes = np.zeros(len(user_ids) or 1, np.int32)
+        fans = np.unique(users)
+        user_codes[fans] = [self._intern_user(user_ids[u]) for u in fans.tolist()]
+        self._merge(
+            [(
+                artist_codes[tagged],
+                user_codes[users],
+                days[tagged].astype(np.int32),
+                weights[tagged].astype(np.float64),
+            )],
+            None,
+        )
+
+    @traced("artists.compact")
+    def compact(self, today: Optional[int] = None) -> None:
+        """Merge the buffer into the CSR arrays, summing duplicate cells"""
+        if self._buffer is None:
+            return
+        self._merge([], today)
+
+    def _merge(self, parts: list, today: Optional[int]) -> None:
+        if today is None:
+            today = _day(datetime.utcnow())
+        if self._buffered:
+            parts.append(tuple(self._buffer[k][:self._buffered] for k in COLUMNS))
+        if self._artists is not None:
+            parts.insert(0, (self._artists, self._users, self._days, self._weights))
+        if not parts:
+            parts = [(np.empty(0, np.int32),) * 3 + (np.empty(0, np.float64),)]
+        artists, users, days, weights = (np.concatenate(column) for column in zip(*parts))
+        self._buffered = 0
+
+        live = days >= today - settings.CONVICTION_LOOKBACK_DAYS
+        artists, users, days, weights = artists[live], users[live], days[live], weights[live]
+        order = np.lexsort((days, users, artists))
+        artists, users, days, weights = artists[order], users[order], days[order], weights[order]
+        if len(artists):
+            new_cell = np.empty(len(artists), bool)
+            new_cell[0] = True
+            new_cell[1:] = (
+                (artists[1:] != artists[:-1]) | (users[1:] != users[:-1]) | (days[1:] != days[:-1])
+            )
+            starts = np.flatnonzero(new_cell)
+            weights = np.add.reduceat(weights, starts)
+            artists, users, days = artists[starts], users[starts], days[starts]
+
+        self._artists, self._users, self._days, self._weights = artists, users, days, weights
+        self._artist_indptr = self._indptr(artists, len(self._artist_names))
+        self._user_order = np.lexsort((artists, users))
+        self._user_indptr = self._indptr(users, len(self._user_ids))
+
+        # Decay only changes once a day, so each (artist, fan) score is summed
+        # here once and artist queries on the same day read it directly
+        decayed = self._decayed(days, weights, today)
+        pair_starts = np.empty(0, np.int64)
+        if len(artists):
+            new_pair = (artists[1:] != artists[:-1]) | (users[1:] != users[:-1])
+            pair_starts = np.flatnonzero(np.r_[True, new_pair])
+            decayed = np.add.reduceat(decayed, pair_starts)
+        self._pair_users = users[pair_starts]
+        self._pair_scores = decayed
+        self._pair_indptr = self._indptr(artists[pair_starts], len(self._artist_names))
+        self._compacted_day = today
+
+    @staticmethod
+    def _indptr(rows: "np.ndarray", size: int) -> "np.ndarray":
+        indptr = np.zeros(size + 1, np.int64)
+        np.cumsum(np.bincount(rows, minlength=size), out=indptr[1:])
+        return indptr
+
+    # --- scoring -----------------------------------------------------------
+
+    @staticmethod
+    def _decayed(days: "np.ndarray", weights: "np.ndarray", today: int) -> "np.ndarray":
+        """Per-entry conviction: weekly exponential decay, zero outside the lookback"""
+        age = today - days
+        decay = np.exp(-settings.CONVICTION_DECAY_RATE * age / 7)
+        return np.where(age <= settings.CONVICTION_LOOKBACK_DAYS, weights * decay, 0.0)
+
+    def _row(self, key: str, index: int, today: int) -> Tuple["np.ndarray", "np.ndarray"]:
+        """
+        Conviction along one artist's row (key="artists") or one fan's row
+        (key="users"): the other side's indices and their summed scores
+        """
+        other = "users" if key == "artists" else "artists"
+        ids, scores = np.empty(0, np.int32), np.empty(0, np.float64)
+        if self._artists is not None and key == "artists" and today == self._compacted_day:
+            if index + 1 < len(self._pair_indptr):
+                pairs = slice(self._pair_indptr[index], self._pair_indptr[index + 1])
+                ids, scores = self._pair_users[pairs], self._pair_scores[pairs].copy()
+        elif self._artists is not None:
+            indptr = self._artist_indptr if key == "artists" else self._user_indptr
+            if index + 1 < len(indptr):
+                entries = slice(indptr[index], indptr[index + 1])
+                if key == "users":
+                    entries = self._user_order[entries]
+                row_ids = getattr(self, f"_{other}")[entries]
+                if len(row_ids):
+                    # Entries are sorted by the other index within a row
+                    starts = np.flatnonzero(np.r_[True, row_ids[1:] != row_ids[:-1]])
+                    decayed = self._decayed(self._days[entries], self._weights[entries], today)
+                    ids, scores = row_ids[starts], np.add.reduceat(decayed, starts)
+
+        if self._buffered:
+            n = self._buffered
+            mask = self._buffer[key][:n] == index
+            if mask.any():
+                decayed = self._decayed(
+                    self._buffer["days"][:n][mask], self._buffer["weights"][:n][mask], today
+                )
+                extra, inverse = np.unique(self._buffer[other][:n][mask], return_inverse=True)
+                extra_scores = np.bincount(inverse, weights=decayed, minlength=len(extra))
+                position = np.searchsorted(ids, extra)
+                found = position < len(ids)
+                found[found] = ids[position[found]] == extra[found]
+                scores[position[found]] += extra_scores[found]
+                ids = np.concatenate([ids, extra[~found]])
+                scores = np.concatenate([scores, extra_scores[~found]])
+
+        keep = scores > 0
+        return ids[keep], scores[keep]
+
+    def _artist_row(self, artist_name: str) -> Tuple[Optional[int], "np.ndarray", "np.ndarray"]:
+        index = self._artist_index.get(_artist_key(artist_name))
+        if index is None:
+            return None, np.empty(0, np.int32), np.empty(0, np.float64)
+        users, scores = self._row("artists", index, _day(datetime.utcnow()))
+        return index, users, scores
+
+    @traced("artists.score")
+    def artist_scores(self, artist_name: str) -> Tuple[List[str], "np.ndarray"]:
+        """Every fan with conviction for the artist, and their scores"""
+        _, users, scores = self._artist_row(artist_name)
+        return [self._user_ids[u] for u in users], scores
+
+    @staticmethod
+    def _top(scores: "np.ndarray", limit: int) -> "np.ndarray":
+        """Indices of the highest scores, best first, without sorting the rest"""
+        k = min(limit, len(scores))
+        if k <= 0:
+            return np.empty(0, np.int64)
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top], kind="stable")]
+
+    @traced("artists.top_fans")
+    def top_fans(self, artist_name: str, limit: int = 50) -> dict:
+        """The artist's superfans by conviction, with totals over the whole fan base"""
+        index, users, scores = self._artist_row(artist_name)
+        return {
+            "artist_name": self._artist_names[index] if index is not None else artist_name,
+            "total_fans": int(len(users)),
+            "total_conviction": round(float(scores.sum()), 2),
+            "fans": [
+                (self._user_ids[users[i]], round(float(scores[i]), 2))
+                for i in self._top(scores, limit)
+            ],
+        }
+
+    @traced("artists.fan_ranking")
+    def fan_artists(self, user_id: str, limit: int = 20) -> List[Tuple[str, float]]:
+        """The fan's artists ranked by the fan's conviction for each"""
+        index = self._user_index.get(user_id)
+        if index is None:
+            return []
+        artists, scores = self._row("users", index, _day(datetime.utcnow()))
+        return [
+            (self._artist_names[artists[i]], round(float(scores[i]), 2))
+            for i in self._top(scores, limit)
+        ]
+
+    def stats(self) -> dict:
+        compacted = 0 if self._artists is None else int(len(self._artists))
+        return {
+            "fans": len(self._user_ids),
+            "artists": len(self._artist_names),
+            "entries": compacted,
+            "buffered": self._buffered,
+        }
+
+
+artist_matrix = ArtistConvictionMatrix()
@@ -0,0 +1,224 @@
+"""
+Palmlion Response Cache
+Per-route HTTP response caching with strong ETags and conditional requests
+"""
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode
+
+from app.core.metrics import CACHE_REQUESTS
+
+# Hop-by-hop and per-response headers that are never replayed from the cache
+_UNCACHED_HEADERS = {b"date", b"etag", b"cache-control", b"set-cookie", b"connection"}
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    """
+    How long a route's responses may be reused
+
+    version, when given, returns the current version of the content the
+    route renders; entries stored under an older version are never served,
+    whatever their TTL. private responses vary per user and are kept out
+    of shared (CDN) caches.
+    """
+    ttl: float
+    version: Optional[Callable[[], object]] = None
+    private: bool = False
+
+    @property
+    def cache_control(self) -> bytes:
+        scope = "private" if self.private else "public"
+        return f"{scope}, max-age={int(self.ttl)}".encode()
+
+    def current_version(self) -> object:
+        return self.version() if self.version is not None else None
+
+
+@dataclass
+class CachedResponse:
+    """A stored 200 response"""
+    headers: List[Tuple[bytes, bytes]]
+    body: bytes
+    etag: bytes
+    version: object
+    expires_at: float
+    route: object
+
+
+def strong_etag(body: bytes) -> bytes:
+    """Strong validator: any byte-level change produces a new tag"""
+    return b'"' + hashlib.blake2b(body, digest_size=16).hexdigest().encode() + b'"'
+
+
+def etag_matches(if_none_match: bytes, etag: bytes) -> bool:
+    """If-None-Match uses weak comparison (RFC 9110 13.1.2)"""
+    if if_none_match.strip() == b"*":
+        return True
+    for candidate in if_none_match.split(b","):
+        candidate = candidate.strip()
+        if candidate.startswith(b"W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+class ResponseCache:
+    """
+    Bounded LRU of rendered responses keyed by path and normalised query
+
+    Query parameters are sorted, so ?a=1&b=2 and ?b=2&a=1 share an entry.
+    """
+
+    def __init__(self, max_entries: int = 10_000, max_body_bytes: int = 1 << 20):
+        self.max_entries = max_entries
+        self.max_body_bytes = max_body_bytes
+        self._entries: "OrderedDict[Tuple[str, str], CachedResponse]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key(path: str, query_string: bytes) -> Tuple[str, str]:
+        pairs = parse_qsl(query_string.decode("latin-1"), keep_blank_values=True)
+        return path, urlencode(sorted(pairs))
+
+    def get(self, key: Tuple[str, str], version: object) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.version != version or entry.expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: Tuple[str, str], entry: CachedResponse) -> None:
+        if len(entry.body) > self.max_body_bytes:
+            return
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+class ResponseCacheMiddleware:
+    """
+    ASGI middleware serving GETs for configured paths from a ResponseCache
+
+    A hit never reaches the handler. Every cacheable response carries a
+    strong ETag and Cache-Control, and a matching If-None-Match gets a
+    bodiless 304. Concurrent misses for one key are coalesced, so a burst
+    of polls after expiry runs the handler once.
+    """
+
+    def __init__(self, app, cache: ResponseCache, policies: Dict[str, CachePolicy]):
+        self.app = app
+        self.cache = cache
+        self.policies = policies
+        self._fills: Dict[Tuple[str, str], asyncio.Event] = {}
+
+    async def __call__(self, scope, receive, send):
+        policy = self.policies.get(scope["path"]) if scope["type"] == "http" else None
+        if policy is None or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+
+        key = self.cache.key(scope["path"], scope.get("query_string", b""))
+        if_none_match = _header(scope, b"if-none-match")
+
+        while True:
+            entry = self.cache.get(key, policy.current_version())
+            if entry is not None:
+                scope["route"] = entry.route
+                result = "not_modified" if _fresh(if_none_match, entry.etag) else "hit"
+                CACHE_REQUESTS.inc(scope["path"], result)
+                await self._replay(send, policy, entry, not_modified=result == "not_modified")
+                return
+            fill = self._fills.get(key)
+            if fill is None:
+                break
+            await fill.wait()
+            if self.cache.get(key, policy.current_version()) is None:
+                # The other request's response was not cacheable; render our own
+                break
+
+        CACHE_REQUESTS.inc(scope["path"], "miss")
+        fill = self._fills.setdefault(key, asyncio.Event())
+        try:
+            await self._fill(scope, receive, send, policy, key, if_none_match)
+        finally:
+            if self._fills.get(key) is fill:
+                del self._fills[key]
+            fill.set()
+
+    async def _fill(self, scope, receive, send, policy, key, if_none_match) -> None:
+        version = policy.current_version()
+        start: Optional[dict] = None
+        chunks: List[bytes] = []
+
+        async def buffer(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    await finish()
+
+        async def finish():
+            body = b"".join(chunks)
+            if start["status"] != 200 or _has_header(start["headers"], b"set-cookie"):
+                await send(start)
+                await send({"type": "http.response.body", "body": body})
+                return
+            entry = CachedResponse(
+                headers=[(k, v) for k, v in start["headers"] if k.lower() not in _UNCACHED_HEADERS],
+                body=body,
+                etag=strong_etag(body),
+                version=version,
+                expires_at=time.monotonic() + policy.ttl,
+                route=scope.get("route"),
+            )
+            self.cache.put(key, entry)
+            await self._replay(send, policy, entry, not_modified=_fresh(if_none_match, entry.etag))
+
+        await self.app(scope, receive, buffer)
+
+    @staticmethod
+    async def _replay(send, policy: CachePolicy, entry: CachedResponse, not_modified: bool) -> None:
+        validators = [(b"etag", entry.etag), (b"cache-control", policy.cache_control)]
+        if not_modified:
+            headers = [(k, v) for k, v in entry.headers if k.lower() != b"content-length"]
+            await send({
+                "type": "http.response.start", "status": 304, "headers": headers + validators,
+            })
+            await send({"type": "http.response.body", "body": b""})
+            return
+        await send({
+            "type": "http.response.start", "status": 200, "headers": entry.headers + validators,
+        })
+        await send({"type": "http.response.body", "body": entry.body})
+
+
+def _header(scope, name: bytes) -> Optional[bytes]:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value
+    return None
+
+
+def _has_header(headers, name: bytes) -> bool:
+    return any(key.lower() == name for key, _ in headers)
+
+
+def _fresh(if_none_match: Optional[bytes], etag: bytes) -> bool:
+    return if_none_match is not None and etag_matches(if_none_match, etag)
@@ -0,0 +1,138 @@
+"""
+Palmlion Change Tracking
+Change sequence over exported conviction results for delta syncs
+"""
+from typing import Dict, List, Optional, Tuple
+from uuid import uuid4
+
+from app.core.config import settings
+from app.core.state import StateBackend, state_backend
+
+# Exported fields where any change is significant
+CATEGORICAL_FIELDS = ("tier", "consistency_rating")
+
+# State backend namespaces: the epoch document and the change logs, and
+# the last recorded export of every user
+CHANGES = "export_changes"
+LATEST = "export_latest"
+
+
+class ChangeCursorExpiredError(Exception):
+    """Raised for a cursor from a change log that was rotated or reset"""
+
+
+class ChangeTracker:
+    """
+    Monotonic change log of Convicta export records
+
+    observe_many() compares fresh exports with the last ones recorded for
+    the users and only logs a change when it is significant: a tier or
+    consistency change, or a score move of at least the threshold.
+    Consumers page through changes with an integer cursor, so a sync costs
+    the number of changed users, not the population.
+
+    The log is a list in the shared state backend, so every worker appends
+    to one sequence: a change's number is its position, assigned by the
+    append itself. Each log belongs to an epoch. A cursor has to come with
+    the epoch it was issued in; when the log was rotated (at max_log
+    entries) or the backend was wiped, the consumer is told to resync.
+    """
+
+    def __init__(
+        self,
+        backend: StateBackend,
+        score_threshold: float = 1.0,
+        max_log: int = 1_000_000,
+    ):
+        self.backend = backend
+        self.score_threshold = score_threshold
+        self.max_log = max_log
+
+    async def epoch(self) -> str:
+        """Epoch of the current log, started on first use"""
+        current = await self.backend.get(CHANGES, "epoch")
+        if current is None:
+            await self.backend.set_if_absent(CHANGES, "epoch", {"id": uuid4().hex})
+            current = await self.backend.get(CHANGES, "epoch")
+        return current["id"]
+
+    async def observe_many(self, records: Dict[str, dict]) -> int:
+        """Log the exports that changed significantly; returns how many did"""
+        if not records:
+            return 0
+        epoch = await self.epoch()
+        previous = await self.backend.get_many(LATEST, list(records))
+        changed = {
+            user_id: record
+            for user_id, record in records.items()
+            if user_id not in previous
+            or self._is_significant(previous[user_id]["record"], record)
+        }
+        if not changed:
+            return 0
+
+        length = await self.backend.append(
+            CHANGES, f"log:{epoch}", [{"user_id": user_id} for user_id in changed]
+        )
+        first = length - len(changed) + 1
+        await self.backend.set_many(
+            LATEST,
+            {
+                user_id: {"seq": seq, "record": record}
+                for seq, (user_id, record) in enumerate(changed.items(), first)
+            },
+        )
+        if length >= self.max_log:
+            await self._rotate(epoch)
+        return len(changed)
+
+    async def changes_since(
+        self, cursor: int, limit: int, epoch: Optional[str] = None
+    ) -> Tuple[List[dict], int, bool, str]:
+        """
+        Latest export of every user changed after cursor
+
+        Returns (records, next_cursor, has_more, epoch). A user changed
+        several times is returned once, at their most recent position, so
+        a page can hold fewer than limit records and still have more.
+        Raises ChangeCursorExpiredError when a non-zero cursor does not
+        belong to the current epoch.
+        """
+        current = await self.epoch()
+        if cursor and epoch != current:
+            raise ChangeCursorExpiredError(
+                "Cursor is from an earlier change log; resync from since=0"
+            )
+
+        entries = await self.backend.get_list_slice(CHANGES, f"log:{current}", cursor, limit)
+        users = list(dict.fromkeys(entry["user_id"] for entry in entries))
+        latest = await self.backend.get_many(LATEST, users)
+
+        records = []
+        for seq, entry in enumerate(entries, cursor + 1):
+            doc = latest.get(entry["user_id"])
+            if doc is None or doc["seq"] != seq:
+                continue  # superseded by a later change
+            records.append({**doc["record"], "change_seq": seq})
+        return records, cursor + len(entries), len(entries) == limit, current
+
+    async def _rotate(self, epoch: str) -> None:
+        """Start a new log; consumers of the old one resync"""
+        current = await self.backend.get(CHANGES, "epoch")
+        if current is not None and current["id"] == epoch:
+            await self.backend.set(CHANGES, "epoch", {"id": uuid4().hex})
+        await self.backend.delete(CHANGES, f"log:{epoch}")
+
+    def _is_significant(self, previous: dict, current: dict) -> bool:
+        old = previous["palmlion_conviction"]
+        new = current["palmlion_conviction"]
+        if any(old[f] != new[f] for f in CATEGORICAL_FIELDS):
+            return True
+        return abs(new["score"] - old["score"]) >= self.score_threshold
+
+
+export_changes = ChangeTracker(
+    state_backend,
+    score_threshold=settings.EXPORT_CHANGE_MIN_SCORE_DELTA,
+    max_log=settings.EXPORT_CHANGE_LOG_MAX,
+)
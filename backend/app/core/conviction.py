@@ -2,15 +2,16 @@
 Palmlion Conviction Scoring Engine
 African superfan conviction calculation and Impact Power
 """
+import math
 from dataclasses import dataclass
 from datetime import datetime, timedelta
 from decimal import Decimal
 from enum import Enum
 from typing import List, Optional
 
-import numpy as np
-
 from app.core.config import settings
+from app.core.metrics import SCORING_LATENCY
+from app.core.profiling import traced
 
 
 class Platform(str, Enum):
@@ -67,6 +68,30 @@ class ConvictionAction:
     verified: bool
     proof_hash: Optional[str] = None
     metadata: Optional[dict] = None
+    artist_name: Optional[str] = None
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ConvictionAction":
+        return cls(
+            action_type=ActionType(data["action_type"]),
+            platform=Platform(data["platform"]),
+            timestamp=datetime.fromisoformat(data["timestamp"]),
+            verified=data["verified"],
+            proof_hash=data.get("proof_hash"),
+            metadata=data.get("metadata"),
+            artist_name=data.get("artist_name"),
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "action_type": self.action_type.value,
+            "platform": self.platform.value,
+            "timestamp": self.timestamp.isoformat(),
+            "verified": self.verified,
+            "proof_hash": self.proof_hash,
+            "metadata": self.metadata,
+            "artist_name": self.artist_name,
+        }
 
 
 @dataclass
@@ -82,10 +107,12 @@ class ConvictionScore:
     streak_days: int
 
 
+@SCORING_LATENCY.time()
+@traced("conviction.score")
 def calculate_conviction_score(
     actions: List[ConvictionAction],
-    decay_rate: float = settings.CONVICTION_DECAY_RATE,
-    lookback_days: int = settings.CONVICTION_LOOKBACK_DAYS,
+    decay_rate: Optional[float] = None,
+    lookback_days: Optional[int] = None,
 ) -> ConvictionScore:
     """
     Calculate conviction score for an African superfan
@@ -96,9 +123,16 @@ def calculate_conviction_score(
     - Platform diversity (multiple platforms = higher trust)
     - Action diversity (different action types)
 
+    decay_rate and lookback_days default to the configured values.
+
     Returns:
         ConvictionScore with full breakdown
     """
+    if decay_rate is None:
+        decay_rate = settings.CONVICTION_DECAY_RATE
+    if lookback_days is None:
+        lookback_days = settings.CONVICTION_LOOKBACK_DAYS
+
     if not actions:
         return ConvictionScore(
             score=0.0,
@@ -139,7 +173,7 @@ def calculate_conviction_score(
         weeks_ago = days_ago / 7
 
         # Time decay
-        time_weight = np.exp(-decay_rate * weeks_ago)
+        time_weight = math.exp(-decay_rate * weeks_ago)
 
         # Platform weight
         platform_weight = PLATFORM_WEIGHTS.get(action.platform, 1.0)
@@ -242,11 +276,15 @@ def estimate_conviction_percentile(score: float) -> float:
 
 def rate_consistency(actions: List[ConvictionAction], lookback_days: int) -> str:
     """Rate action consistency"""
-    if not actions:
+    return rate_active_days(len(set(a.timestamp.date() for a in actions)), lookback_days)
+
+
+def rate_active_days(unique_days: int, lookback_days: int) -> str:
+    """Rate consistency from the number of distinct days with an action"""
+    if not unique_days:
         return "inactive"
 
     # Calculate action density (actions per day)
-    unique_days = len(set(a.timestamp.date() for a in actions))
     density = unique_days / lookback_days
 
     if density >= 0.7:
@@ -0,0 +1,230 @@
+"""
+Palmlion Export Serialization
+Streaming and bulk encodings of Convicta export records
+"""
+import asyncio
+import json
+import struct
+import time
+from datetime import datetime, timezone
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.core.conviction import ConvictionScore, export_to_convicta
+from app.core.lazy import lazy_import
+from app.core.metrics import EXPORT_RECORDS, EXPORT_SERIALIZATION
+from app.core.profiling import span, traced
+
+# Only the columnar encoder needs numpy
+np = lazy_import("numpy")
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# Batch scoring: one call per chunk of user ids, so a shared backend pays one round trip
+ScoreLookup = Callable[[Sequence[str]], Awaitable[Dict[str, ConvictionScore]]]
+
+
+async def iter_export_chunks(
+    user_ids: Sequence[str],
+    scores_for: ScoreLookup,
+    chunk_size: int,
+) -> AsyncIterator[List[dict]]:
+    """Score users lazily, yielding at most chunk_size export records at a time"""
+    for start in range(0, len(user_ids), chunk_size):
+        ids = user_ids[start:start + chunk_size]
+        scores = await scores_for(ids)
+        yield [export_to_convicta(user_id, scores[user_id]) for user_id in ids]
+
+
+async def stream_ndjson_exports(
+    user_ids: Sequence[str],
+    scores_for: ScoreLookup,
+    chunk_size: int,
+) -> AsyncIterator[bytes]:
+    """
+    NDJSON body for a StreamingResponse, one export record per line
+
+    Only one chunk is materialised at a time. Each yield waits for the
+    server to hand the previous chunk to the socket, so a slow client
+    slows down scoring instead of growing a buffer.
+    """
+    async for chunk in iter_export_chunks(user_ids, scores_for, chunk_size):
+        start = time.perf_counter()
+        with span("export.ndjson"):
+            lines = [json.dumps(record, separators=(",", ":")) for record in chunk]
+            body = ("\n".join(lines) + "\n").encode()
+        EXPORT_SERIALIZATION.observe(time.perf_counter() - start, "ndjson")
+        EXPORT_RECORDS.inc("ndjson", amount=len(chunk))
+        yield body
+        # Let other requests run between chunks of CPU-bound scoring
+        await asyncio.sleep(0)
+
+
+# ---------------------------------------------------------------------------
+# Columnar bulk format ("PLCX" v1)
+#
+# A fixed-schema, little-endian layout for full-population snapshots:
+#
+#   header   magic "PLCX" | version u16 | flags u16 | rows u32 | columns u16
+#            | generated_at i64 (unix microseconds, once per snapshot)
+#   column   name_len u8 | name utf-8 | type u8 | payload_len u32 | payload
+#
+# Column payloads by type:
+#   STR        offsets u32[rows + 1] | utf-8 bytes
+#   F64        f64[rows]
+#   I64        i64[rows]
+#   U32        u32[rows]
+#   DICT       entries u16 | (len u8 | utf-8)[entries] | codes u8[rows]
+#   DICT_LIST  entries u16 | (len u8 | utf-8)[entries] | offsets u32[rows + 1]
+#              | codes u8[n] | values u32[n]
+#
+# impact_power is stored as exact micro-units (I64) instead of a float.
+# ---------------------------------------------------------------------------
+
+COLUMNAR_MEDIA_TYPE = "application/vnd.palmlion.columnar"
+COLUMNAR_MAGIC = b"PLCX"
+COLUMNAR_VERSION = 1
+
+COL_STR, COL_F64, COL_I64, COL_U32, COL_DICT, COL_DICT_LIST = 1, 2, 3, 4, 5, 6
+
+IMPACT_POWER_SCALE = 10 ** 6
+
+_HEADER = struct.Struct("<4sHHIHq")
+_COLUMN = struct.Struct("<BI")
+
+
+def _encode_dictionary(entries: List[str]) -> bytes:
+    parts = [struct.pack("<H", len(entries))]
+    for entry in entries:
+        raw = entry.encode()
+        parts.append(struct.pack("<B", len(raw)) + raw)
+    return b"".join(parts)
+
+
+def _dictionary_codes(values: Sequence[str]) -> Tuple[List[str], "np.ndarray"]:
+    entries: Dict[str, int] = {}
+    codes = np.fromiter(
+        (entries.setdefault(v, len(entries)) for v in values), dtype="<u1", count=len(values)
+    )
+    return list(entries), codes
+
+
+@traced("export.columnar")
+def encode_columnar(
+    rows: Sequence[Tuple[str, ConvictionScore]],
+    generated_at: Optional[datetime] = None,
+) -> bytes:
+    """Encode scored users as a PLCX v1 columnar snapshot"""
+    start = time.perf_counter()
+    generated_at = generated_at or datetime.utcnow()
+    n = len(rows)
+    scores = [score for _, score in rows]
+    columns: List[Tuple[str, int, bytes]] = []
+
+    user_ids = [user_id.encode() for user_id, _ in rows]
+    offsets = np.zeros(n + 1, dtype="<u4")
+    np.cumsum([len(u) for u in user_ids], out=offsets[1:])
+    columns.append(("user_id", COL_STR, offsets.tobytes() + b"".join(user_ids)))
+
+    columns.append(("score", COL_F64, np.array([s.score for s in scores], "<f8").tobytes()))
+    impact = [
+        int((s.impact_power * IMPACT_POWER_SCALE).to_integral_value()) for s in scores
+    ]
+    columns.append(("impact_power_micros", COL_I64, np.array(impact, "<i8").tobytes()))
+    percentile = np.array([s.percentile for s in scores], "<f8")
+    columns.append(("percentile", COL_F64, percentile.tobytes()))
+    action_count = np.array([s.action_count for s in scores], "<u4")
+    columns.append(("action_count", COL_U32, action_count.tobytes()))
+    streak_days = np.array([s.streak_days for s in scores], "<u4")
+    columns.append(("streak_days", COL_U32, streak_days.tobytes()))
+
+    for name in ("tier", "consistency_rating"):
+        entries, codes = _dictionary_codes([getattr(s, name) for s in scores])
+        columns.append((name, COL_DICT, _encode_dictionary(entries) + codes.tobytes()))
+
+    platforms: Dict[str, int] = {}
+    list_offsets = np.zeros(n + 1, dtype="<u4")
+    codes, values = [], []
+    for i, s in enumerate(scores):
+        for platform, count in s.platform_breakdown.items():
+            codes.append(platforms.setdefault(platform, len(platforms)))
+            values.append(count)
+        list_offsets[i + 1] = len(codes)
+    columns.append((
+        "platform_breakdown",
+        COL_DICT_LIST,
+        _encode_dictionary(list(platforms))
+        + list_offsets.tobytes()
+        + np.array(codes, "<u1").tobytes()
+        + np.array(values, "<u4").tobytes(),
+    ))
+
+    generated_us = int(generated_at.replace(tzinfo=timezone.utc).timestamp() * 1_000_000)
+    parts = [_HEADER.pack(COLUMNAR_MAGIC, COLUMNAR_VERSION, 0, n, len(columns), generated_us)]
+    for name, col_type, payload in columns:
+        raw = name.encode()
+        parts.append(struct.pack("<B", len(raw)) + raw + _COLUMN.pack(col_type, len(payload)))
+        parts.append(payload)
+    data = b"".join(parts)
+
+    EXPORT_SERIALIZATION.observe(time.perf_counter() - start, "columnar")
+    EXPORT_RECORDS.inc("columnar", amount=n)
+    return data
+
+
+def decode_columnar(data: bytes) -> dict:
+    """Decode a PLCX v1 snapshot into {"generated_at", "rows", "columns"}"""
+    magic, version, _, n, column_count, generated_us = _HEADER.unpack_from(data, 0)
+    if magic != COLUMNAR_MAGIC or version != COLUMNAR_VERSION:
+        raise ValueError("Not a PLCX v1 columnar export")
+
+    def read_dictionary(buf: memoryview, pos: int) -> Tuple[List[str], int]:
+        (count,) = struct.unpack_from("<H", buf, pos)
+        pos += 2
+        entries = []
+        for _ in range(count):
+            length = buf[pos]
+            entries.append(bytes(buf[pos + 1:pos + 1 + length]).decode())
+            pos += 1 + length
+        return entries, pos
+
+    view = memoryview(data)
+    pos = _HEADER.size
+    columns = {}
+    for _ in range(column_count):
+        length = view[pos]
+        name = bytes(view[pos + 1:pos + 1 + length]).decode()
+        pos += 1 + length
+        col_type, size = _COLUMN.unpack_from(view, pos)
+        pos += _COLUMN.size
+        payload = view[pos:pos + size]
+        pos += size
+
+        if col_type == COL_STR:
+            offsets = np.frombuffer(payload, "<u4", n + 1)
+            blob = bytes(payload[(n + 1) * 4:])
+            columns[name] = [blob[offsets[i]:offsets[i + 1]].decode() for i in range(n)]
+        elif col_type in (COL_F64, COL_I64, COL_U32):
+            dtype = {COL_F64: "<f8", COL_I64: "<i8", COL_U32: "<u4"}[col_type]
+            columns[name] = np.frombuffer(payload, dtype, n)
+        elif col_type == COL_DICT:
+            entries, at = read_dictionary(payload, 0)
+            codes = np.frombuffer(payload, "<u1", n, at)
+            columns[name] = [entries[c] for c in codes]
+        elif col_type == COL_DICT_LIST:
+            entries, at = read_dictionary(payload, 0)
+            offsets = np.frombuffer(payload, "<u4", n + 1, at)
+            total = int(offsets[-1])
+            codes = np.frombuffer(payload, "<u1", total, at + (n + 1) * 4)
+            values = np.frombuffer(payload, "<u4", total, at + (n + 1) * 4 + total)
+            columns[name] = [
+                {entries[codes[j]]: int(values[j]) for j in range(offsets[i], offsets[i + 1])}
+                for i in range(n)
+            ]
+        else:
+            raise ValueError(f"Unknown column type {col_type} for {name}")
+
+    return {
+        "generated_at": datetime.fromtimestamp(generated_us / 1_000_000, timezone.utc),
+        "rows": n,
+        "columns": columns,
+    }
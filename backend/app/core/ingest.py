@@ -0,0 +1,717 @@
+"""
+Palmlion Bulk Ingestion
+Partner event batches: vectorised validation, proof dedup and a group-commit WAL
+"""
+import asyncio
+import logging
+import os
+import struct
+import time
+import zlib
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+import orjson
+
+from app.core.actions import ActionStore, action_store
+from app.core.config import settings
+from app.core.conviction import ConvictionAction
+from app.core.lazy import lazy_import
+from app.core.metrics import INGEST_COMMIT, INGEST_EVENTS
+from app.core.proofs import ProofIndex, proof_index
+from app.core.segments import ACTION_CODES, DAY_US, EPOCH, PLATFORM_CODES, proof_digest
+
+np = lazy_import("numpy")
+
+logger = logging.getLogger("palmlion.ingest")
+
+# ---------------------------------------------------------------------------
+# Event batches ("PLEV" v1)
+#
+#   header   magic "PLEV" | version u16 | flags u16 | rows u32 | strings u32 | size u32
+#   records  rows x 32 bytes, see event_dtype()
+#   strings  offsets u32[strings + 1] | utf-8 bytes
+#
+# size covers the whole batch, so batches can be concatenated in one
+# request body. Records refer to the strings by index: user and proof
+# directly, artist and region as index + 1 with 0 for none. The
+# write-ahead log frames accepted events in the same encoding.
+# ---------------------------------------------------------------------------
+
+EVENTS_MEDIA_TYPE = "application/vnd.palmlion.events"
+EVENTS_MAGIC = b"PLEV"
+EVENTS_VERSION = 1
+
+_HEADER = struct.Struct("<4sHHIII")
+# WAL frame: payload length, crc32 of the payload
+_FRAME = struct.Struct("<II")
+
+WAL_FILE = "ingest.wal"
+OFFSET_FILE = "ingest.offset"
+
+# Backoff between attempts at applying a frame that failed, in seconds
+APPLY_RETRY_MIN = 0.1
+APPLY_RETRY_MAX = 5.0
+# Longest a busy applier goes without syncing the store and recording its offset
+CHECKPOINT_INTERVAL = 1.0
+
+ACTION_INDEX = {action.value: code for code, action in enumerate(ACTION_CODES)}
+PLATFORM_INDEX = {platform.value: code for code, platform in enumerate(PLATFORM_CODES)}
+
+# Placeholders for fields an NDJSON event did not parse into
+INVALID_REF = 0xFFFFFFFF
+UNKNOWN_CODE = 0xFF
+BAD_TIMESTAMP = -(1 << 63)
+
+# Rejection reasons, in the order they are checked
+REASONS = (
+    "malformed",
+    "unknown_action",
+    "unknown_platform",
+    "bad_timestamp",
+    "stale",
+    "future",
+    "missing_user",
+    "missing_proof",
+)
+
+
+@lru_cache(maxsize=None)
+def event_dtype() -> "np.dtype":
+    """One partner event as a fixed-width 32-byte little-endian record"""
+    return np.dtype([
+        ("timestamp", "<i8"),  # microseconds since the epoch, UTC
+        ("user", "<u4"),
+        ("proof", "<u4"),
+        ("artist", "<u4"),
+        ("region", "<u4"),
+        ("action", "u1"),
+        ("platform", "u1"),
+        ("verified", "u1"),
+        ("reserved", "V5"),
+    ])
+
+
+@dataclass
+class EventBatch:
+    """Events as fixed-width records plus the strings they refer to"""
+    records: "np.ndarray"
+    strings: List[str]
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def select(self, rows: "np.ndarray") -> "EventBatch":
+        """The events at rows (indices or a mask), with only the strings they use"""
+        records = self.records[rows].copy()
+        refs = [records["user"], records["proof"]]
+        for field in ("artist", "region"):
+            tagged = records[field][records[field] > 0]
+            refs.append(tagged - 1)
+        used = np.unique(np.concatenate(refs).astype(np.int64))
+        remap = np.zeros(len(self.strings), np.uint32)
+        remap[used] = np.arange(len(used), dtype=np.uint32)
+        records["user"] = remap[records["user"]]
+        records["proof"] = remap[records["proof"]]
+        for field in ("artist", "region"):
+            tagged = records[field] > 0
+            records[field][tagged] = remap[records[field][tagged] - 1] + 1
+        return EventBatch(records, [self.strings[i] for i in used.tolist()])
+
+    def users_without_region(self) -> List[str]:
+        users = np.unique(self.records["user"][self.records["region"] == 0])
+        return [self.strings[i] for i in users.tolist() if i < len(self.strings)]
+
+    def fill_regions(self, regions: Dict[str, Optional[str]]) -> None:
+        """Give events without a region their user's region, where one is known"""
+        missing = np.flatnonzero(self.records["region"] == 0)
+        if not len(missing):
+            return
+        if not self.records.flags.writeable:
+            self.records = self.records.copy()
+        index = {s: i for i, s in enumerate(self.strings)}
+        codes: Dict[int, int] = {}
+        for user, rows in _groups(self.records["user"][missing], missing):
+            if user not in codes:
+                region = regions.get(self.strings[user]) if user < len(self.strings) else None
+                if region:
+                    if region not in index:
+                        index[region] = len(self.strings)
+                        self.strings.append(region)
+                    codes[user] = index[region] + 1
+                else:
+                    codes[user] = 0
+            self.records["region"][rows] = codes[user]
+
+
+def _groups(keys: "np.ndarray", rows: "np.ndarray"):
+    """(key, rows) for each distinct key"""
+    order = np.argsort(keys, kind="stable")
+    keys, rows = keys[order], rows[order]
+    bounds = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1], True])
+    for start, end in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+        yield int(keys[start]), rows[start:end]
+
+
+def encode_events(batch: EventBatch) -> bytes:
+    """Encode events as a PLEV v1 batch"""
+    raw = [s.encode() for s in batch.strings]
+    offsets = np.zeros(len(raw) + 1, "<u4")
+    np.cumsum([len(r) for r in raw], out=offsets[1:])
+    body = batch.records.astype(event_dtype(), copy=False).tobytes() + offsets.tobytes()
+    body += b"".join(raw)
+    header = _HEADER.pack(
+        EVENTS_MAGIC, EVENTS_VERSION, 0, len(batch), len(raw), _HEADER.size + len(body)
+    )
+    return header + body
+
+
+def decode_events(data: bytes, pos: int = 0) -> Tuple[EventBatch, int]:
+    """Decode the PLEV v1 batch at pos; returns it and the position after it"""
+    if len(data) - pos < _HEADER.size:
+        raise ValueError("Truncated PLEV header")
+    magic, version, _, rows, count, size = _HEADER.unpack_from(data, pos)
+    if magic != EVENTS_MAGIC or version != EVENTS_VERSION:
+        raise ValueError("Not a PLEV v1 event batch")
+    dtype = event_dtype()
+    strings_at = pos + _HEADER.size + rows * dtype.itemsize
+    blob_at = strings_at + (count + 1) * 4
+    end = pos + size
+    if blob_at > end or end > len(data):
+        raise ValueError("Truncated PLEV batch")
+    records = np.frombuffer(data, dtype, rows, pos + _HEADER.size)
+    offsets = np.frombuffer(data, "<u4", count + 1, strings_at).astype(np.int64)
+    blob = bytes(data[blob_at:end])
+    if offsets[0] != 0 or offsets[-1] != len(blob) or (np.diff(offsets) < 0).any():
+        raise ValueError("Bad PLEV string offsets")
+    bounds = offsets.tolist()
+    strings = [blob[a:b].decode() for a, b in zip(bounds[:-1], bounds[1:])]
+    return EventBatch(records, strings), end
+
+
+def _timestamp_us(value: object) -> int:
+    """ISO 8601 (naive means UTC) or epoch seconds"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return int(value * 1_000_000)
+    if isinstance(value, str):
+        timestamp = datetime.fromisoformat(value)
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+        return (timestamp - EPOCH) // timedelta(microseconds=1)
+    raise ValueError(f"Bad timestamp: {value!r}")
+
+
+def events_from_json(events: Sequence[object]) -> EventBatch:
+    """
+    Batch parsed NDJSON events
+
+    Fields: user_id, action_type, platform, timestamp, proof_hash and
+    optionally verified (default true), artist_name and region. Anything
+    that does not parse is left as a placeholder for validate_events()
+    to reject, so one bad event never fails its batch.
+    """
+    strings: Dict[str, int] = {}
+
+    def ref(value: object) -> int:
+        if not isinstance(value, str):
+            return INVALID_REF
+        return strings.setdefault(value, len(strings))
+
+    def tag(value: object) -> int:
+        return ref(value) + 1 if isinstance(value, str) and value.strip() else 0
+
+    columns: Dict[str, list] = {
+        name: [] for name in
+        ("timestamp", "user", "proof", "artist", "region", "action", "platform", "verified")
+    }
+    for event in events:
+        if not isinstance(event, dict):
+            event = {}
+        try:
+            timestamp = _timestamp_us(event.get("timestamp"))
+        except (ValueError, OverflowError):
+            timestamp = BAD_TIMESTAMP
+        columns["timestamp"].append(timestamp)
+        columns["user"].append(ref(event.get("user_id")))
+        columns["proof"].append(ref(event.get("proof_hash")))
+        columns["artist"].append(tag(event.get("artist_name")))
+        columns["region"].append(tag(event.get("region")))
+        columns["action"].append(ACTION_INDEX.get(event.get("action_type"), UNKNOWN_CODE))
+        columns["platform"].append(PLATFORM_INDEX.get(event.get("platform"), UNKNOWN_CODE))
+        columns["verified"].append(event.get("verified", True) is True)
+
+    records = np.zeros(len(events), event_dtype())
+    for name, values in columns.items():
+        records[name] = values
+    return EventBatch(records, list(strings))
+
+
+def validate_events(batch: EventBatch, now_us: int) -> "np.ndarray":
+    """Per-event reason code: 0 when valid, else 1 + its index in REASONS"""
+    records, n = batch.records, len(batch.strings)
+    # Blank strings, plus a sentinel slot for out-of-range references
+    blank = np.array([not s.strip() for s in batch.strings] + [True])
+    lookback = settings.CONVICTION_LOOKBACK_DAYS * DAY_US
+    skew = settings.INGEST_MAX_CLOCK_SKEW_SECONDS * 1_000_000
+    timestamps = records["timestamp"]
+    conditions = [
+        (records["user"] >= n) | (records["proof"] >= n)
+        | (records["artist"] > n) | (records["region"] > n),
+        records["action"] >= len(ACTION_CODES),
+        records["platform"] >= len(PLATFORM_CODES),
+        timestamps == BAD_TIMESTAMP,
+        timestamps < now_us - lookback,
+        timestamps > now_us + skew,
+        blank[np.minimum(records["user"], n)],
+        blank[np.minimum(records["proof"], n)],
+    ]
+    return np.select(conditions, range(1, len(REASONS) + 1), 0).astype(np.uint8)
+
+
+async def iter_ndjson_batches(
+    chunks: AsyncIterator[bytes], batch_size: int
+) -> AsyncIterator[Tuple[EventBatch, int]]:
+    """Batches of up to batch_size events from a streamed NDJSON body"""
+    pending = b""
+    events: List[object] = []
+    async for chunk in chunks:
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                events.append(orjson.loads(line))
+            except orjson.JSONDecodeError:
+                events.append(None)
+            if len(events) == batch_size:
+                yield events_from_json(events), len(events)
+                events = []
+    if pending.strip():
+        try:
+            events.append(orjson.loads(pending))
+        except orjson.JSONDecodeError:
+            events.append(None)
+    if events:
+        yield events_from_json(events), len(events)
+
+
+async def iter_binary_batches(
+    chunks: AsyncIterator[bytes],
+) -> AsyncIterator[Tuple[EventBatch, int]]:
+    """PLEV batches from a streamed body, decoded as each one completes"""
+    buffer = bytearray()
+    async for chunk in chunks:
+        buffer += chunk
+        while len(buffer) >= _HEADER.size:
+            size = _HEADER.unpack_from(buffer, 0)[5]
+            if size < _HEADER.size:
+                raise ValueError("Bad PLEV batch size")
+            if len(buffer) < size:
+                break
+            batch, end = decode_events(bytes(buffer[:size]))
+            del buffer[:end]
+            yield batch, len(batch)
+    if buffer:
+        raise ValueError("Truncated PLEV batch")
+
+
+class IngestBackpressureError(Exception):
+    """Raised when the write-ahead log is too far behind to take a batch"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Ingestion is behind, retry shortly")
+        self.retry_after = retry_after
+
+
+@dataclass
+class _Commit:
+    frame: bytes
+    digests: List[int]
+    future: asyncio.Future
+
+
+class IngestPipeline:
+    """
+    Validated, deduplicated partner events through a write-ahead log
+
+    submit() validates a batch with array operations, drops events whose
+    proof was already counted (in the batch or before), and queues the
+    rest. A single writer appends everything queued since its last write
+    as CRC-framed PLEV batches and fsyncs once for the whole group, so
+    concurrent requests share each fsync; a batch's future resolves only
+    once its frame is durable, and only then are its proofs written to
+    the proof index. A group that fails to write is cut back off the log.
+    An applier then feeds durable frames to the action store in order.
+    A frame that fails to apply is retried with backoff, so later frames
+    wait behind it rather than skipping it.
+
+    With a durable store the applier syncs it, at least every
+    CHECKPOINT_INTERVAL, and records the applied offset, so only frames
+    past that offset are replayed on start. A store that does not outlive
+    the process (the in-memory state backend) gets the whole log replayed
+    on every start, and the log is never truncated.
+
+    Queued and unapplied bytes are bounded by max_pending_bytes: submit()
+    waits for room up to backpressure_timeout and then raises
+    IngestBackpressureError, which the API turns into a 503 with Retry-After.
+    With a durable store the log is truncated once everything in it has
+    been applied and it exceeds compact_bytes.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        store: ActionStore,
+        proofs: ProofIndex,
+        max_pending_bytes: int = 64 * 1024 * 1024,
+        backpressure_timeout: float = 2.0,
+        compact_bytes: int = 64 * 1024 * 1024,
+    ):
+        self.directory = Path(directory)
+        self.store = store
+        self.proofs = proofs
+        self.max_pending_bytes = max_pending_bytes
+        self.backpressure_timeout = backpressure_timeout
+        self.compact_bytes = compact_bytes
+
+        self._file = None
+        self._written = 0
+        self._applied = 0
+        self._writing = False
+        self._queue: List[_Commit] = []
+        self._pending_bytes = 0
+        self._wake: Optional[asyncio.Event] = None
+        self._space: Optional[asyncio.Condition] = None
+        self._applying: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._stalled = False
+        self._checkpointed_at = 0.0
+        self._broken: Optional[BaseException] = None
+        self._stats = {"groups": 0, "frames": 0, "events": 0, "apply_failures": 0}
+
+    # --- lifecycle ---------------------------------------------------------
+
+    async def start(self) -> None:
+        """Open the log, replay frames that were never applied, start the writer"""
+        if self._file is not None:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        offset_path = self.directory / OFFSET_FILE
+        self._applied = 0
+        if self.store.durable and offset_path.exists():
+            self._applied = int(offset_path.read_text() or 0)
+        frames, valid_end = await asyncio.to_thread(self._read_frames)
+        self._file = open(self.directory / WAL_FILE, "ab", buffering=0)
+        if self._file.tell() != valid_end:
+            # A group torn by a crash mid-write was never acknowledged
+            self._file.truncate(valid_end)
+        self._written = valid_end
+        self._applied = min(self._applied, valid_end)
+        self._broken = None
+
+        for payload, end in frames:
+            batch, _ = decode_events(payload)
+            self.proofs.add(self._digests(batch))
+            if end > self._applied:
+                await self._apply(batch)
+                self._applied = end
+        await self._checkpoint()
+
+        self._wake = asyncio.Event()
+        self._space = asyncio.Condition()
+        self._applying = asyncio.Queue()
+        self._tasks = [
+            asyncio.create_task(self._write_loop()),
+            asyncio.create_task(self._apply_loop()),
+        ]
+
+    async def stop(self) -> None:
+        """
+        Wait for queued batches to be written and applied, then close the log
+
+        While the applier is stuck on a failing frame, only the writes are
+        waited for; the unapplied frames are replayed on the next start.
+        """
+        if self._file is None:
+            return
+        if self._tasks:
+            async with self._space:
+                await self._space.wait_for(
+                    lambda: self._pending_bytes == 0
+                    or (self._stalled and not self._queue and not self._writing)
+                )
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            self._tasks = []
+        self._file.close()
+        self._file = None
+
+    def _read_frames(self) -> Tuple[List[Tuple[bytes, int]], int]:
+        """Every intact frame with its end offset, and where the intact frames end"""
+        path = self.directory / WAL_FILE
+        data = path.read_bytes() if path.exists() else b""
+        frames, pos = [], 0
+        while pos + _FRAME.size <= len(data):
+            length, crc = _FRAME.unpack_from(data, pos)
+            end = pos + _FRAME.size + length
+            payload = data[pos + _FRAME.size:end]
+            if end > len(data) or zlib.crc32(payload) != crc:
+                break
+            frames.append((payload, end))
+            pos = end
+        return frames, pos
+
+    def _write_offset(self, offset: int) -> None:
+        tmp = self.directory / (OFFSET_FILE + ".tmp")
+        tmp.write_text(str(offset))
+        os.replace(tmp, self.directory / OFFSET_FILE)
+
+    # --- submission --------------------------------------------------------
+
+    @staticmethod
+    def _digests(batch: EventBatch) -> List[int]:
+        strings = batch.strings
+        return [proof_digest(strings[i]) for i in batch.records["proof"].tolist()]
+
+    async def submit(self, batch: EventBatch) -> Tuple[Dict[str, int], Optional[asyncio.Future]]:
+        """
+        Validate and deduplicate a batch and queue what is left
+
+        Returns the batch's counts (accepted, duplicates and each
+        rejection reason) and a future resolving to the log offset once
+        the accepted events are durable, or None if nothing was accepted.
+        """
+        if self._file is None:
+            raise RuntimeError("Ingest pipeline is not running")
+        if self._broken is not None:
+            raise RuntimeError("Ingest write-ahead log failed; restart to recover")
+        now_us = (datetime.utcnow() - EPOCH) // timedelta(microseconds=1)
+        reasons = validate_events(batch, now_us)
+        counts = {
+            REASONS[code - 1]: count
+            for code, count in enumerate(np.bincount(reasons, minlength=len(REASONS) + 1).tolist())
+            if code and count
+        }
+        valid = np.flatnonzero(reasons == 0)
+        strings = batch.strings
+        digests = np.array(
+            [proof_digest(strings[i]) for i in batch.records["proof"][valid].tolist()], np.uint64
+        )
+        # First occurrence of each proof in the batch, then proofs not seen before
+        _, first = np.unique(digests, return_index=True)
+        first.sort()
+        claims = digests[first].tolist()
+        fresh = np.array(self.proofs.reserve(claims), bool)
+        accepted = valid[first[fresh]] if len(first) else valid[:0]
+        claims = [d for d, new in zip(claims, fresh.tolist()) if new]
+        counts["accepted"] = len(accepted)
+        counts["duplicates"] = len(valid) - len(accepted)
+        for outcome, count in counts.items():
+            INGEST_EVENTS.inc(outcome, amount=count)
+        if not len(accepted):
+            return counts, None
+
+        try:
+            payload = encode_events(batch.select(accepted))
+            frame = _FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+            await self._reserve(len(frame))
+        except BaseException:
+            self.proofs.release(claims)
+            raise
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append(_Commit(frame, claims, future))
+        self._wake.set()
+        return counts, future
+
+    async def _reserve(self, size: int) -> None:
+        async with self._space:
+            try:
+                await asyncio.wait_for(
+                    self._space.wait_for(
+                        lambda: not self._pending_bytes
+                        or self._pending_bytes + size <= self.max_pending_bytes
+                    ),
+                    self.backpressure_timeout,
+                )
+            except asyncio.TimeoutError:
+                INGEST_EVENTS.inc("backpressure")
+                raise IngestBackpressureError(max(1, round(self.backpressure_timeout)))
+            self._pending_bytes += size
+
+    async def _release(self, size: int) -> None:
+        async with self._space:
+            self._pending_bytes -= size
+            self._space.notify_all()
+
+    # --- writer and applier ------------------------------------------------
+
+    def _append(self, data: bytes) -> None:
+        view = memoryview(data)
+        while view:
+            view = view[self._file.write(view):]
+        os.fsync(self._file.fileno())
+
+    def _rewind(self) -> None:
+        """Cut a failed group's partial write back off the log"""
+        self._file.truncate(self._written)
+        os.fsync(self._file.fileno())
+
+    async def _write_loop(self) -> None:
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            while self._queue:
+                group, self._queue = self._queue, []
+                data = b"".join(commit.frame for commit in group)
+                start = time.perf_counter()
+                self._writing = True
+                try:
+                    if self._broken is not None:
+                        raise self._broken
+                    await asyncio.to_thread(self._append, data)
+                except Exception as e:
+                    # Nothing in the group was acknowledged; let its proofs be retried
+                    for commit in group:
+                        self.proofs.release(commit.digests)
+                        commit.future.set_exception(e)
+                    await self._release(len(data))
+                    if self._broken is None:
+                        try:
+                            await asyncio.to_thread(self._rewind)
+                        except OSError as rewind_error:
+                            # Later frames would land behind a torn one: take no more
+                            logger.critical(
+                                "Could not truncate the ingest log back to offset %d",
+                                self._written,
+                                exc_info=True,
+                            )
+                            self._broken = rewind_error
+                    continue
+                finally:
+                    self._writing = False
+                INGEST_COMMIT.observe(time.perf_counter() - start)
+                self._stats["groups"] += 1
+                for commit in group:
+                    self.proofs.commit(commit.digests)
+                    self._written += len(commit.frame)
+                    self._stats["frames"] += 1
+                    if not commit.future.done():
+                        commit.future.set_result(self._written)
+                    self._applying.put_nowait((commit.frame, self._written))
+
+    async def _apply_loop(self) -> None:
+        while True:
+            frame, end = await self._applying.get()
+            delay = APPLY_RETRY_MIN
+            while True:
+                try:
+                    await self._apply(decode_events(frame, _FRAME.size)[0])
+                    break
+                except Exception:
+                    self._stats["apply_failures"] += 1
+                    logger.exception(
+                        "Could not apply the ingested batch ending at offset %d, retrying in %.1fs",
+                        end,
+                        delay,
+                    )
+                async with self._space:
+                    self._stalled = True
+                    self._space.notify_all()
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, APPLY_RETRY_MAX)
+            self._stalled = False
+            self._applied = end
+            if (
+                self._applying.empty()
+                or time.monotonic() - self._checkpointed_at >= CHECKPOINT_INTERVAL
+            ):
+                await self._checkpoint()
+            await self._release(len(frame))
+
+    async def _checkpoint(self) -> None:
+        """Sync the store and record the applied offset, if the store is durable"""
+        self._checkpointed_at = time.monotonic()
+        if not self.store.durable:
+            return
+        await asyncio.to_thread(self.store.sync)
+        self._write_offset(self._applied)
+        self._maybe_compact()
+
+    async def _apply(self, batch: EventBatch) -> None:
+        """Append the events to the store, one call per (user, region)"""
+        records, strings = batch.records, batch.strings
+        order = np.lexsort((records["region"], records["user"]))
+        users, regions = records["user"][order], records["region"][order]
+        bounds = np.flatnonzero(
+            np.r_[True, (users[1:] != users[:-1]) | (regions[1:] != regions[:-1]), True]
+        )
+        timestamps = records["timestamp"][order].tolist()
+        proofs = records["proof"][order].tolist()
+        artists = records["artist"][order].tolist()
+        action_codes = records["action"][order].tolist()
+        platform_codes = records["platform"][order].tolist()
+        verified = records["verified"][order].tolist()
+        changed: Dict[str, Optional[str]] = {}
+        for group, (start, end) in enumerate(zip(bounds[:-1].tolist(), bounds[1:].tolist())):
+            actions = [
+                ConvictionAction(
+                    action_type=ACTION_CODES[action_codes[i]],
+                    platform=PLATFORM_CODES[platform_codes[i]],
+                    timestamp=EPOCH + timedelta(microseconds=timestamps[i]),
+                    verified=bool(verified[i]),
+                    proof_hash=strings[proofs[i]],
+                    artist_name=strings[artists[i] - 1] if artists[i] else None,
+                )
+                for i in range(start, end)
+            ]
+            region = int(regions[start])
+            user_id = strings[users[start]]
+            changed[user_id] = strings[region - 1] if region else None
+            await self.store.append(user_id, actions, changed[user_id], rescore=False)
+            self._stats["events"] += end - start
+            if group % 256 == 255:
+                await asyncio.sleep(0)
+        await self.store.rescore(changed)
+
+    def _maybe_compact(self) -> None:
+        if not self.store.durable:
+            return  # the log is the only copy of what was ingested
+        if self._applied < self.compact_bytes or self._applied != self._written:
+            return
+        if self._writing or self._queue:
+            return
+        # Past this point the log cannot restore claims the index had not flushed
+        self.proofs.flush()
+        self._file.truncate(0)
+        self._file.seek(0)
+        self._written = self._applied = 0
+        self._write_offset(0)
+
+    def stats(self) -> dict:
+        return {
+            "running": bool(self._tasks),
+            "wal_bytes": self._written,
+            "applied_offset": self._applied,
+            "pending_bytes": self._pending_bytes,
+            "group_commits": self._stats["groups"],
+            "batches": self._stats["frames"],
+            "applied_events": self._stats["events"],
+            "apply_failures": self._stats["apply_failures"],
+            "apply_stalled": self._stalled,
+            "wal_failed": self._broken is not None,
+            "known_proofs": len(self.proofs),
+        }
+
+
+ingest_pipeline = IngestPipeline(
+    settings.INGEST_WAL_DIR,
+    action_store,
+    proof_index,
+    max_pending_bytes=settings.INGEST_MAX_PENDING_MB * 1024 * 1024,
+    backpressure_timeout=settings.INGEST_BACKPRESSURE_TIMEOUT_MS / 1000,
+)
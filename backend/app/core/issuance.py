@@ -0,0 +1,346 @@
+"""
+Palmlion Issuance Pipeline
+Idempotent, batched fractional IP mint triggers to Issuance
+"""
+import asyncio
+import hashlib
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.lazy import lazy_import
+from app.core.retry import backoff_delay, is_retryable_status
+from app.core.state import StateBackend, state_backend
+
+httpx = lazy_import("httpx")
+
+# State backend namespace of mint records, keyed by mint id
+MINTS = "mints"
+
+
+class MintStatus(str, Enum):
+    """Mint request lifecycle"""
+    QUEUED = "queued"
+    SUBMITTED = "submitted"
+    MINTED = "minted"
+    REJECTED = "rejected"
+    FAILED = "failed"
+
+
+def mint_id_for(user_id: str, completion_id: str) -> str:
+    """Mint id of a completion; the same on every worker and after restarts"""
+    key = "\x1f".join((user_id, completion_id))
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
+@dataclass
+class MintRequest:
+    """A fractional stake mint triggered by a mission completion"""
+    user_id: str
+    artist_name: str
+    completion_id: str
+    stake_percentage: float
+    wallet_address: str
+    mint_id: str = ""
+    status: MintStatus = MintStatus.QUEUED
+    attempts: int = 0
+    issuance_id: Optional[str] = None
+    error: Optional[str] = None
+    created_at: str = field(default_factory=lambda: datetime.utcnow().isoformat())
+    updated_at: str = field(default_factory=lambda: datetime.utcnow().isoformat())
+
+    def __post_init__(self):
+        if not self.mint_id:
+            self.mint_id = mint_id_for(self.user_id, self.completion_id)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "MintRequest":
+        return cls(**{**data, "status": MintStatus(data["status"])})
+
+    def to_issuance(self) -> dict:
+        return {
+            "source": "palmlion",
+            "idempotency_key": self.mint_id,
+            "user_id": self.user_id,
+            "artist_name": self.artist_name,
+            "completion_id": self.completion_id,
+            "stake_percentage": self.stake_percentage,
+            "wallet_address": self.wallet_address,
+            "timestamp": self.created_at,
+        }
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        data["status"] = self.status.value
+        return data
+
+
+class MintQueueFullError(Exception):
+    """Raised when the mint queue cannot take more requests"""
+
+
+class MintPipeline:
+    """
+    Deduplicating mint queue in front of the Issuance API
+
+    A mint's id is a hash of (user, completion), and it is the
+    per-item idempotency key sent to Issuance, so a retried batch, a
+    trigger repeated after a restart or one arriving at another worker all
+    name the same mint. trigger() claims the mint record in the shared
+    state backend and returns the existing mint for a repeated call; new
+    mints are queued and the caller returns immediately. A mint left
+    queued or submitted for stale_after seconds (its worker went away) is
+    queued again by the next trigger, which Issuance deduplicates. A
+    worker posts queued mints to the Issuance batch endpoint over a pooled
+    client. Records expire after record_ttl seconds. Without an API URL
+    the pipeline runs in demo mode and marks mints as minted locally.
+    """
+
+    def __init__(
+        self,
+        backend: StateBackend,
+        api_url: str,
+        api_key: str,
+        batch_size: int = 200,
+        batch_window: float = 0.1,
+        max_in_flight: int = 4,
+        max_retries: int = 6,
+        max_queue: int = 50_000,
+        record_ttl: int = 30 * 86400,
+        stale_after: float = 300.0,
+    ):
+        self.backend = backend
+        self.api_url = api_url
+        self.api_key = api_key
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.max_queue = max_queue
+        self.record_ttl = record_ttl
+        self.stale_after = stale_after
+
+        self._counts: Dict[str, int] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._in_flight: Optional[asyncio.Semaphore] = None
+        self._pending: set = set()
+
+    @property
+    def demo_mode(self) -> bool:
+        return not (self.api_url and self.api_key)
+
+    async def start(self, transport: Optional["httpx.AsyncBaseTransport"] = None) -> None:
+        """Start the worker; pass a transport to run against a local stand-in"""
+        if self._worker is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._in_flight = asyncio.Semaphore(self.max_in_flight)
+        self._client = httpx.AsyncClient(
+            transport=transport,
+            timeout=httpx.Timeout(30.0, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=self.max_in_flight,
+                max_keepalive_connections=self.max_in_flight,
+            ),
+            headers={"Authorization": f"Bearer {self.api_key}"},
+        )
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Submit queued mints, then close the pooled client"""
+        if self._worker is None:
+            return
+        while True:
+            await self._queue.join()
+            if not self._pending:
+                break
+            await asyncio.gather(*list(self._pending), return_exceptions=True)
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        await self._client.aclose()
+        self._worker = None
+        self._client = None
+
+    async def trigger(
+        self,
+        user_id: str,
+        artist_name: str,
+        completion_id: str,
+        stake_percentage: float,
+        wallet_address: str,
+    ) -> Tuple[MintRequest, bool]:
+        """Queue a mint unless one exists for this completion; returns (mint, created)"""
+        if self._queue is None:
+            raise MintQueueFullError("Mint pipeline is not running")
+        if self._queue.full():
+            raise MintQueueFullError("Mint queue is full")
+        mint = MintRequest(user_id, artist_name, completion_id, stake_percentage, wallet_address)
+
+        while not await self.backend.set_if_absent(
+            MINTS, mint.mint_id, mint.to_dict(), ttl=self.record_ttl
+        ):
+            data = await self.backend.get(MINTS, mint.mint_id)
+            if data is None:
+                continue  # expired in between; claim it afresh
+            existing = MintRequest.from_dict(data)
+            if self._is_stale(existing):
+                await self._update(existing, MintStatus.QUEUED, error="Requeued after a stall")
+                self._enqueue(existing)
+            return existing, False
+
+        try:
+            self._enqueue(mint)
+        except MintQueueFullError:
+            await self.backend.delete(MINTS, mint.mint_id)
+            raise
+        self._count(None, mint.status)
+        return mint, True
+
+    async def get(self, mint_id: str) -> Optional[MintRequest]:
+        data = await self.backend.get(MINTS, mint_id)
+        return MintRequest.from_dict(data) if data is not None else None
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue else 0,
+            "in_flight_batches": len(self._pending),
+            "by_status": dict(self._counts),
+            "mode": "demo" if self.demo_mode else "live",
+        }
+
+    def _enqueue(self, mint: MintRequest) -> None:
+        try:
+            self._queue.put_nowait(mint)
+        except asyncio.QueueFull:
+            raise MintQueueFullError("Mint queue is full")
+
+    def _is_stale(self, mint: MintRequest) -> bool:
+        if mint.status not in (MintStatus.QUEUED, MintStatus.SUBMITTED):
+            return False
+        age = datetime.utcnow() - datetime.fromisoformat(mint.updated_at)
+        return age > timedelta(seconds=self.stale_after)
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                await asyncio.sleep(min(remaining, 0.01))
+
+            await self._in_flight.acquire()
+            task = asyncio.create_task(self._submit(batch))
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+            for _ in batch:
+                self._queue.task_done()
+
+    async def _submit(self, batch: List[MintRequest]) -> None:
+        try:
+            for mint in batch:
+                mint.attempts += 1
+                await self._update(mint, MintStatus.SUBMITTED)
+
+            if self.demo_mode:
+                for mint in batch:
+                    await self._update(
+                        mint, MintStatus.MINTED, issuance_id=f"demo-{mint.mint_id}"
+                    )
+                return
+
+            try:
+                response = await self._client.post(
+                    f"{self.api_url}/api/v1/mint/fractional/batch",
+                    json={"mints": [m.to_issuance() for m in batch]},
+                )
+            except httpx.HTTPError as e:
+                await self._retry(batch, str(e))
+                return
+
+            if response.status_code >= 400:
+                error = f"API error: {response.status_code}"
+                if is_retryable_status(response.status_code):
+                    await self._retry(batch, error)
+                else:
+                    for mint in batch:
+                        await self._update(mint, MintStatus.REJECTED, error=error)
+                return
+
+            try:
+                payload = response.json()
+                results = {r.get("idempotency_key"): r for r in payload.get("results", [])}
+            except (ValueError, AttributeError):
+                # Resending is safe: Issuance drops keys it has already minted
+                await self._retry(batch, "Unreadable Issuance response")
+                return
+            retry = []
+            for mint in batch:
+                result = results.get(mint.mint_id)
+                if result is None:
+                    retry.append(mint)
+                elif result.get("status") == "minted":
+                    await self._update(
+                        mint, MintStatus.MINTED, issuance_id=result.get("mint_id"), error=None
+                    )
+                else:
+                    await self._update(mint, MintStatus.REJECTED, error=result.get("error"))
+            if retry:
+                await self._retry(retry, "Missing from Issuance response")
+        finally:
+            self._in_flight.release()
+
+    async def _retry(self, batch: List[MintRequest], error: str) -> None:
+        for mint in batch:
+            if mint.attempts > self.max_retries:
+                await self._update(mint, MintStatus.FAILED, error=error)
+                continue
+            await self._update(mint, MintStatus.QUEUED, error=error)
+            task = asyncio.create_task(self._requeue_later(mint))
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+
+    async def _requeue_later(self, mint: MintRequest) -> None:
+        await asyncio.sleep(backoff_delay(mint.attempts - 1, base=1.0, cap=60.0))
+        try:
+            self._queue.put_nowait(mint)
+        except asyncio.QueueFull:
+            await self._update(mint, MintStatus.FAILED, error="Mint queue is full")
+
+    async def _update(self, mint: MintRequest, status: MintStatus, **fields) -> None:
+        self._count(mint.status, status)
+        mint.status = status
+        for name, value in fields.items():
+            setattr(mint, name, value)
+        mint.updated_at = datetime.utcnow().isoformat()
+        await self.backend.set(MINTS, mint.mint_id, mint.to_dict(), ttl=self.record_ttl)
+
+    def _count(self, old: Optional[MintStatus], new: MintStatus) -> None:
+        """Mints this node has handled, by their current status"""
+        if old is not None and self._counts.get(old.value):
+            self._counts[old.value] -= 1
+        self._counts[new.value] = self._counts.get(new.value, 0) + 1
+
+
+mint_pipeline = MintPipeline(
+    state_backend,
+    api_url=settings.ISSUANCE_API_URL,
+    api_key=settings.ISSUANCE_API_KEY,
+    batch_size=settings.MINT_BATCH_SIZE,
+    max_in_flight=settings.MINT_MAX_IN_FLIGHT,
+    record_ttl=settings.MINT_RECORD_TTL_DAYS * 86400,
+)
@@ -0,0 +1,30 @@
+"""
+Palmlion Lazy Imports
+Defer heavy third-party imports until first attribute access
+"""
+import importlib.util
+import sys
+from types import ModuleType
+
+
+def lazy_import(name: str) -> ModuleType:
+    """
+    Module object that is only executed when an attribute is first read
+
+    Uses importlib's LazyLoader, so `np = lazy_import("numpy")` costs a
+    spec lookup at import time and the real import happens on the first
+    `np.` access. Annotations evaluated at definition time count as an
+    access; quote them.
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
@@ -0,0 +1,84 @@
+"""
+Palmlion Leaderboard
+Ranked conviction scores per region, pushed to realtime subscribers
+"""
+import hashlib
+from typing import Dict, Optional
+
+from app.core.analytics import RegionalAnalytics
+from app.core.config import settings
+from app.core.conviction import ConvictionScore, determine_conviction_tier
+from app.core.realtime import RealtimeHub, realtime_hub
+from app.core.state import USERS, StateBackend, state_backend
+
+# State backend namespace of the ranked sets, one per region and "all"
+LEADERBOARD = "leaderboard"
+ALL = "all"
+
+
+def display_name(user_id: str, user: Optional[dict]) -> str:
+    """Public name of a fan: their Telegram username, or a pseudonym that is not their id"""
+    username = (user or {}).get("telegram_username")
+    if username:
+        return username
+    return "fan-" + hashlib.sha256(user_id.encode()).hexdigest()[:10]
+
+
+class Leaderboard:
+    """
+    Conviction rankings in the shared state backend
+
+    update() moves rescored fans in the "all" ranking and in their
+    region's, then pushes the fan's new score and tier to their own
+    "user:{id}" topic. A leaderboard topic with subscribers gets the
+    board's current top `size` as {"top": [...]}: one fan's move shifts
+    the ranks of everyone they pass, so a diff of the movers alone would
+    leave the others stale. Leaderboard topics are public, so entries
+    carry a display name and rank, never a user id.
+    """
+
+    def __init__(self, backend: StateBackend, hub: RealtimeHub, size: int = 50):
+        self.backend = backend
+        self.hub = hub
+        self.size = size
+
+    async def update(
+        self, scores: Dict[str, ConvictionScore], regions: Dict[str, Optional[str]]
+    ) -> None:
+        for user_id, score in scores.items():
+            self.hub.publish(
+                f"user:{user_id}", {"conviction": {"score": score.score, "tier": score.tier}}
+            )
+        await self.rank({user_id: score.score for user_id, score in scores.items()}, regions)
+
+    async def rank(self, scores: Dict[str, float], regions: Dict[str, Optional[str]]) -> None:
+        """Move fans to new scores on the boards, without the per-fan updates"""
+        if not scores:
+            return
+        boards: Dict[str, Dict[str, float]] = {ALL: {}}
+        for user_id, score in scores.items():
+            boards[ALL][user_id] = score
+            region = RegionalAnalytics.normalize(regions.get(user_id))
+            if region is not None:
+                boards.setdefault(region, {})[user_id] = score
+        for board, members in boards.items():
+            await self.backend.set_scores(LEADERBOARD, board, members)
+            if self.hub.has_subscribers(f"leaderboard:{board}"):
+                self.hub.publish(f"leaderboard:{board}", {"top": await self.top(board)})
+
+    async def top(self, board: str) -> list:
+        """The board's leading fans, by display name"""
+        top = await self.backend.get_top(LEADERBOARD, board, self.size)
+        users = await self.backend.get_many(USERS, [user_id for user_id, _ in top])
+        return [
+            {
+                "rank": rank,
+                "display_name": display_name(user_id, users.get(user_id)),
+                "score": score,
+                "tier": determine_conviction_tier(score),
+            }
+            for rank, (user_id, score) in enumerate(top, 1)
+        ]
+
+
+leaderboard = Leaderboard(state_backend, realtime_hub, size=settings.REALTIME_LEADERBOARD_SIZE)
@@ -0,0 +1,165 @@
+"""
+Palmlion Mission Lifecycle
+Hashed timer wheel that expires missions when they come due
+"""
+import asyncio
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from app.core.config import settings
+
+# Listener signature: (event, mission_id, payload)
+LifecycleListener = Callable[[str, str, dict], None]
+
+MISSION_EXPIRED = "mission.expired"
+MISSION_COMPLETED = "mission.completed"
+
+
+@dataclass
+class _Timer:
+    mission_id: str
+    rounds: int
+    cancelled: bool = False
+
+
+class TimerWheel:
+    """
+    Hashed timing wheel (Varghese & Lauck, scheme 6)
+
+    schedule() and cancel() are O(1). Each tick only visits the timers
+    hashed into the current slot; timers further out than one revolution
+    carry a round counter instead of being rescanned as a whole catalog.
+    """
+
+    def __init__(self, tick_seconds: float = 1.0, slots: int = 3600):
+        self.tick_seconds = tick_seconds
+        self.slots = slots
+        self._wheel: List[Dict[str, _Timer]] = [{} for _ in range(slots)]
+        self._timers: Dict[str, _Timer] = {}
+        self._cursor = 0
+        self._started_at = time.monotonic()
+        self._ticks = 0
+
+    def __len__(self) -> int:
+        return len(self._timers)
+
+    def schedule(self, key: str, delay_seconds: float) -> None:
+        """Fire `key` after roughly delay_seconds, replacing any earlier timer"""
+        self.cancel(key)
+        ticks = max(1, int(delay_seconds / self.tick_seconds + 0.999))
+        rounds, offset = divmod(ticks - 1, self.slots)
+        timer = _Timer(key, rounds)
+        self._wheel[(self._cursor + 1 + offset) % self.slots][key] = timer
+        self._timers[key] = timer
+
+    def cancel(self, key: str) -> bool:
+        timer = self._timers.pop(key, None)
+        if timer is None:
+            return False
+        timer.cancelled = True
+        return True
+
+    def due_ticks(self) -> int:
+        """Ticks owed since the last advance, based on the monotonic clock"""
+        elapsed = time.monotonic() - self._started_at
+        return int(elapsed / self.tick_seconds) - self._ticks
+
+    def advance(self, ticks: int = 1) -> List[str]:
+        """Move the wheel forward and return the keys that came due"""
+        fired = []
+        for _ in range(ticks):
+            self._ticks += 1
+            self._cursor = (self._cursor + 1) % self.slots
+            slot = self._wheel[self._cursor]
+            for key, timer in list(slot.items()):
+                if timer.cancelled:
+                    del slot[key]
+                elif timer.rounds > 0:
+                    timer.rounds -= 1
+                else:
+                    del slot[key]
+                    self._timers.pop(key, None)
+                    fired.append(key)
+        return fired
+
+
+class MissionLifecycle:
+    """
+    Drives mission status transitions off the request path
+
+    Expiry times are parsed once when a mission is scheduled; when a timer
+    fires the lifecycle calls the registered listeners, which flip the
+    catalog snapshot, freeze progress and notify subscribers. Handlers only
+    read the precomputed status.
+    """
+
+    def __init__(self, wheel: Optional[TimerWheel] = None):
+        self.wheel = wheel or TimerWheel()
+        self._listeners: List[LifecycleListener] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def add_listener(self, listener: LifecycleListener) -> None:
+        self._listeners.append(listener)
+
+    def schedule_expiry(self, mission_id: str, expires_at: Optional[str]) -> bool:
+        """
+        Schedule a mission's expiry from its ISO timestamp
+
+        Returns True when the mission is already past due, so the caller
+        can expire it immediately.
+        """
+        if not expires_at:
+            self.wheel.cancel(mission_id)
+            return False
+        delay = (datetime.fromisoformat(expires_at) - datetime.utcnow()).total_seconds()
+        if delay <= 0:
+            self.wheel.cancel(mission_id)
+            return True
+        self.wheel.schedule(mission_id, delay)
+        return False
+
+    def cancel(self, mission_id: str) -> None:
+        self.wheel.cancel(mission_id)
+
+    def emit(self, event: str, mission_id: str, payload: Optional[dict] = None) -> None:
+        for listener in self._listeners:
+            listener(event, mission_id, payload or {})
+
+    def tick(self) -> List[str]:
+        """Advance the wheel to now and expire everything that came due"""
+        due = self.wheel.due_ticks()
+        if due <= 0:
+            return []
+        expired = self.wheel.advance(due)
+        for mission_id in expired:
+            self.emit(MISSION_EXPIRED, mission_id)
+        return expired
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.wheel.tick_seconds)
+            self.tick()
+
+
+mission_lifecycle = MissionLifecycle(
+    TimerWheel(
+        tick_seconds=settings.MISSION_WHEEL_TICK_SECONDS,
+        slots=settings.MISSION_WHEEL_SLOTS,
+    )
+)
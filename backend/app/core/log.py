@@ -0,0 +1,70 @@
+"""
+Palmlion Logging
+Structured JSON logs written off the request path through a queue
+"""
+import json
+import logging
+import logging.handlers
+import queue
+from datetime import datetime, timezone
+from typing import Optional
+
+# Attributes every LogRecord has; anything else came in through `extra`
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line with the record's extra fields inlined"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, separators=(",", ":"))
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue the raw record; formatting happens on the listener thread"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def setup_logging(level: str = "INFO", access_log: bool = True) -> None:
+    """Route the palmlion loggers through a queue to a JSON stdout handler"""
+    global _listener
+    if _listener is not None:
+        return
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    stream = logging.StreamHandler()
+    stream.setFormatter(JSONFormatter())
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+
+    logger = logging.getLogger("palmlion")
+    logger.setLevel(level)
+    logger.handlers = [_DeferredQueueHandler(log_queue)]
+    logger.propagate = False
+
+    if not access_log:
+        logging.getLogger("palmlion.access").setLevel(logging.WARNING)
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,324 @@
+"""
+Palmlion Metrics
+Low-overhead counters, gauges and histograms exposed in Prometheus text format
+"""
+import asyncio
+import functools
+import logging
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Sequence, Tuple
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Latency buckets in seconds, tuned for API handlers and provider calls
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Monotonic counter keyed by label values"""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+            for labels, value in list(self._values.items())
+        ]
+
+
+class Gauge(Counter):
+    """Value that can go up and down"""
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+    def set(self, value: float, *labels: str) -> None:
+        self._values[labels] = value
+
+
+class Histogram(_Metric):
+    """
+    Cumulative-bucket histogram keyed by label values
+
+    observe() is a bisect and two increments; bucket counts are stored
+    non-cumulatively and summed only when rendered.
+    """
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            # bucket counts, then +Inf, then sum
+            series = self._series.setdefault(labels, [0] * (len(self.buckets) + 2))
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def time(self, *labels: str) -> Callable:
+        """Decorator timing a sync or async function into this histogram"""
+        def decorator(func: Callable) -> Callable:
+            if asyncio.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    start = time.perf_counter()
+                    try:
+                        return await func(*args, **kwargs)
+                    finally:
+                        self.observe(time.perf_counter() - start, *labels)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(time.perf_counter() - start, *labels)
+            return wrapper
+        return decorator
+
+    def render(self) -> List[str]:
+        lines = []
+        for labels, series in list(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = _format_labels(self.labelnames, labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            cumulative += series[len(self.buckets)]
+            inf = _format_labels(self.labelnames, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{inf} {cumulative}")
+            plain = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{plain} {series[-1]}")
+            lines.append(f"{self.name}_count{plain} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Collection of metrics rendered together on /metrics"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.setdefault(metric.name, metric)
+        return self._metrics[metric.name]
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.header())
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# HTTP
+HTTP_REQUESTS = REGISTRY.counter(
+    "palmlion_http_requests_total", "HTTP requests by route and status",
+    ("method", "route", "status"),
+)
+HTTP_LATENCY = REGISTRY.histogram(
+    "palmlion_http_request_duration_seconds", "HTTP request latency by route",
+    ("method", "route"),
+)
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    "palmlion_http_requests_in_flight", "HTTP requests currently being handled",
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    "palmlion_response_cache_requests_total", "Response cache lookups by route and result",
+    ("route", "result"),
+)
+
+# Admission control
+ADMISSION_LIMIT = REGISTRY.gauge(
+    "palmlion_admission_limit", "Current adaptive concurrency limit by route class",
+    ("route_class",),
+)
+ADMISSION_QUEUED = REGISTRY.gauge(
+    "palmlion_admission_queued", "Requests waiting for admission by route class",
+    ("route_class",),
+)
+ADMISSION_SHED = REGISTRY.counter(
+    "palmlion_admission_shed_total", "Requests rejected with 503 by route class and reason",
+    ("route_class", "reason"),
+)
+
+# Conviction scoring
+SCORING_LATENCY = REGISTRY.histogram(
+    "palmlion_conviction_scoring_seconds", "Time to calculate one conviction score",
+)
+
+# Trending
+TRENDING_EVENTS = REGISTRY.counter(
+    "palmlion_trending_events_total", "Events fed to the trending sketches by kind",
+    ("kind",),
+)
+
+# Provider verification
+VERIFICATION_LATENCY = REGISTRY.histogram(
+    "palmlion_verification_seconds", "Verification provider call latency",
+    ("provider",),
+)
+VERIFICATION_RESULTS = REGISTRY.counter(
+    "palmlion_verification_results_total", "Verification outcomes by provider",
+    ("provider", "outcome"),
+)
+
+# Export
+EXPORT_RECORDS = REGISTRY.counter(
+    "palmlion_export_records_total", "Convicta export records produced by format",
+    ("format",),
+)
+EXPORT_SERIALIZATION = REGISTRY.histogram(
+    "palmlion_export_serialization_seconds", "Export serialization time per chunk or snapshot",
+    ("format",),
+)
+
+# Bulk ingestion
+INGEST_EVENTS = REGISTRY.counter(
+    "palmlion_ingest_events_total", "Partner events received by outcome",
+    ("outcome",),
+)
+INGEST_COMMIT = REGISTRY.histogram(
+    "palmlion_ingest_commit_seconds", "Write-ahead log group commit time (write and fsync)",
+)
+
+# Proof dedup
+PROOF_LOOKUPS = REGISTRY.counter(
+    "palmlion_proof_lookups_total",
+    "Proof index lookups: new, duplicate, or a Bloom filter false positive",
+    ("outcome",),
+)
+
+
+def route_template(scope) -> str:
+    """
+    Path template for a matched request, e.g. /api/v1/missions/{mission_id}
+
+    Built from the concrete path by putting placeholders back where path
+    parameters matched, which works regardless of how routers are nested.
+    """
+    if scope.get("route") is None:
+        return "unmatched"
+    params = scope.get("path_params") or {}
+    if not params:
+        return scope["path"]
+    names = {str(value): name for name, value in params.items()}
+    return "/".join(
+        "{" + names[segment] + "}" if segment in names else segment
+        for segment in scope["path"].split("/")
+    )
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording per-route latency, status counts and in-flight requests
+
+    Routes are labelled by their path template (e.g. /api/v1/missions/{mission_id})
+    so label cardinality stays bounded. Timing uses the monotonic clock.
+    Access log records go to the "palmlion.access" logger as structured fields.
+    """
+
+    def __init__(self, app, exclude_paths: Sequence[str] = ("/metrics", "/health")):
+        self.app = app
+        self.exclude_paths = set(exclude_paths)
+        self.access_log = logging.getLogger("palmlion.access")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start
+            HTTP_IN_FLIGHT.dec()
+            route_path = route_template(scope)
+            method = scope["method"]
+            HTTP_LATENCY.observe(duration, method, route_path)
+            HTTP_REQUESTS.inc(method, route_path, str(status_code))
+            if self.access_log.isEnabledFor(logging.INFO):
+                self.access_log.info(
+                    "request",
+                    extra={
+                        "method": method,
+                        "path": scope["path"],
+                        "route": route_path,
+                        "status": status_code,
+                        "duration_ms": round(duration * 1000, 3),
+                    },
+                )
@@ -0,0 +1,168 @@
+"""
+Palmlion Mission Catalog
+Indexed #PalmDash missions with precomputed filtered views
+"""
+from dataclasses import dataclass, field, fields, replace
+from threading import RLock
+from types import MappingProxyType
+from typing import Dict, Iterable, Mapping, Optional, Tuple
+
+# Fields missions can be filtered on, matched case-insensitively
+INDEXED_FIELDS = ("platform", "mission_type", "artist_name", "status")
+
+
+@dataclass(frozen=True)
+class MissionSnapshot:
+    """Immutable view of a mission; updates replace the snapshot"""
+    id: str
+    title: str
+    description: str
+    artist_name: str
+    mission_type: str
+    platform: str
+    threshold: int
+    reward_conviction_points: int
+    reward_multiplier: float
+    expires_at: Optional[str]
+    status: str
+    participants: int
+    payload: Mapping = field(init=False, compare=False, repr=False)
+
+    def __post_init__(self):
+        data = {f.name: getattr(self, f.name) for f in fields(self) if f.name != "payload"}
+        object.__setattr__(self, "payload", MappingProxyType(data))
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "MissionSnapshot":
+        return cls(**{name: data[name] for name in cls.field_names()})
+
+    @staticmethod
+    def field_names() -> Tuple[str, ...]:
+        return tuple(f.name for f in fields(MissionSnapshot) if f.name != "payload")
+
+    def to_dict(self) -> dict:
+        """Fresh mutable copy, safe to decorate per request"""
+        return dict(self.payload)
+
+
+@dataclass(frozen=True)
+class MissionView:
+    """Precomputed result of a catalog query"""
+    missions: Tuple[MissionSnapshot, ...]
+    active: int
+
+
+EMPTY_VIEW = MissionView(missions=(), active=0)
+
+
+class MissionCatalog:
+    """
+    Mission store with per-field indexes
+
+    Each indexed field maps a lowercased value to the ids carrying it.
+    Query results are cached per filter combination and dropped whenever
+    a mission changes, so repeated feed reads are a single dict lookup.
+    """
+
+    def __init__(self, missions: Iterable[dict] = ()):
+        self._lock = RLock()
+        self._missions: Dict[str, MissionSnapshot] = {}
+        self._position: Dict[str, int] = {}
+        self._indexes: Dict[str, Dict[str, Dict[str, None]]] = {f: {} for f in INDEXED_FIELDS}
+        self._views: Dict[tuple, MissionView] = {}
+        self.version = 0
+        for mission in missions:
+            self.upsert(mission)
+
+    def __len__(self) -> int:
+        return len(self._missions)
+
+    def __contains__(self, mission_id: str) -> bool:
+        return mission_id in self._missions
+
+    def get(self, mission_id: str) -> Optional[MissionSnapshot]:
+        return self._missions.get(mission_id)
+
+    def upsert(self, mission: dict) -> MissionSnapshot:
+        """Insert or replace a mission from its dict form"""
+        return self._store(MissionSnapshot.from_dict(mission))
+
+    def update(self, mission_id: str, **changes) -> Optional[MissionSnapshot]:
+        """Replace a mission with some fields changed"""
+        with self._lock:
+            current = self._missions.get(mission_id)
+            if current is None:
+                return None
+            return self._store(replace(current, **changes))
+
+    def query(
+        self,
+        platform: Optional[str] = None,
+        mission_type: Optional[str] = None,
+        artist_name: Optional[str] = None,
+        status: Optional[str] = None,
+    ) -> MissionView:
+        """Missions matching every given filter, in catalog order"""
+        key = tuple(
+            value.lower() if value else None
+            for value in (platform, mission_type, artist_name, status)
+        )
+        view = self._views.get(key)
+        if view is not None:
+            return view
+
+        with self._lock:
+            buckets = []
+            for name, value in zip(INDEXED_FIELDS, key):
+                if value is None:
+                    continue
+                bucket = self._indexes[name].get(value)
+                if not bucket:
+                    # Unknown values are not cached so arbitrary input cannot grow the cache
+                    return EMPTY_VIEW
+                buckets.append(bucket)
+
+            if buckets:
+                buckets.sort(key=len)
+                smallest, rest = buckets[0], buckets[1:]
+                ids = [i for i in smallest if all(i in b for b in rest)]
+                ids.sort(key=self._position.__getitem__)
+            else:
+                ids = list(self._missions)
+
+            missions = tuple(self._missions[i] for i in ids)
+            view = MissionView(
+                missions=missions,
+                active=sum(1 for m in missions if m.status == "active"),
+            )
+            self._views[key] = view
+            return view
+
+    def _store(self, snapshot: MissionSnapshot) -> MissionSnapshot:
+        with self._lock:
+            previous = self._missions.get(snapshot.id)
+            if previous is not None:
+                self._unindex(previous)
+            else:
+                self._position[snapshot.id] = len(self._position)
+
+            self._missions[snapshot.id] = snapshot
+            for name in INDEXED_FIELDS:
+                value = getattr(snapshot, name)
+                if value:
+                    self._indexes[name].setdefault(value.lower(), {})[snapshot.id] = None
+
+            self._views = {}
+            self.version += 1
+            return snapshot
+
+    def _unindex(self, snapshot: MissionSnapshot) -> None:
+        for name in INDEXED_FIELDS:
+            value = getattr(snapshot, name)
+            if not value:
+                continue
+            bucket = self._indexes[name].get(value.lower())
+            if bucket is not None:
+                bucket.pop(snapshot.id, None)
+                if not bucket:
+                    del self._indexes[name][value.lower()]
@@ -0,0 +1,395 @@
+"""
+Palmlion Convicta Outbox
+Durable append-only outbox drained by a batching webhook pusher
+"""
+import asyncio
+import fcntl
+import hashlib
+import itertools
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+from uuid import uuid4
+
+from app.core.config import settings
+from app.core.lazy import lazy_import
+from app.core.retry import backoff_delay, is_retryable_status
+
+httpx = lazy_import("httpx")
+
+logger = logging.getLogger("palmlion.outbox")
+
+LOG_FILE = "outbox.log"
+OFFSET_FILE = "outbox.offset"
+DEAD_LETTER_FILE = "outbox.dead"
+LOCK_FILE = "outbox.lock"
+SLOT_PREFIX = "worker-"
+
+
+@dataclass
+class OutboxEntry:
+    """A record read back from the log with its byte range"""
+    id: str
+    record: dict
+    start: int
+    end: int
+
+
+class Outbox:
+    """
+    Append-only JSONL log with a committed byte offset
+
+    Records are fsynced before append() returns, so an acknowledged push
+    survives a crash. Everything after the committed offset is replayed
+    on restart; a line torn by a crash mid-append was never acknowledged
+    and is trimmed on open, and a line that does not decode is moved to
+    the dead-letter file. Once the reader has committed the whole file it
+    is truncated, which keeps the log from growing without bound.
+
+    Every process gets a log of its own: open() takes an exclusive lock
+    on the first free "worker-N" slot under directory and keeps it until
+    close(). A restarted process picks up a free slot, and with it the
+    records its previous owner had not pushed yet.
+    """
+
+    def __init__(self, directory: str, compact_bytes: int = 64 * 1024 * 1024):
+        self.directory = Path(directory)
+        self.compact_bytes = compact_bytes
+        self._lock = threading.Lock()
+        self._slot: Optional[Path] = None
+        self._slot_lock = None
+        self._file = None
+        self._read_offset = 0
+        self._committed = 0
+
+    def open(self) -> None:
+        if self._file is not None:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._slot = self._claim_slot()
+        size = _trim_torn_line(self._slot / LOG_FILE)
+        self._file = open(self._slot / LOG_FILE, "ab")
+        offset_path = self._slot / OFFSET_FILE
+        self._committed = 0
+        if offset_path.exists():
+            self._committed = min(int(offset_path.read_text() or 0), size)
+        self._read_offset = self._committed
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._slot_lock is not None:
+            self._slot_lock.close()  # releases the slot
+            self._slot_lock = None
+
+    def _claim_slot(self) -> Path:
+        for number in itertools.count():
+            slot = self.directory / f"{SLOT_PREFIX}{number}"
+            slot.mkdir(exist_ok=True)
+            lock = open(slot / LOCK_FILE, "ab")
+            try:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock.close()
+                continue
+            self._slot_lock = lock
+            return slot
+
+    @property
+    def committed_offset(self) -> int:
+        return self._committed
+
+    def append_many(self, records: List[dict]) -> List[str]:
+        """Durably append records; returns their outbox ids"""
+        ids = [uuid4().hex for _ in records]
+        data = b"".join(
+            json.dumps({"id": i, "record": r}, separators=(",", ":")).encode() + b"\n"
+            for i, r in zip(ids, records)
+        )
+        with self._lock:
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        return ids
+
+    def append(self, record: dict) -> str:
+        return self.append_many([record])[0]
+
+    def read_pending(self, max_records: int) -> List[OutboxEntry]:
+        """
+        Read the next unread records past the read cursor
+
+        Undecodable lines are dead-lettered and folded into the byte range
+        of the next record, so committing that record skips them. Ones
+        with no record after them yet are left to a later read.
+        """
+        entries = []
+        undecodable: List[bytes] = []
+        with self._lock, open(self._slot / LOG_FILE, "rb") as f:
+            f.seek(self._read_offset)
+            start = f.tell()
+            while len(entries) < max_records:
+                line = f.readline()
+                if not line.endswith(b"\n"):
+                    break  # nothing more, or a write still in progress
+                try:
+                    data = json.loads(line)
+                    entry = OutboxEntry(data["id"], data["record"], start, f.tell())
+                except (ValueError, KeyError, TypeError):
+                    undecodable.append(line)
+                    continue
+                if undecodable:
+                    self._dead_letter_lines(undecodable)
+                    undecodable = []
+                entries.append(entry)
+                start = f.tell()
+            if entries:
+                self._read_offset = entries[-1].end
+        return entries
+
+    def commit(self, offset: int) -> None:
+        """Persist that everything before offset has been delivered"""
+        with self._lock:
+            self._committed = offset
+            self._write_offset(offset)
+            self._maybe_compact()
+
+    def dead_letter(self, entries: List[OutboxEntry], error: str) -> None:
+        with self._lock, open(self._slot / DEAD_LETTER_FILE, "ab") as f:
+            for entry in entries:
+                line = {"id": entry.id, "record": entry.record, "error": error}
+                f.write(json.dumps(line, separators=(",", ":")).encode() + b"\n")
+
+    def _dead_letter_lines(self, lines: List[bytes]) -> None:
+        """Keep undecodable log lines for inspection; called with the lock held"""
+        logger.warning("Dead-lettering %d undecodable outbox lines", len(lines))
+        with open(self._slot / DEAD_LETTER_FILE, "ab") as f:
+            for raw in lines:
+                line = {"raw": raw.decode(errors="replace"), "error": "Undecodable outbox line"}
+                f.write(json.dumps(line, separators=(",", ":")).encode() + b"\n")
+
+    def stats(self) -> dict:
+        size = self._file.tell() if self._file else 0
+        return {
+            "slot": self._slot.name if self._slot else None,
+            "log_bytes": size,
+            "committed_offset": self._committed,
+            "pending_bytes": size - self._committed,
+        }
+
+    def _write_offset(self, offset: int) -> None:
+        tmp = self._slot / (OFFSET_FILE + ".tmp")
+        tmp.write_text(str(offset))
+        os.replace(tmp, self._slot / OFFSET_FILE)
+
+    def _maybe_compact(self) -> None:
+        if self._committed < self.compact_bytes:
+            return
+        if self._committed != self._file.tell() or self._read_offset != self._committed:
+            return
+        self._file.truncate(0)
+        self._file.seek(0)
+        self._committed = self._read_offset = 0
+        self._write_offset(0)
+
+
+def _trim_torn_line(path: Path, chunk: int = 64 * 1024) -> int:
+    """Cut the file back to its last complete line; returns the new size"""
+    if not path.exists():
+        return 0
+    with open(path, "r+b") as f:
+        end = f.seek(0, os.SEEK_END)
+        keep = end
+        while keep > 0:
+            start = max(0, keep - chunk)
+            f.seek(start)
+            newline = f.read(keep - start).rfind(b"\n")
+            if newline >= 0:
+                keep = start + newline + 1
+                break
+            keep = start
+        if keep != end:
+            logger.warning("Trimming %d bytes of a torn outbox line", end - keep)
+            f.truncate(keep)
+            os.fsync(f.fileno())
+        return keep
+
+
+class ConvictaPusher:
+    """
+    Drains the outbox into the Convicta batch webhook
+
+    Records are posted in batches over one pooled client with a cap on
+    in-flight requests. Each batch carries an Idempotency-Key derived from
+    its outbox ids so Convicta can discard replays after a retry or a
+    restart. Retryable failures back off exponentially and never drop
+    data; rejected batches go to a dead-letter file. The committed offset
+    only advances over a contiguous run of delivered batches. Without an
+    API key (demo mode) batches are committed without a request, so the
+    log still drains and compacts.
+    """
+
+    def __init__(
+        self,
+        outbox: Outbox,
+        api_url: str,
+        api_key: str,
+        webhook_secret: str,
+        batch_size: int = 500,
+        max_in_flight: int = 4,
+        poll_interval: float = 0.5,
+    ):
+        self.outbox = outbox
+        self.api_url = api_url
+        self.api_key = api_key
+        self.webhook_secret = webhook_secret
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.poll_interval = poll_interval
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._in_flight: Optional[asyncio.Semaphore] = None
+        self._pending: set = set()
+        self._delivered: Dict[int, int] = {}
+        self._next_commit = 0
+        self._pushed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.api_url and self.api_key)
+
+    async def start(self, transport: Optional["httpx.AsyncBaseTransport"] = None) -> None:
+        """Start draining; pass a transport to run against a local stand-in"""
+        if self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._in_flight = asyncio.Semaphore(self.max_in_flight)
+        self._next_commit = self.outbox.committed_offset
+        self._client = httpx.AsyncClient(
+            transport=transport,
+            timeout=httpx.Timeout(30.0, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=self.max_in_flight,
+                max_keepalive_connections=self.max_in_flight,
+            ),
+            headers={
+                "Authorization": f"Bearer {self.api_key}",
+                "X-Webhook-Signature": self.webhook_secret,
+            },
+        )
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        # Unacknowledged batches stay past the committed offset and are resent on restart
+        for task in list(self._pending):
+            task.cancel()
+        await asyncio.gather(*self._pending, return_exceptions=True)
+        await self._client.aclose()
+        self._task = None
+
+    def notify(self) -> None:
+        """Wake the pusher after new records were appended"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "running": self._task is not None,
+            "in_flight_batches": len(self._pending),
+            "pushed_records": self._pushed,
+            **self.outbox.stats(),
+        }
+
+    async def _run(self) -> None:
+        while True:
+            await self._in_flight.acquire()
+            entries = await asyncio.to_thread(self.outbox.read_pending, self.batch_size)
+            if not entries:
+                self._in_flight.release()
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            task = asyncio.create_task(self._deliver(entries))
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+
+    async def _deliver(self, entries: List[OutboxEntry]) -> None:
+        try:
+            error = await self._post_with_retry(entries)
+            if error is not None:
+                await asyncio.to_thread(self.outbox.dead_letter, entries, error)
+            else:
+                self._pushed += len(entries)
+            await self._mark_done(entries[0].start, entries[-1].end)
+        finally:
+            self._in_flight.release()
+
+    async def _post_with_retry(self, entries: List[OutboxEntry]) -> Optional[str]:
+        """Post a batch until delivered; returns an error only for rejected batches"""
+        if not self.enabled:
+            return None
+        ids = [e.id for e in entries]
+        key = hashlib.sha256(",".join(ids).encode()).hexdigest()
+        body = {
+            "source": "palmlion",
+            "records": [{**e.record, "outbox_id": e.id} for e in entries],
+        }
+
+        attempt = 0
+        while True:
+            try:
+                response = await self._client.post(
+                    f"{self.api_url}/api/v1/webhooks/palmlion/conviction/batch",
+                    json=body,
+                    headers={"Idempotency-Key": key},
+                )
+                if response.status_code < 400:
+                    return None
+                if not is_retryable_status(response.status_code):
+                    return f"API error: {response.status_code}"
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(backoff_delay(attempt, base=1.0, cap=60.0))
+            attempt += 1
+
+    async def _mark_done(self, start: int, end: int) -> None:
+        self._delivered[start] = end
+        advanced = False
+        while self._next_commit in self._delivered:
+            self._next_commit = self._delivered.pop(self._next_commit)
+            advanced = True
+        if advanced:
+            await asyncio.to_thread(self.outbox.commit, self._next_commit)
+            # Compaction may have truncated the log back to offset 0
+            self._next_commit = self.outbox.committed_offset
+
+
+convicta_outbox = Outbox(settings.OUTBOX_DIR)
+
+convicta_pusher = ConvictaPusher(
+    convicta_outbox,
+    api_url=settings.CONVICTA_API_URL,
+    api_key=settings.CONVICTA_API_KEY,
+    webhook_secret=settings.CONVICTA_WEBHOOK_SECRET,
+    batch_size=settings.OUTBOX_BATCH_SIZE,
+    max_in_flight=settings.OUTBOX_MAX_IN_FLIGHT,
+)
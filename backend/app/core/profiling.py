@@ -0,0 +1,421 @@
+"""
+Palmlion Profiling
+On-demand sampling profiles and manual spans for live requests
+"""
+import asyncio
+import functools
+import hashlib
+import hmac
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from uuid import uuid4
+
+from app.core.config import settings
+
+PROFILE_HEADER = "X-Palmlion-Profile"
+PROFILE_ID_HEADER = "X-Palmlion-Profile-Id"
+
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+
+# (qualified name, file, first line) of one Python frame
+FrameKey = Tuple[str, str, int]
+
+# Number of running profiles; span() and traced() do nothing while this is zero
+_active = 0
+_current: ContextVar[Optional["Profile"]] = ContextVar("palmlion_profile", default=None)
+
+
+def sign_profile_token(secret: str, expires_at: int) -> str:
+    """Token for the profile header, valid until the given unix time"""
+    digest = hmac.new(secret.encode(), str(expires_at).encode(), hashlib.sha256).hexdigest()
+    return f"{expires_at}.{digest}"
+
+
+def verify_profile_token(secret: str, token: Optional[str], now: Optional[float] = None) -> bool:
+    if not token or "." not in token:
+        return False
+    expires, _, digest = token.partition(".")
+    if not expires.isdigit() or int(expires) < (now or time.time()):
+        return False
+    expected = sign_profile_token(secret, int(expires)).partition(".")[2]
+    return hmac.compare_digest(digest, expected)
+
+
+@dataclass
+class Profile:
+    """Samples and spans collected for one request or time window"""
+    label: str
+    interval: float
+    thread_ids: Optional[Set[int]] = None  # None samples every thread
+    deadline: Optional[float] = None
+    id: str = field(default_factory=lambda: uuid4().hex)
+    created_at: str = field(default_factory=lambda: datetime.utcnow().isoformat())
+    started: float = field(default_factory=time.perf_counter)
+    finished: Optional[float] = None
+    samples: Counter = field(default_factory=Counter)
+    # (task or thread key, name, start, end) relative to perf_counter
+    spans: List[Tuple[int, str, float, float]] = field(default_factory=list)
+    # Held by the sampler thread while it counts a tick, and by readers
+    # copying the samples of a profile that may still be running
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def sample_counts(self) -> List[Tuple[Tuple[int, Tuple[FrameKey, ...]], int]]:
+        """Copy of the sample counts, safe while the sampler is still writing"""
+        with self.lock:
+            return list(self.samples.items())
+
+    @property
+    def duration(self) -> float:
+        return (self.finished or time.perf_counter()) - self.started
+
+    def summary(self) -> dict:
+        span_totals: Dict[str, float] = {}
+        for _, name, start, end in self.spans:
+            span_totals[name] = span_totals.get(name, 0.0) + (end - start)
+        return {
+            "id": self.id,
+            "label": self.label,
+            "created_at": self.created_at,
+            "running": self.finished is None,
+            "duration_ms": round(self.duration * 1000, 3),
+            "samples": sum(count for _, count in self.sample_counts()),
+            "interval_ms": self.interval * 1000,
+            "spans_ms": {name: round(total * 1000, 3) for name, total in span_totals.items()},
+        }
+
+    def to_collapsed(self) -> str:
+        """Brendan Gregg collapsed stacks, one "thread;frame;frame count" per line"""
+        names = _thread_names()
+        lines = []
+        for (thread_id, stack), count in sorted(self.sample_counts(), key=lambda i: -i[1]):
+            frames = [names.get(thread_id, f"thread-{thread_id}")]
+            frames.extend(f"{name} ({_short(path)}:{line})" for name, path, line in stack)
+            lines.append(f"{';'.join(frames)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def to_speedscope(self) -> dict:
+        """Speedscope file with a sampled profile per thread and an evented one per span owner"""
+        frames: List[dict] = []
+        index: Dict[object, int] = {}
+
+        def frame_id(key: object, name: str, path: Optional[str] = None, line: int = 0) -> int:
+            if key not in index:
+                index[key] = len(frames)
+                frame = {"name": name}
+                if path:
+                    frame.update(file=path, line=line)
+                frames.append(frame)
+            return index[key]
+
+        names = _thread_names()
+        duration = self.duration
+        by_thread: Dict[int, Tuple[list, list]] = {}
+        for (thread_id, stack), count in self.sample_counts():
+            samples, weights = by_thread.setdefault(thread_id, ([], []))
+            samples.append([frame_id(key, key[0], key[1], key[2]) for key in stack])
+            weights.append(count * self.interval)
+
+        profiles = [
+            {
+                "type": "sampled",
+                "name": names.get(thread_id, f"thread-{thread_id}"),
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": duration,
+                "samples": samples,
+                "weights": weights,
+            }
+            for thread_id, (samples, weights) in by_thread.items()
+        ]
+
+        by_owner: Dict[int, list] = {}
+        for owner, name, start, end in self.spans:
+            by_owner.setdefault(owner, []).append((start - self.started, end - self.started, name))
+        for number, spans in enumerate(by_owner.values(), 1):
+            # Spans of one task are properly nested; replay them as open/close events
+            events, open_spans = [], []
+            for start, end, name in sorted(spans, key=lambda s: (s[0], -s[1])):
+                while open_spans and open_spans[-1][0] <= start:
+                    closed_end, closed_frame = open_spans.pop()
+                    events.append({"type": "C", "frame": closed_frame, "at": closed_end})
+                span_frame = frame_id(("span", name), f"[span] {name}")
+                events.append({"type": "O", "frame": span_frame, "at": max(start, 0.0)})
+                open_spans.append((end, span_frame))
+            while open_spans:
+                closed_end, closed_frame = open_spans.pop()
+                events.append({"type": "C", "frame": closed_frame, "at": closed_end})
+            profiles.append({
+                "type": "evented",
+                "name": f"spans {number}",
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": duration,
+                "events": events,
+            })
+
+        return {
+            "$schema": SPEEDSCOPE_SCHEMA,
+            "name": self.label,
+            "exporter": "palmlion",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": profiles,
+        }
+
+
+class Profiler:
+    """
+    Sampling profiler driven by a background thread
+
+    The sampler thread only exists while at least one profile is running.
+    Each tick it reads sys._current_frames() and counts the stack of every
+    thread a profile is watching. Request profiles watch the event loop
+    thread, so concurrent requests on the same worker show up in their
+    samples too; the spans in a request profile are its own. Finished
+    profiles are kept in a small LRU for retrieval.
+    """
+
+    def __init__(self, interval: float = 0.005, max_stored: int = 32, max_seconds: float = 60.0):
+        self.interval = interval
+        self.max_stored = max_stored
+        self.max_seconds = max_seconds
+        self._lock = threading.Lock()
+        self._running: Dict[str, Profile] = {}
+        self._finished: "OrderedDict[str, Profile]" = OrderedDict()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(
+        self,
+        label: str,
+        thread_ids: Optional[Set[int]] = None,
+        seconds: Optional[float] = None,
+        interval: Optional[float] = None,
+    ) -> Profile:
+        """Begin a profile; without seconds it runs until stop() or max_seconds"""
+        global _active
+        seconds = min(seconds or self.max_seconds, self.max_seconds)
+        profile = Profile(
+            label=label,
+            interval=interval or self.interval,
+            thread_ids=thread_ids,
+            deadline=time.perf_counter() + seconds,
+        )
+        with self._lock:
+            self._running[profile.id] = profile
+            _active += 1
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._sample_loop, name="palmlion-profiler", daemon=True
+                )
+                self._thread.start()
+        return profile
+
+    def stop(self, profile: Profile) -> Profile:
+        global _active
+        with self._lock:
+            if self._running.pop(profile.id, None) is None:
+                return profile
+            _active -= 1
+            profile.finished = time.perf_counter()
+            self._finished[profile.id] = profile
+            while len(self._finished) > self.max_stored:
+                self._finished.popitem(last=False)
+        return profile
+
+    def get(self, profile_id: str) -> Optional[Profile]:
+        return self._running.get(profile_id) or self._finished.get(profile_id)
+
+    def summaries(self) -> List[dict]:
+        profiles = list(self._running.values()) + list(reversed(self._finished.values()))
+        return [p.summary() for p in profiles]
+
+    def window_profiles(self) -> List[Profile]:
+        return [p for p in list(self._running.values()) if p.thread_ids is None]
+
+    def _sample_loop(self) -> None:
+        own_id = threading.get_ident()
+        while True:
+            with self._lock:
+                running = list(self._running.values())
+                if not running:
+                    self._thread = None
+                    return
+
+            now = time.perf_counter()
+            frames = sys._current_frames()
+            for profile in running:
+                if profile.deadline is not None and now >= profile.deadline:
+                    self.stop(profile)
+                    continue
+                thread_ids = profile.thread_ids or frames.keys()
+                stacks = [
+                    (thread_id, _stack(frames[thread_id]))
+                    for thread_id in thread_ids
+                    if thread_id in frames and thread_id != own_id
+                ]
+                with profile.lock:
+                    for key in stacks:
+                        profile.samples[key] += 1
+            del frames
+            time.sleep(min(p.interval for p in running))
+
+
+def _stack(frame) -> Tuple[FrameKey, ...]:
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append((code.co_qualname, code.co_filename, code.co_firstlineno))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+
+def _short(path: str) -> str:
+    marker = path.rfind("/app/")
+    return path[marker + 1:] if marker >= 0 else path.rsplit("/", 1)[-1]
+
+
+def _thread_names() -> Dict[int, str]:
+    return {t.ident: t.name for t in threading.enumerate() if t.ident is not None}
+
+
+def _owner() -> int:
+    """Key spans by asyncio task when there is one, otherwise by thread"""
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    return id(task) if task is not None else threading.get_ident()
+
+
+class _Span:
+    __slots__ = ("targets", "name", "start")
+
+    def __init__(self, targets: List[Profile], name: str):
+        self.targets = targets
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        owner = _owner()
+        for profile in self.targets:
+            profile.spans.append((owner, self.name, self.start, end))
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name: str):
+    """Context manager timing a block into the running profiles; a no-op otherwise"""
+    if not _active:
+        return _NULL_SPAN
+    targets = profiler.window_profiles()
+    current = _current.get()
+    if current is not None and current.finished is None:
+        targets.append(current)
+    return _Span(targets, name) if targets else _NULL_SPAN
+
+
+def traced(name: str) -> Callable:
+    """Decorator wrapping a sync or async function in span(name)"""
+    def decorator(func: Callable) -> Callable:
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not _active:
+                    return await func(*args, **kwargs)
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _active:
+                return func(*args, **kwargs)
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class ProfilingMiddleware:
+    """
+    Profiles a single request carrying a valid signed profile header
+
+    The header value comes from sign_profile_token(SECRET_KEY, expires_at).
+    The response gets an X-Palmlion-Profile-Id header; fetch the result from
+    /api/v1/admin/profiling/{id}. Requests without the header only pay for
+    one scan of the header list.
+    """
+
+    def __init__(self, app, secret: str, profiler: "Profiler"):
+        self.app = app
+        self.secret = secret
+        self.profiler = profiler
+        self._header = PROFILE_HEADER.lower().encode()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = None
+        for name, value in scope["headers"]:
+            if name == self._header:
+                token = value.decode("latin-1")
+                break
+        if token is None or not verify_profile_token(self.secret, token):
+            await self.app(scope, receive, send)
+            return
+
+        profile = self.profiler.start(
+            f"{scope['method']} {scope['path']}", thread_ids={threading.get_ident()}
+        )
+        reset = _current.set(profile)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((PROFILE_ID_HEADER.lower().encode(), profile.id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(reset)
+            self.profiler.stop(profile)
+
+
+profiler = Profiler(
+    interval=settings.PROFILING_INTERVAL_MS / 1000,
+    max_stored=settings.PROFILING_MAX_STORED,
+    max_seconds=settings.PROFILING_MAX_SECONDS,
+)
+
+
+if __name__ == "__main__":
+    # python -m app.core.profiling [ttl_seconds] prints a header value for curl
+    ttl = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    print(sign_profile_token(settings.SECRET_KEY, int(time.time()) + ttl))
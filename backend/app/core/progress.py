@@ -0,0 +1,231 @@
+"""
+Palmlion Mission Progress
+Atomic progress counters and sharded participant counts for #PalmDash missions
+"""
+import random
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Dict, List, Sequence
+
+from app.core.config import settings
+
+
+@dataclass
+class ProgressUpdate:
+    """Outcome of a single atomic progress increment"""
+    current: int
+    applied: int
+    completed: bool
+    just_completed: bool
+    started: bool
+
+
+class ProgressBackend(ABC):
+    """
+    Mission progress storage
+
+    increment() must add, clamp to the threshold and detect completion in a
+    single atomic step so concurrent submissions never lose updates or
+    complete a mission twice.
+    """
+
+    @abstractmethod
+    async def increment(
+        self, user_id: str, mission_id: str, amount: int, threshold: int
+    ) -> ProgressUpdate:
+        ...
+
+    @abstractmethod
+    async def get_user_progress(
+        self, user_id: str, mission_ids: Sequence[str]
+    ) -> Dict[str, int]:
+        """Current progress for many missions in one lookup; missing means not started"""
+
+    @abstractmethod
+    async def add_participant(self, mission_id: str) -> None:
+        ...
+
+    @abstractmethod
+    async def get_participants(self, mission_ids: Sequence[str]) -> Dict[str, int]:
+        """Participants recorded by this backend, per mission"""
+
+    async def close(self) -> None:
+        pass
+
+
+class ShardedCounter:
+    """
+    Counter split across independently locked shards
+
+    Writers pick a random shard so hot counters do not serialise on one lock;
+    reads sum the shards.
+    """
+
+    def __init__(self, shards: int = 16):
+        self._values = [0] * shards
+        self._locks = [threading.Lock() for _ in range(shards)]
+
+    def add(self, amount: int = 1) -> None:
+        shard = random.randrange(len(self._values))
+        with self._locks[shard]:
+            self._values[shard] += amount
+
+    @property
+    def value(self) -> int:
+        return sum(self._values)
+
+
+class InMemoryProgressBackend(ProgressBackend):
+    """
+    Single-process backend guarded by striped locks
+
+    A (user, mission) pair always maps to the same stripe, so unrelated
+    submissions rarely contend while updates to one pair stay atomic even
+    from threadpool handlers.
+    """
+
+    def __init__(self, stripes: int = 64, counter_shards: int = 16):
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        self._progress: Dict[str, Dict[str, int]] = {}
+        self._participants: Dict[str, ShardedCounter] = {}
+        self._participants_lock = threading.Lock()
+        self._counter_shards = counter_shards
+
+    def _lock_for(self, user_id: str, mission_id: str) -> threading.Lock:
+        return self._locks[hash((user_id, mission_id)) % len(self._locks)]
+
+    async def increment(
+        self, user_id: str, mission_id: str, amount: int, threshold: int
+    ) -> ProgressUpdate:
+        with self._lock_for(user_id, mission_id):
+            missions = self._progress.setdefault(user_id, {})
+            started = mission_id not in missions
+            current = missions.get(mission_id, 0)
+
+            if current >= threshold:
+                return ProgressUpdate(current, 0, True, False, started)
+
+            new = min(current + amount, threshold)
+            missions[mission_id] = new
+            completed = new >= threshold
+            return ProgressUpdate(new, new - current, completed, completed, started)
+
+    async def get_user_progress(
+        self, user_id: str, mission_ids: Sequence[str]
+    ) -> Dict[str, int]:
+        missions = self._progress.get(user_id, {})
+        return {m: missions[m] for m in mission_ids if m in missions}
+
+    async def add_participant(self, mission_id: str) -> None:
+        counter = self._participants.get(mission_id)
+        if counter is None:
+            with self._participants_lock:
+                counter = self._participants.setdefault(
+                    mission_id, ShardedCounter(self._counter_shards)
+                )
+        counter.add()
+
+    async def get_participants(self, mission_ids: Sequence[str]) -> Dict[str, int]:
+        return {
+            m: self._participants[m].value for m in mission_ids if m in self._participants
+        }
+
+
+# Returns {current, applied, completed, just_completed, started}
+INCREMENT_SCRIPT = """
+local raw = redis.call('HGET', KEYS[1], ARGV[1])
+local started = 0
+local current = 0
+if raw then current = tonumber(raw) else started = 1 end
+local threshold = tonumber(ARGV[3])
+if current >= threshold then
+    return {current, 0, 1, 0, started}
+end
+local new = math.min(current + tonumber(ARGV[2]), threshold)
+redis.call('HSET', KEYS[1], ARGV[1], new)
+local done = 0
+if new >= threshold then done = 1 end
+return {new, new - current, done, done, started}
+"""
+
+
+class RedisProgressBackend(ProgressBackend):
+    """
+    Multi-worker backend
+
+    Progress lives in one hash per user and is updated by a Lua script, so
+    the read-clamp-write is atomic across every uvicorn worker and pod.
+    Participants are spread over several keys to avoid a single hot key.
+    """
+
+    def __init__(self, redis_url: str, counter_shards: int = 16, prefix: str = "palmlion"):
+        import redis.asyncio as redis
+
+        self._redis = redis.from_url(redis_url, decode_responses=True)
+        self._increment = self._redis.register_script(INCREMENT_SCRIPT)
+        self._counter_shards = counter_shards
+        self._prefix = prefix
+
+    def _progress_key(self, user_id: str) -> str:
+        return f"{self._prefix}:progress:{user_id}"
+
+    def _participant_keys(self, mission_id: str) -> List[str]:
+        return [
+            f"{self._prefix}:participants:{mission_id}:{shard}"
+            for shard in range(self._counter_shards)
+        ]
+
+    async def increment(
+        self, user_id: str, mission_id: str, amount: int, threshold: int
+    ) -> ProgressUpdate:
+        current, applied, completed, just_completed, started = await self._increment(
+            keys=[self._progress_key(user_id)],
+            args=[mission_id, amount, threshold],
+        )
+        return ProgressUpdate(
+            current=int(current),
+            applied=int(applied),
+            completed=bool(completed),
+            just_completed=bool(just_completed),
+            started=bool(started),
+        )
+
+    async def get_user_progress(
+        self, user_id: str, mission_ids: Sequence[str]
+    ) -> Dict[str, int]:
+        if not mission_ids:
+            return {}
+        values = await self._redis.hmget(self._progress_key(user_id), list(mission_ids))
+        return {m: int(v) for m, v in zip(mission_ids, values) if v is not None}
+
+    async def add_participant(self, mission_id: str) -> None:
+        shard = random.randrange(self._counter_shards)
+        await self._redis.incr(f"{self._prefix}:participants:{mission_id}:{shard}")
+
+    async def get_participants(self, mission_ids: Sequence[str]) -> Dict[str, int]:
+        if not mission_ids:
+            return {}
+        keys = [key for m in mission_ids for key in self._participant_keys(m)]
+        values = await self._redis.mget(keys)
+
+        counts = {}
+        for i, mission_id in enumerate(mission_ids):
+            shard_values = values[i * self._counter_shards:(i + 1) * self._counter_shards]
+            total = sum(int(v) for v in shard_values if v is not None)
+            if total:
+                counts[mission_id] = total
+        return counts
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+
+def create_progress_backend() -> ProgressBackend:
+    """Build the backend selected by PROGRESS_BACKEND"""
+    if settings.PROGRESS_BACKEND == "redis":
+        return RedisProgressBackend(str(settings.REDIS_URL), settings.PROGRESS_COUNTER_SHARDS)
+    return InMemoryProgressBackend(counter_shards=settings.PROGRESS_COUNTER_SHARDS)
+
+
+progress_backend = create_progress_backend()
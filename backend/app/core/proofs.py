@@ -0,0 +1,453 @@
+"""
+Palmlion Proof Index
+Proof hashes already credited, so the same proof of action only counts once
+"""
+import math
+import mmap
+import os
+import struct
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from app.core.config import settings
+from app.core.lazy import lazy_import
+from app.core.metrics import PROOF_LOOKUPS
+from app.core.segments import EPOCH
+
+np = lazy_import("numpy")
+
+BLOOM_SUFFIX = ".bloom"
+TABLE_SUFFIX = ".table"
+
+# Bloom filter file header: magic, version, hash functions, bits
+_BLOOM_HEADER = struct.Struct("<4sHHQ")
+_BLOOM_MAGIC = b"PLBF"
+_BLOOM_VERSION = 1
+_BLOOM_MAX_HASHES = 8
+_BLOOM_BLOCKING = 1.25
+_GOLDEN = 0x9E3779B97F4A7C15
+
+# Table slot values: 0 is empty and 1 a released key, so digests 0 and 1
+# are stored as 2 and 3
+EMPTY, RELEASED = 0, 1
+MAX_LOAD = 0.5
+
+
+def _keys(digests: Iterable[int]) -> "np.ndarray":
+    keys = np.fromiter(digests, np.uint64)
+    return np.where(keys <= RELEASED, keys + np.uint64(2), keys)
+
+
+def _map(path: Path, size: int) -> mmap.mmap:
+    """A writable shared mapping of the file, extended (sparsely) to size"""
+    with open(path, "r+b") as f:
+        if os.fstat(f.fileno()).st_size < size:
+            f.truncate(size)
+        return mmap.mmap(f.fileno(), size)
+
+
+def _table_slots(keys: int) -> int:
+    return 1 << max(10, math.ceil(math.log2(max(keys, 1) / MAX_LOAD)))
+
+
+def _generation_day(path: Path) -> Optional[int]:
+    try:
+        return (datetime.strptime(path.stem, "%Y-%m-%d") - EPOCH).days
+    except ValueError:
+        return None
+
+
+class BloomFilter:
+    """
+    A blocked Bloom filter over 64-bit digests in a memory-mapped file
+
+    Each key sets `hashes` bits within a single 64-bit word, so a lookup
+    is one memory access: the word is picked by the key's low bits and
+    the bits by 6-bit slices of the key times a large odd constant. That
+    costs a little more memory than a classic filter for the same false
+    positive rate. Sized on creation for `capacity` keys at `fp_rate`;
+    past that it keeps working with a rising false positive rate.
+    """
+
+    def __init__(self, path: Path, capacity: int, fp_rate: float):
+        self.path = path
+        if path.exists() and path.stat().st_size >= _BLOOM_HEADER.size:
+            with open(path, "rb") as f:
+                magic, version, hashes, bits = _BLOOM_HEADER.unpack(f.read(_BLOOM_HEADER.size))
+            if magic != _BLOOM_MAGIC or version != _BLOOM_VERSION:
+                raise ValueError(f"{path} is not a proof Bloom filter")
+        else:
+            bits_per_key = -math.log(fp_rate) / math.log(2) ** 2
+            hashes = min(_BLOOM_MAX_HASHES, max(1, round(bits_per_key * math.log(2))))
+            # Blocking needs about a quarter more bits; words are a power of two
+            words = max(1, math.ceil(capacity * bits_per_key * _BLOOM_BLOCKING / 64))
+            bits = (1 << (words - 1).bit_length()) * 64
+            with open(path, "wb") as f:
+                f.write(_BLOOM_HEADER.pack(_BLOOM_MAGIC, _BLOOM_VERSION, hashes, bits))
+        self.hashes = hashes
+        self.bits = bits
+        self._map = _map(path, _BLOOM_HEADER.size + bits // 8)
+        self._words = np.frombuffer(
+            self._map, np.uint64, count=bits // 64, offset=_BLOOM_HEADER.size
+        )
+
+    def _positions(self, keys: "np.ndarray") -> Tuple["np.ndarray", "np.ndarray"]:
+        """Each key's word index and the bits it sets in that word"""
+        words = (keys & np.uint64(len(self._words) - 1)).astype(np.intp)
+        mixed = keys * _GOLDEN
+        masks = np.zeros(len(keys), np.uint64)
+        for i in range(self.hashes):
+            masks |= np.uint64(1) << ((mixed >> np.uint64(58 - 6 * i)) & np.uint64(63))
+        return words, masks
+
+    def might_contain(self, keys: "np.ndarray") -> "np.ndarray":
+        words, masks = self._positions(keys)
+        return (self._words[words] & masks) == masks
+
+    def add(self, keys: "np.ndarray") -> None:
+        words, masks = self._positions(keys)
+        np.bitwise_or.at(self._words, words, masks)
+
+    def flush(self) -> None:
+        self._map.flush()
+
+    def close(self) -> None:
+        self._words = None
+        self._map.flush()
+        self._map.close()
+
+
+class ProofTable:
+    """
+    An exact set of 64-bit digests: an open-addressing table in a memory-mapped file
+
+    A key's home slot is its low bits and collisions probe linearly.
+    Lookups and inserts run over arrays of keys, probing all of them a
+    step at a time. Released keys leave a marker so probes carry on past
+    them, and markers count towards the load like keys do: once more than
+    half the slots are taken, the live keys are rewritten into a table
+    sized for them and renamed over the old file, which also drops the
+    markers. Probes therefore always reach an empty slot.
+    """
+
+    def __init__(self, path: Path, capacity: int):
+        self.path = path
+        size = path.stat().st_size if path.exists() else 0
+        if not size:
+            path.touch()
+        self._open(size // 8 if size else _table_slots(capacity))
+        self.count = int(np.count_nonzero(self._slots > RELEASED))
+        # Slots holding a key or a released marker
+        self.used = int(np.count_nonzero(self._slots))
+
+    def _open(self, slots: int) -> None:
+        self._map = _map(self.path, slots * 8)
+        self._slots = np.frombuffer(self._map, np.uint64, count=slots)
+
+    @property
+    def size_bytes(self) -> int:
+        return len(self._slots) * 8
+
+    def _probe(self, keys: "np.ndarray") -> Tuple["np.ndarray", "np.ndarray"]:
+        """Whether each key is present, and its slot (or the empty slot its probe ended at)"""
+        slots = self._slots
+        mask = len(slots) - 1
+        position = (keys & np.uint64(mask)).astype(np.intp)
+        found = np.zeros(len(keys), bool)
+        pending = np.arange(len(keys))
+        while len(pending):
+            values = slots[position[pending]]
+            hit = values == keys[pending]
+            found[pending[hit]] = True
+            pending = pending[~hit & (values != EMPTY)]
+            position[pending] = (position[pending] + 1) & mask
+        return found, position
+
+    def contains(self, keys: "np.ndarray") -> "np.ndarray":
+        return self._probe(keys)[0]
+
+    @staticmethod
+    def _place(slots: "np.ndarray", keys: "np.ndarray") -> None:
+        """Store distinct keys that are not in the table yet"""
+        mask = len(slots) - 1
+        position = (keys & np.uint64(mask)).astype(np.intp)
+        pending = np.arange(len(keys))
+        while len(pending):
+            free = slots[position[pending]] == EMPTY
+            # One key per free slot per round; the rest find it taken next round
+            candidates = pending[free]
+            _, first = np.unique(position[candidates], return_index=True)
+            winners = candidates[first]
+            slots[position[winners]] = keys[winners]
+            moving = pending[~free]
+            position[moving] = (position[moving] + 1) & mask
+            losers = np.setdiff1d(candidates, winners, assume_unique=True)
+            pending = np.concatenate([moving, losers])
+
+    def insert(self, keys: "np.ndarray") -> None:
+        if self.used + len(keys) > len(self._slots) * MAX_LOAD:
+            self._grow(self.count + len(keys))
+        self._place(self._slots, keys)
+        self.count += len(keys)
+        self.used += len(keys)
+
+    def remove(self, keys: "np.ndarray") -> int:
+        found, position = self._probe(keys)
+        self._slots[position[found]] = RELEASED
+        removed = int(found.sum())
+        self.count -= removed
+        return removed
+
+    def _grow(self, keys: int) -> None:
+        slots = _table_slots(keys)
+        live = self._slots[self._slots > RELEASED].copy()
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_bytes(b"")
+        grown = _map(tmp, slots * 8)
+        table = np.frombuffer(grown, np.uint64, count=slots)
+        self._place(table, live)
+        del table
+        grown.flush()
+        grown.close()
+        self.close()
+        os.replace(tmp, self.path)
+        self._open(slots)
+        self.used = self.count
+
+    def flush(self) -> None:
+        self._map.flush()
+
+    def close(self) -> None:
+        self._slots = None
+        self._map.flush()
+        self._map.close()
+
+
+class _Generation:
+    def __init__(self, directory: Path, day: int, capacity: int, fp_rate: float):
+        stem = (EPOCH + timedelta(days=day)).strftime("%Y-%m-%d")
+        self.day = day
+        self.bloom = BloomFilter(directory / (stem + BLOOM_SUFFIX), capacity, fp_rate)
+        self.table = ProofTable(directory / (stem + TABLE_SUFFIX), capacity)
+
+    def close(self) -> None:
+        self.bloom.close()
+        self.table.close()
+
+    def delete(self) -> None:
+        self.close()
+        self.bloom.path.unlink(missing_ok=True)
+        self.table.path.unlink(missing_ok=True)
+
+
+class ProofIndex:
+    """
+    64-bit proof digests (see segments.proof_digest) credited within the lookback
+
+    Time is cut into periods of lookback / generations days; each period
+    is a generation with a Bloom filter in front of an exact table, both
+    memory-mapped files under directory, and new proofs go to the
+    current one. A lookup asks the filters first, so a proof never seen
+    costs a few bit tests per generation and touches no table pages;
+    only filter hits (about fp_rate of new proofs) probe the tables.
+    When a period ends the oldest generation's files are deleted, so a
+    proof is remembered for at least the lookback after it was claimed:
+    as long as an action carrying it can count toward a score.
+
+    Resident memory is what the page cache keeps of the files: each
+    filter is sized for `capacity` proofs per period, and tables start
+    at that size (sparse on disk) and grow by doubling.
+
+    claim() takes digests and reports which were new, so two requests
+    racing with the same proof cannot both count it. A caller that logs
+    its proofs first uses reserve() instead: reservations are held in
+    memory and only reach the files on commit(), once the log has them,
+    so a crash in between leaves no claim behind that nothing credited.
+    release() hands back reservations or claims whose write failed.
+    Writes reach the files as they happen, so they survive a crash of
+    the process; flush() makes them durable. The files are not shared
+    safely between processes: the index belongs to the ingest pipeline,
+    whose write-ahead log sits beside it, and is used only from its
+    event loop.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        generations: int = 3,
+        capacity: int = 1_000_000,
+        fp_rate: float = 0.01,
+        lookback_days: Optional[int] = None,
+    ):
+        self.directory = Path(directory)
+        self.generations = generations
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self.lookback_days = lookback_days
+        self._generations: Dict[int, _Generation] = {}
+        self._current: Optional[_Generation] = None
+        self._reserved: Set[int] = set()
+
+    @property
+    def is_open(self) -> bool:
+        return self._current is not None
+
+    @property
+    def period_days(self) -> int:
+        lookback = self.lookback_days or settings.CONVICTION_LOOKBACK_DAYS
+        return max(1, math.ceil(lookback / self.generations))
+
+    def open(self) -> None:
+        if self.is_open:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for path in sorted(self.directory.glob("*" + TABLE_SUFFIX)):
+            day = _generation_day(path)
+            if day is not None:
+                self._generations[day] = _Generation(
+                    self.directory, day, self.capacity, self.fp_rate
+                )
+        for path in self.directory.glob("*.tmp"):
+            path.unlink()  # a table rewrite cut short; the original is intact
+        self.rotate()
+
+    def close(self) -> None:
+        if not self.is_open:
+            return
+        for generation in self._generations.values():
+            generation.close()
+        self._generations.clear()
+        self._current = None
+        self._reserved.clear()
+
+    def flush(self) -> None:
+        for generation in self._generations.values():
+            generation.bloom.flush()
+            generation.table.flush()
+
+    def rotate(self, today: Optional[int] = None) -> List[int]:
+        """Make today's period current and delete generations before the window"""
+        if today is None:
+            today = (datetime.utcnow() - EPOCH).days
+        period = self.period_days
+        start = today - today % period
+        horizon = start - self.generations * period
+        expired = sorted(day for day in self._generations if day < horizon)
+        for day in expired:
+            self._generations.pop(day).delete()
+        if start not in self._generations:
+            self._generations[start] = _Generation(
+                self.directory, start, self.capacity, self.fp_rate
+            )
+        self._current = self._generations[start]
+        return expired
+
+    def _writable(self) -> _Generation:
+        if not self.is_open:
+            raise RuntimeError("Proof index is not open")
+        today = (datetime.utcnow() - EPOCH).days
+        if today - self._current.day >= self.period_days:
+            self.rotate(today)
+        return self._current
+
+    def _seen(self, keys: "np.ndarray") -> "np.ndarray":
+        seen = np.zeros(len(keys), bool)
+        candidates = 0
+        for generation in self._generations.values():
+            unseen = np.flatnonzero(~seen)
+            if not len(unseen):
+                break
+            maybe = unseen[generation.bloom.might_contain(keys[unseen])]
+            if len(maybe):
+                candidates += len(maybe)
+                seen[maybe[generation.table.contains(keys[maybe])]] = True
+        duplicates = int(seen.sum())
+        PROOF_LOOKUPS.inc("duplicate", amount=duplicates)
+        PROOF_LOOKUPS.inc("false_positive", amount=candidates - duplicates)
+        PROOF_LOOKUPS.inc("new", amount=len(keys) - candidates)
+        return seen
+
+    def _fresh(self, keys: "np.ndarray") -> "np.ndarray":
+        """Keys neither seen, reserved, nor repeated earlier in the call"""
+        fresh = ~self._seen(keys)
+        if self._reserved:
+            reserved = self._reserved
+            fresh &= np.fromiter((key not in reserved for key in keys.tolist()), bool, len(keys))
+        # Only the first of repeated digests in the call is new
+        _, first = np.unique(keys, return_index=True)
+        repeated = np.ones(len(keys), bool)
+        repeated[first] = False
+        return fresh & ~repeated
+
+    def _store(self, keys: "np.ndarray") -> None:
+        if len(keys):
+            current = self._writable()
+            current.bloom.add(keys)
+            current.table.insert(keys)
+
+    def claim(self, digests: Sequence[int]) -> List[bool]:
+        """Mark digests as seen; True for each one that was not seen before"""
+        self._writable()
+        keys = _keys(digests)
+        fresh = self._fresh(keys)
+        self._store(keys[fresh])
+        return fresh.tolist()
+
+    def reserve(self, digests: Sequence[int]) -> List[bool]:
+        """Like claim(), but held in memory until commit() or release()"""
+        self._writable()
+        keys = _keys(digests)
+        fresh = self._fresh(keys)
+        self._reserved.update(keys[fresh].tolist())
+        return fresh.tolist()
+
+    def commit(self, digests: Iterable[int]) -> None:
+        """Write reserved digests to the index"""
+        keys = _keys(digests)
+        reserved = self._reserved
+        held = np.fromiter((key in reserved for key in keys.tolist()), bool, len(keys))
+        reserved.difference_update(keys.tolist())
+        self._store(keys[held])
+
+    def seen(self, digests: Sequence[int]) -> List[bool]:
+        """Whether each digest was claimed, without claiming it"""
+        if not self.is_open:
+            return [False] * len(digests)
+        return self._seen(_keys(digests)).tolist()
+
+    def release(self, digests: Iterable[int]) -> None:
+        keys = _keys(digests)
+        if not self.is_open or not len(keys):
+            return
+        self._reserved.difference_update(keys.tolist())
+        for generation in self._generations.values():
+            generation.table.remove(keys)
+
+    def add(self, digests: Iterable[int]) -> None:
+        self.claim(list(digests))
+
+    def __contains__(self, digest: int) -> bool:
+        return self.seen([digest])[0]
+
+    def __len__(self) -> int:
+        return sum(g.table.count for g in self._generations.values())
+
+    def stats(self) -> dict:
+        return {
+            "generations": len(self._generations),
+            "period_days": self.period_days,
+            "proofs": len(self),
+            "reserved": len(self._reserved),
+            "bloom_bytes": sum(g.bloom.bits // 8 for g in self._generations.values()),
+            "table_bytes": sum(g.table.size_bytes for g in self._generations.values()),
+        }
+
+
+proof_index = ProofIndex(
+    settings.PROOF_INDEX_DIR,
+    generations=settings.PROOF_INDEX_GENERATIONS,
+    capacity=settings.PROOF_INDEX_CAPACITY,
+    fp_rate=settings.PROOF_INDEX_FP_RATE,
+)
+
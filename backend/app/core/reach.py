@@ -0,0 +1,457 @@
+"""
+Palmlion Fan Reach
+Unique fans per artist, region and action type from mergeable HyperLogLog sketches
+"""
+import hashlib
+import math
+import sys
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from app.core.analytics import ALL_REGIONS, RegionalAnalytics
+from app.core.config import settings
+from app.core.conviction import ConvictionAction
+from app.core.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+EPOCH = datetime(1970, 1, 1)
+
+# 2^14 registers, as in Redis: 0.81% standard error, 16 KB once dense
+PRECISION = 14
+REGISTERS = 1 << PRECISION
+RANK_BITS = 64 - PRECISION
+STANDARD_ERROR = 1.04 / math.sqrt(REGISTERS)
+
+# Non-zero registers are kept in a dict until there are this many; a dict
+# that size already costs about half of the dense bytearray
+SPARSE_LIMIT = 128
+
+# Window name -> days, ending today (UTC); daily sketches are kept for the longest
+WINDOWS: Dict[str, int] = {"1d": 1, "7d": 7, "30d": 30}
+RETENTION_DAYS = max(WINDOWS.values())
+
+# (day, artist key, region, action type); region "" is a fan without one
+ReachKey = Tuple[int, str, str, str]
+
+
+def hll_position(member: str) -> Tuple[int, int]:
+    """The register a member updates and the rank it offers, from a 64-bit hash"""
+    digest = int.from_bytes(hashlib.blake2b(member.encode(), digest_size=8).digest(), "little")
+    rest = digest & ((1 << RANK_BITS) - 1)
+    return digest >> RANK_BITS, RANK_BITS - rest.bit_length() + 1
+
+
+def _sigma(x: float) -> float:
+    if x == 1.0:
+        return math.inf
+    y, z = 1.0, x
+    while True:
+        x *= x
+        previous = z
+        z += x * y
+        y += y
+        if z == previous:
+            return z
+
+
+def _tau(x: float) -> float:
+    if x == 0.0 or x == 1.0:
+        return 0.0
+    y, z = 1.0, 1.0 - x
+    while True:
+        x = math.sqrt(x)
+        previous = z
+        y *= 0.5
+        z -= (1.0 - x) ** 2 * y
+        if z == previous:
+            return z / 3
+
+
+def estimate(histogram: Sequence[int]) -> int:
+    """
+    Cardinality from a register histogram (histogram[r] = registers at rank r)
+
+    Ertl's improved estimator, which is also what PFCOUNT uses: no bias
+    tables and no switch to linear counting at small cardinalities.
+    """
+    m = REGISTERS
+    z = m * _tau((m - histogram[RANK_BITS + 1]) / m)
+    for rank in range(RANK_BITS, 0, -1):
+        z = 0.5 * (z + histogram[rank])
+    z += m * _sigma(histogram[0] / m)
+    return round(m * m / (2 * math.log(2)) / z)
+
+
+class HyperLogLog:
+    """
+    A HyperLogLog sketch: 2^14 registers, each the highest rank seen there
+
+    Small sketches keep their non-zero registers in a dict and switch to
+    a bytearray, one register per byte, past SPARSE_LIMIT of them.
+    Merging takes the register-wise maximum, so the union of any set of
+    sketches is itself a sketch.
+    """
+
+    __slots__ = ("_sparse", "_dense")
+
+    def __init__(self):
+        self._sparse: Optional[Dict[int, int]] = {}
+        self._dense: Optional[bytearray] = None
+
+    def add(self, index: int, rank: int) -> None:
+        dense = self._dense
+        if dense is not None:
+            if dense[index] < rank:
+                dense[index] = rank
+            return
+        sparse = self._sparse
+        if sparse.get(index, 0) < rank:
+            sparse[index] = rank
+            if len(sparse) > SPARSE_LIMIT:
+                self._densify()
+
+    def _densify(self) -> None:
+        dense = bytearray(REGISTERS)
+        for index, rank in self._sparse.items():
+            dense[index] = rank
+        self._dense, self._sparse = dense, None
+
+    def merge_into(self, registers: "np.ndarray") -> None:
+        """Fold this sketch into a uint8 register array"""
+        if self._dense is not None:
+            np.maximum(registers, np.frombuffer(self._dense, np.uint8), out=registers)
+        elif self._sparse:
+            indexes = np.fromiter(self._sparse.keys(), np.intp, len(self._sparse))
+            ranks = np.fromiter(self._sparse.values(), np.uint8, len(self._sparse))
+            np.maximum.at(registers, indexes, ranks)
+
+    @property
+    def size_bytes(self) -> int:
+        if self._dense is not None:
+            return sys.getsizeof(self._dense)
+        return sys.getsizeof(self._sparse) + 28 * len(self._sparse)
+
+
+def union_count(sketches: Iterable[HyperLogLog]) -> int:
+    """Estimated number of distinct members across the sketches"""
+    registers = np.zeros(REGISTERS, np.uint8)
+    for sketch in sketches:
+        sketch.merge_into(registers)
+    return estimate(np.bincount(registers, minlength=RANK_BITS + 2).tolist())
+
+
+def _artist_key(artist_name: str) -> str:
+    return artist_name.strip().lower()
+
+
+class ReachBackend(ABC):
+    """
+    Daily HyperLogLog sketches, one per (day, artist, region, action type)
+
+    add() puts one fan into several sketches; count() returns, for each
+    named group of sketches, the estimated number of distinct fans in
+    their union.
+    """
+
+    @abstractmethod
+    async def add(self, member: str, keys: Sequence[ReachKey], names: Dict[str, str]) -> None:
+        """Add a fan to the sketches, remembering display names of new artist keys"""
+
+    @abstractmethod
+    async def dimensions(self, days: Sequence[int]) -> Dict[str, Set[Tuple[int, str, str]]]:
+        """(day, region, action type) sketches that exist on those days, per artist key"""
+
+    @abstractmethod
+    async def count(self, groups: Dict[str, List[ReachKey]]) -> Dict[str, int]:
+        ...
+
+    @abstractmethod
+    async def names(self, artists: Sequence[str]) -> Dict[str, str]:
+        """Display names for artist keys"""
+
+    async def close(self) -> None:
+        pass
+
+
+class InMemoryReachBackend(ReachBackend):
+    """
+    Single-worker backend: sketches in this process, like the analytics rollups
+
+    Days past the retention are dropped as new days start.
+    """
+
+    def __init__(self, retention_days: int = RETENTION_DAYS):
+        self.retention_days = retention_days
+        self._days: Dict[int, Dict[str, Dict[Tuple[str, str], HyperLogLog]]] = {}
+        self._names: Dict[str, str] = {}
+
+    def _expire(self, today: int) -> None:
+        horizon = today - self.retention_days
+        for day in [day for day in self._days if day <= horizon]:
+            del self._days[day]
+
+    async def add(self, member: str, keys: Sequence[ReachKey], names: Dict[str, str]) -> None:
+        index, rank = hll_position(member)
+        for artist, name in names.items():
+            self._names.setdefault(artist, name)
+        for day, artist, region, action in keys:
+            if day not in self._days:
+                self._days[day] = {}
+                self._expire(max(self._days))
+            sketches = self._days[day].setdefault(artist, {})
+            sketch = sketches.get((region, action))
+            if sketch is None:
+                sketch = sketches[(region, action)] = HyperLogLog()
+            sketch.add(index, rank)
+
+    async def dimensions(self, days: Sequence[int]) -> Dict[str, Set[Tuple[int, str, str]]]:
+        found: Dict[str, Set[Tuple[int, str, str]]] = defaultdict(set)
+        for day in days:
+            for artist, sketches in self._days.get(day, {}).items():
+                found[artist].update((day, region, action) for region, action in sketches)
+        return found
+
+    async def count(self, groups: Dict[str, List[ReachKey]]) -> Dict[str, int]:
+        return {
+            name: union_count(
+                self._days[day][artist][(region, action)] for day, artist, region, action in keys
+            )
+            for name, keys in groups.items()
+        }
+
+    async def names(self, artists: Sequence[str]) -> Dict[str, str]:
+        return {artist: self._names.get(artist, artist) for artist in artists}
+
+    def stats(self) -> dict:
+        sketches = [
+            sketch
+            for artists in self._days.values()
+            for by_dimension in artists.values()
+            for sketch in by_dimension.values()
+        ]
+        return {
+            "sketches": len(sketches),
+            "bytes": sum(sketch.size_bytes for sketch in sketches),
+        }
+
+
+class RedisReachBackend(ReachBackend):
+    """
+    Multi-worker backend on Redis HyperLogLogs
+
+    Each daily sketch is a key updated with PFADD and expiring after the
+    retention. A set per day lists the (artist, region, action) sketches
+    created that day, so reads know which keys to merge. A window's
+    union is PFMERGEd into a key named after today and the window, then
+    read with PFCOUNT. Merging into an existing key is still correct:
+    it only ever gains the same days' fans.
+    """
+
+    def __init__(
+        self,
+        redis_url: str,
+        retention_days: int = RETENTION_DAYS,
+        prefix: str = "palmlion",
+    ):
+        import redis.asyncio as redis
+
+        self._redis = redis.from_url(redis_url, decode_responses=True)
+        self._ttl = (retention_days + 1) * 86400
+        self._prefix = f"{prefix}:reach"
+
+    def _sketch_key(self, key: ReachKey) -> str:
+        day, artist, region, action = key
+        return f"{self._prefix}:{day}:{action}:{region}:{artist}"
+
+    async def add(self, member: str, keys: Sequence[ReachKey], names: Dict[str, str]) -> None:
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                day, artist, region, action = key
+                sketch_key = self._sketch_key(key)
+                index_key = f"{self._prefix}:{day}:index"
+                pipe.pfadd(sketch_key, member)
+                pipe.expire(sketch_key, self._ttl)
+                pipe.sadd(index_key, f"{action}:{region}:{artist}")
+                pipe.expire(index_key, self._ttl)
+            for artist, name in names.items():
+                pipe.hsetnx(f"{self._prefix}:names", artist, name)
+            await pipe.execute()
+
+    async def dimensions(self, days: Sequence[int]) -> Dict[str, Set[Tuple[int, str, str]]]:
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for day in days:
+                pipe.smembers(f"{self._prefix}:{day}:index")
+            members = await pipe.execute()
+        found: Dict[str, Set[Tuple[int, str, str]]] = defaultdict(set)
+        for day, entries in zip(days, members):
+            for entry in entries:
+                # Actions and regions never contain ":"; artist names may
+                action, region, artist = entry.split(":", 2)
+                found[artist].add((day, region, action))
+        return found
+
+    async def count(self, groups: Dict[str, List[ReachKey]]) -> Dict[str, int]:
+        names = [name for name, keys in groups.items() if keys]
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for name in names:
+                keys = groups[name]
+                merged = f"{self._prefix}:merged:{max(k[0] for k in keys)}:{name}"
+                pipe.pfmerge(merged, *(self._sketch_key(key) for key in keys))
+                pipe.expire(merged, 86400)
+                pipe.pfcount(merged)
+            results = await pipe.execute()
+        counts = {name: 0 for name in groups}
+        counts.update(zip(names, results[2::3]))
+        return counts
+
+    async def names(self, artists: Sequence[str]) -> Dict[str, str]:
+        if not artists:
+            return {}
+        values = await self._redis.hmget(f"{self._prefix}:names", list(artists))
+        return {artist: value or artist for artist, value in zip(artists, values)}
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+
+def _day(timestamp: datetime) -> int:
+    """Days since the epoch; action timestamps are naive UTC"""
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.replace(tzinfo=None)
+    return (timestamp - EPOCH).days
+
+
+class FanReach:
+    """
+    Unique fans per artist over WINDOWS, from daily sketches
+
+    Every verified, artist-tagged action puts its fan into the sketch for
+    (day of the action, artist, fan's region, action type). A window's
+    figure merges the daily sketches of its days, and totals across
+    regions or action types merge those too, so only the dailies are
+    stored: kilobytes per sketch however many fans it has seen. Figures
+    are estimates with about 0.81% standard error.
+    """
+
+    def __init__(self, backend: ReachBackend, clock: Callable[[], float] = time.time):
+        self.backend = backend
+        self.clock = clock
+
+    def _today(self) -> int:
+        return int(self.clock() // 86400)
+
+    def _window_days(self, window: str) -> List[int]:
+        if window not in WINDOWS:
+            raise ValueError(f"Unknown window: {window}")
+        today = self._today()
+        return list(range(today - WINDOWS[window] + 1, today + 1))
+
+    async def record_actions(
+        self,
+        user_id: str,
+        region: Optional[str],
+        actions: Sequence[ConvictionAction],
+    ) -> None:
+        """Count the fan once per (day, artist, region, action type) of their actions"""
+        region = RegionalAnalytics.normalize(region) or ""
+        today = self._today()
+        keys: Set[ReachKey] = set()
+        names: Dict[str, str] = {}
+        for action in actions:
+            if not action.verified or not (action.artist_name or "").strip():
+                continue
+            day = min(_day(action.timestamp), today)
+            if day <= today - RETENTION_DAYS:
+                continue
+            artist = _artist_key(action.artist_name)
+            names.setdefault(artist, action.artist_name.strip())
+            keys.add((day, artist, region, action.action_type.value))
+        if keys:
+            await self.backend.add(user_id, sorted(keys), names)
+
+    def _period(self, window: str, days: List[int], region: Optional[str]) -> dict:
+        return {
+            "region": region or ALL_REGIONS,
+            "window": window,
+            "start_date": (EPOCH + timedelta(days=days[0])).date().isoformat(),
+            "end_date": (EPOCH + timedelta(days=days[-1])).date().isoformat(),
+            "standard_error": round(STANDARD_ERROR, 4),
+        }
+
+    async def reach(self, artist_name: str, window: str, region: Optional[str] = None) -> dict:
+        """Unique fans of an artist in a window, in total and per action type and region"""
+        days = self._window_days(window)
+        region = RegionalAnalytics.normalize(region)
+        artist = _artist_key(artist_name)
+        dimensions = (await self.backend.dimensions(days)).get(artist, set())
+        keys = sorted(
+            (day, artist, r, action)
+            for day, r, action in dimensions
+            if region is None or r == region
+        )
+        scope = f"{window}|{region or ALL_REGIONS}|{artist}"
+        groups: Dict[str, List[ReachKey]] = {f"{scope}|total": keys}
+        for key in keys:
+            groups.setdefault(f"{scope}|action:{key[3]}", []).append(key)
+            if region is None and key[2]:
+                groups.setdefault(f"{scope}|region:{key[2]}", []).append(key)
+        counts = await self.backend.count(groups)
+        by_action, by_region = {}, {}
+        for name, count in counts.items():
+            kind, _, value = name.rpartition("|")[2].partition(":")
+            if kind == "action":
+                by_action[value] = count
+            elif kind == "region":
+                by_region[value] = count
+        display = (await self.backend.names([artist])).get(artist) if keys else None
+        return {
+            "artist_name": display or artist_name.strip(),
+            **self._period(window, days, region),
+            "unique_fans": counts[f"{scope}|total"],
+            "by_action": by_action,
+            "by_region": by_region,
+        }
+
+    async def top(self, window: str, region: Optional[str] = None, limit: int = 20) -> dict:
+        """Artists ranked by unique fans in a window"""
+        days = self._window_days(window)
+        region = RegionalAnalytics.normalize(region)
+        groups: Dict[str, List[ReachKey]] = {}
+        for artist, dimensions in (await self.backend.dimensions(days)).items():
+            keys = [
+                (day, artist, r, action)
+                for day, r, action in sorted(dimensions)
+                if region is None or r == region
+            ]
+            if keys:
+                groups[artist] = keys
+        scope = f"{window}|{region or ALL_REGIONS}"
+        counts = await self.backend.count(
+            {f"{scope}|{artist}": keys for artist, keys in groups.items()}
+        )
+        ranked = sorted(groups, key=lambda a: (-counts[f"{scope}|{a}"], a))[:limit]
+        names = await self.backend.names(ranked)
+        return {
+            **self._period(window, days, region),
+            "artists": [
+                {"artist_name": names[artist], "unique_fans": counts[f"{scope}|{artist}"]}
+                for artist in ranked
+            ],
+        }
+
+    async def close(self) -> None:
+        await self.backend.close()
+
+
+def create_reach_backend() -> ReachBackend:
+    """Build the backend selected by REACH_BACKEND"""
+    if settings.REACH_BACKEND == "redis":
+        return RedisReachBackend(str(settings.REDIS_URL))
+    return InMemoryReachBackend()
+
+
+fan_reach = FanReach(create_reach_backend())
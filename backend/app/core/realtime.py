@@ -0,0 +1,317 @@
+"""
+Palmlion Realtime Hub
+WebSocket fan-out of mission progress and leaderboard changes
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, Optional, Set
+from uuid import uuid4
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from app.core.config import settings
+from app.core.state import StateBackend, state_backend
+
+logger = logging.getLogger("palmlion.realtime")
+
+# Broadcast channel shared by the hubs of every worker
+CHANNEL = "realtime"
+
+# Topics clients may subscribe to, e.g. "mission:mission-1", "leaderboard:lagos"
+TOPIC_PREFIXES = ("leaderboard:", "mission:", "user:")
+# Only the user it names may subscribe to a user topic
+USER_TOPIC_PREFIX = "user:"
+
+# Close code for consumers dropped because they fell behind
+CLOSE_TRY_AGAIN_LATER = 1013
+
+
+class Subscriber:
+    """One connected socket with a bounded outbound queue"""
+
+    __slots__ = ("websocket", "user_id", "topics", "queue", "dropped")
+
+    def __init__(self, websocket: WebSocket, max_pending: int, user_id: Optional[str] = None):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.topics: Set[str] = set()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self.dropped = False
+
+    def offer(self, payload: str) -> bool:
+        """Queue a payload without blocking; False when the consumer is lagging"""
+        try:
+            self.queue.put_nowait(payload)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def drop(self) -> None:
+        """Discard queued payloads and tell the writer to close the socket"""
+        self.dropped = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+
+class RealtimeHub:
+    """
+    Topic-based WebSocket broadcaster
+
+    publish() only merges a diff into the pending state for its topic.
+    A flush loop runs every coalesce interval and broadcasts the pending
+    diffs through the state backend, so a change made in one worker
+    reaches sockets held by any worker. Each hub serialises every topic
+    it receives once and hands the same string to all of its
+    subscribers. Consumers whose queue fills up, or whose send stalls,
+    are disconnected so one slow client never holds back the rest.
+
+    Hubs announce the topics their sockets watch, on first subscribe and
+    again every announce interval, and publish() drops changes to topics
+    nobody watches anywhere. Leaderboard and mission topics are public;
+    "user:{id}" only accepts the socket authenticated as that user.
+    """
+
+    def __init__(
+        self,
+        bus: StateBackend,
+        coalesce_interval: float = 0.25,
+        max_pending: int = 32,
+        send_timeout: float = 5.0,
+        max_topics_per_socket: int = 32,
+        announce_interval: float = 10.0,
+    ):
+        self.bus = bus
+        self.coalesce_interval = coalesce_interval
+        self.max_pending = max_pending
+        self.send_timeout = send_timeout
+        self.max_topics_per_socket = max_topics_per_socket
+        self.announce_interval = announce_interval
+        self.node_id = uuid4().hex
+
+        self._topics: Dict[str, Set[Subscriber]] = {}
+        # Topics watched by other workers' sockets, until their announcement lapses
+        self._remote_topics: Dict[str, float] = {}
+        self._new_topics: Set[str] = set()
+        self._outgoing: Dict[str, dict] = {}
+        self._dirty: Dict[str, dict] = {}
+        self._seq = 0
+        self._connections = 0
+        self._dropped = 0
+        self._flusher: Optional[asyncio.Task] = None
+        self._listener: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self._flusher is None:
+            self._listener = asyncio.create_task(self._listen_loop())
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        if self._flusher is None:
+            return
+        for task in (self._flusher, self._listener):
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._flusher = self._listener = None
+
+    def has_subscribers(self, topic: str) -> bool:
+        """Whether a socket on any worker watches the topic"""
+        if topic in self._topics:
+            return True
+        return self._remote_topics.get(topic, 0) > time.monotonic()
+
+    def publish(self, topic: str, diff: dict) -> None:
+        """Merge a change into the topic's next broadcast"""
+        if not self.has_subscribers(topic):
+            return
+        self._outgoing.setdefault(topic, {}).update(diff)
+
+    def stats(self) -> dict:
+        return {
+            "connections": self._connections,
+            "topics": len(self._topics),
+            "remote_topics": len(self._remote_topics),
+            "pending_topics": len(self._outgoing) + len(self._dirty),
+            "dropped_consumers": self._dropped,
+        }
+
+    async def serve(self, websocket: WebSocket, user_id: Optional[str] = None) -> None:
+        """Run a client connection, authenticated as user_id if given, until it ends"""
+        await websocket.accept()
+        subscriber = Subscriber(websocket, self.max_pending, user_id)
+        self._connections += 1
+        writer = asyncio.create_task(self._write(subscriber))
+
+        try:
+            while not subscriber.dropped:
+                message = await websocket.receive_json()
+                await self._handle(subscriber, message)
+        except (WebSocketDisconnect, RuntimeError, json.JSONDecodeError):
+            pass
+        finally:
+            self._remove(subscriber)
+            self._connections -= 1
+            writer.cancel()
+
+    async def _handle(self, subscriber: Subscriber, message: Any) -> None:
+        if not isinstance(message, dict):
+            subscriber.offer('{"type":"error","detail":"Expected a JSON object"}')
+            return
+        action = message.get("action")
+        topics = message.get("topics", [])
+        if not isinstance(topics, list):
+            subscriber.offer('{"type":"error","detail":"topics must be a list"}')
+            return
+        topics = [t for t in topics if isinstance(t, str)]
+
+        if action == "subscribe":
+            accepted = []
+            for topic in topics:
+                if not self._allowed(subscriber, topic):
+                    continue
+                if len(subscriber.topics) >= self.max_topics_per_socket:
+                    break
+                subscriber.topics.add(topic)
+                if topic not in self._topics:
+                    self._new_topics.add(topic)
+                self._topics.setdefault(topic, set()).add(subscriber)
+                accepted.append(topic)
+            subscriber.offer(json.dumps({"type": "subscribed", "topics": accepted}))
+        elif action == "unsubscribe":
+            for topic in topics:
+                self._unsubscribe(subscriber, topic)
+            subscriber.offer(json.dumps({"type": "unsubscribed", "topics": topics}))
+        elif action == "ping":
+            subscriber.offer('{"type":"pong"}')
+
+    @staticmethod
+    def _allowed(subscriber: Subscriber, topic: str) -> bool:
+        if not topic.startswith(TOPIC_PREFIXES):
+            return False
+        if topic.startswith(USER_TOPIC_PREFIX):
+            user_id = subscriber.user_id
+            return user_id is not None and topic == USER_TOPIC_PREFIX + user_id
+        return True
+
+    async def _write(self, subscriber: Subscriber) -> None:
+        websocket = subscriber.websocket
+        try:
+            while True:
+                payload = await subscriber.queue.get()
+                if payload is None:
+                    break
+                await asyncio.wait_for(websocket.send_text(payload), self.send_timeout)
+        except asyncio.TimeoutError:
+            self._dropped += 1
+        except (WebSocketDisconnect, RuntimeError):
+            return
+
+        subscriber.dropped = True
+        self._remove(subscriber)
+        try:
+            await websocket.close(code=CLOSE_TRY_AGAIN_LATER)
+        except RuntimeError:
+            pass
+
+    async def _flush_loop(self) -> None:
+        next_announce = 0.0
+        while True:
+            await asyncio.sleep(self.coalesce_interval)
+            try:
+                now = time.monotonic()
+                if now >= next_announce:
+                    next_announce = now + self.announce_interval
+                    self._remote_topics = {
+                        topic: expires
+                        for topic, expires in self._remote_topics.items()
+                        if expires > now
+                    }
+                    self._new_topics.clear()
+                    await self._announce(list(self._topics))
+                elif self._new_topics:
+                    topics, self._new_topics = list(self._new_topics), set()
+                    await self._announce(topics)
+                if self._outgoing:
+                    outgoing, self._outgoing = self._outgoing, {}
+                    await self.bus.broadcast(CHANNEL, {"updates": outgoing})
+            except Exception:
+                logger.exception("Realtime broadcast failed")
+
+    async def _announce(self, topics: list) -> None:
+        if topics:
+            await self.bus.broadcast(CHANNEL, {"node": self.node_id, "watching": topics})
+
+    async def _listen_loop(self) -> None:
+        while True:
+            try:
+                async for message in self.bus.listen(CHANNEL):
+                    self._receive(message)
+            except Exception:
+                logger.exception("Realtime channel dropped, resubscribing")
+            await asyncio.sleep(1.0)
+
+    def _receive(self, message: dict) -> None:
+        watching = message.get("watching")
+        if watching and message.get("node") != self.node_id:
+            # Kept for a few announce intervals, so one late announcement is harmless
+            expires = time.monotonic() + 3 * self.announce_interval
+            for topic in watching:
+                self._remote_topics[topic] = expires
+            return
+        for topic, diff in (message.get("updates") or {}).items():
+            if topic in self._topics:
+                self._dirty.setdefault(topic, {}).update(diff)
+        if self._dirty:
+            self.flush()
+
+    def flush(self) -> None:
+        """Send every pending topic diff to this worker's subscribers"""
+        dirty, self._dirty = self._dirty, {}
+        lagging = []
+
+        for topic, diff in dirty.items():
+            subscribers = self._topics.get(topic)
+            if not subscribers:
+                continue
+            self._seq += 1
+            # Serialised once per topic, shared by every subscriber
+            payload = json.dumps(
+                {"type": "update", "topic": topic, "seq": self._seq, "data": diff},
+                separators=(",", ":"),
+                default=str,
+            )
+            for subscriber in subscribers:
+                if not subscriber.offer(payload):
+                    lagging.append(subscriber)
+
+        for subscriber in lagging:
+            if not subscriber.dropped:
+                self._dropped += 1
+                self._remove(subscriber)
+                subscriber.drop()
+
+    def _unsubscribe(self, subscriber: Subscriber, topic: str) -> None:
+        subscriber.topics.discard(topic)
+        subscribers = self._topics.get(topic)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._topics[topic]
+                self._dirty.pop(topic, None)
+
+    def _remove(self, subscriber: Subscriber) -> None:
+        for topic in list(subscriber.topics):
+            self._unsubscribe(subscriber, topic)
+
+
+realtime_hub = RealtimeHub(
+    state_backend,
+    coalesce_interval=settings.REALTIME_COALESCE_MS / 1000,
+    max_pending=settings.REALTIME_MAX_PENDING,
+    send_timeout=settings.REALTIME_SEND_TIMEOUT,
+)
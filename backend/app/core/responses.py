@@ -0,0 +1,23 @@
+"""
+Palmlion Responses
+orjson-backed JSON response used as the application default
+"""
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+
+
+class ORJSONResponse(JSONResponse):
+    """
+    JSONResponse rendered with orjson
+
+    Routes with a response model hand this class plain JSON-ready data
+    produced by pydantic-core, so render() is a single orjson call with no
+    jsonable_encoder pass. numpy scalars from the scoring engine and
+    non-string dict keys are serialised natively.
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
@@ -0,0 +1,21 @@
+"""
+Palmlion Retry Helpers
+Exponential backoff with jitter for outbound gateway calls
+"""
+import random
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 30.0) -> float:
+    """
+    Full-jitter exponential backoff delay for a retry attempt
+
+    attempt is zero-based: the first retry waits up to `base` seconds,
+    each later retry doubles the ceiling until `cap`.
+    """
+    ceiling = min(cap, base * (2 ** attempt))
+    return random.uniform(0, ceiling)
+
+
+def is_retryable_status(status_code: int) -> bool:
+    """Gateway errors and rate limits are worth retrying, client errors are not"""
+    return status_code == 429 or status_code >= 500
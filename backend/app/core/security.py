@@ -0,0 +1,29 @@
+"""
+Palmlion Security
+Signed access tokens issued at registration
+"""
+import hashlib
+import hmac
+import time
+from typing import Optional
+
+
+def sign_access_token(secret: str, user_id: str, expires_at: int) -> str:
+    """Token naming the user, valid until the given unix time"""
+    message = f"{user_id}.{expires_at}".encode()
+    digest = hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+    return f"{user_id}.{expires_at}.{digest}"
+
+
+def verify_access_token(
+    secret: str, token: Optional[str], now: Optional[float] = None
+) -> Optional[str]:
+    """The token's user id, or None when it is malformed, forged or expired"""
+    if not token or token.count(".") < 2:
+        return None
+    rest, _, digest = token.rpartition(".")
+    user_id, _, expires = rest.rpartition(".")
+    if not user_id or not expires.isdigit() or int(expires) < (now or time.time()):
+        return None
+    expected = sign_access_token(secret, user_id, int(expires)).rpartition(".")[2]
+    return user_id if hmac.compare_digest(digest, expected) else None
@@ -0,0 +1,629 @@
+"""
+Palmlion Action Segments
+Day-partitioned, memory-mapped action log with vectorised scoring
+"""
+import bisect
+import hashlib
+import mmap
+import os
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+from app.core.conviction import (
+    ACTION_WEIGHTS,
+    PLATFORM_WEIGHTS,
+    ActionType,
+    ConvictionAction,
+    ConvictionScore,
+    Platform,
+    determine_conviction_tier,
+    estimate_conviction_percentile,
+    rate_active_days,
+)
+from app.core.lazy import lazy_import
+from app.core.metrics import SCORING_LATENCY
+from app.core.profiling import traced
+
+np = lazy_import("numpy")
+
+EPOCH = datetime(1970, 1, 1)
+DAY_US = 86_400_000_000
+
+SEGMENT_SUFFIX = ".seg"
+USERS_FILE = "users.txt"
+ARTISTS_FILE = "artists.txt"
+
+# Enum positions are the on-disk codes: only ever append new members
+ACTION_CODES = list(ActionType)
+PLATFORM_CODES = list(Platform)
+
+# A partition's user index is rebuilt once this many rows (or an eighth of
+# the indexed rows, if more) were appended since the last build
+REINDEX_MIN_ROWS = 4096
+
+
+@lru_cache(maxsize=None)
+def record_dtype() -> "np.dtype":
+    """
+    One action as a fixed-width 32-byte little-endian record
+
+    timestamp is microseconds since the epoch (UTC), user and artist
+    index the names files (artist 0 = untagged) and proof is a 64-bit
+    digest of proof_hash (0 = none).
+    """
+    return np.dtype([
+        ("timestamp", "<i8"),
+        ("proof", "<u8"),
+        ("user", "<u4"),
+        ("artist", "<u4"),
+        ("action", "u1"),
+        ("platform", "u1"),
+        ("verified", "u1"),
+        ("reserved", "V5"),
+    ])
+
+
+@lru_cache(maxsize=None)
+def _weight_tables() -> Tuple["np.ndarray", "np.ndarray"]:
+    """Platform and action weights indexed by their record codes"""
+    return (
+        np.array([PLATFORM_WEIGHTS.get(p, 1.0) for p in PLATFORM_CODES]),
+        np.array([float(ACTION_WEIGHTS.get(a, Decimal("1.0"))) for a in ACTION_CODES]),
+    )
+
+
+def record_weights(records: "np.ndarray") -> "np.ndarray":
+    """Platform x action weight of each record, before decay"""
+    platform_weights, action_weights = _weight_tables()
+    return platform_weights[records["platform"]] * action_weights[records["action"]]
+
+
+def _micros(timestamp: datetime) -> int:
+    """Action timestamps are naive UTC"""
+    return (timestamp.replace(tzinfo=None) - EPOCH) // timedelta(microseconds=1)
+
+
+def proof_digest(proof_hash: Optional[str]) -> int:
+    if not proof_hash:
+        return 0
+    return int.from_bytes(hashlib.blake2b(proof_hash.encode(), digest_size=8).digest(), "little")
+
+
+def _join(parts: List["np.ndarray"]) -> "np.ndarray":
+    if len(parts) < 2:
+        return parts[0] if parts else np.empty(0, record_dtype())
+    # Joined as opaque records: concatenating structured arrays
+    # compares their fields first
+    opaque = np.dtype((np.void, record_dtype().itemsize))
+    return np.concatenate([part.view(opaque) for part in parts]).view(record_dtype())
+
+
+def _segment_name(day: int) -> str:
+    return (EPOCH + timedelta(days=day)).strftime("%Y-%m-%d") + SEGMENT_SUFFIX
+
+
+def _segment_day(path: Path) -> Optional[int]:
+    try:
+        return (date.fromisoformat(path.stem) - EPOCH.date()).days
+    except ValueError:
+        return None
+
+
+def _dormant(tier: str) -> ConvictionScore:
+    return ConvictionScore(
+        score=0.0,
+        impact_power=Decimal("0"),
+        percentile=0.0,
+        tier=tier,
+        action_count=0,
+        platform_breakdown={},
+        consistency_rating="inactive",
+        streak_days=0,
+    )
+
+
+@SCORING_LATENCY.time()
+@traced("segments.score")
+def score_records(
+    records: "np.ndarray",
+    now: Optional[datetime] = None,
+    decay_rate: Optional[float] = None,
+    lookback_days: Optional[int] = None,
+) -> ConvictionScore:
+    """
+    calculate_conviction_score() over a user's records, without building
+    ConvictionAction objects: the same weights, decay, diversity bonus,
+    streak and consistency, as array operations
+    """
+    if decay_rate is None:
+        decay_rate = settings.CONVICTION_DECAY_RATE
+    if lookback_days is None:
+        lookback_days = settings.CONVICTION_LOOKBACK_DAYS
+    if not len(records):
+        return _dormant("unranked")
+
+    now_us = _micros(now or datetime.utcnow())
+    cutoff_us = now_us - lookback_days * DAY_US
+    timestamps = records["timestamp"]
+    recent = records[(records["verified"] != 0) & (timestamps >= cutoff_us)]
+    if not len(recent):
+        return _dormant("dormant")
+
+    platform_weights, action_weights = _weight_tables()
+    timestamps = recent["timestamp"]
+    weeks_ago = ((now_us - timestamps) // DAY_US) / 7
+    weights = (
+        np.exp(-decay_rate * weeks_ago)
+        * platform_weights[recent["platform"]]
+        * action_weights[recent["action"]]
+    )
+    total_score = float(weights.sum())
+    impact_power = Decimal(str(total_score * 10))
+
+    platform_counts = np.bincount(recent["platform"], minlength=len(PLATFORM_CODES))
+    platform_breakdown = {
+        PLATFORM_CODES[code].value: int(count)
+        for code, count in enumerate(platform_counts.tolist())
+        if count
+    }
+    total_score *= 1 + (len(platform_breakdown) / len(Platform)) * 0.2
+
+    # Streak: consecutive active days counted back from the most recent one
+    days = np.unique(timestamps // DAY_US)[::-1]
+    gaps = np.flatnonzero(days[:-1] - days[1:] != 1)
+    streak_days = int(gaps[0]) + 1 if len(gaps) else len(days)
+
+    return ConvictionScore(
+        score=round(total_score, 2),
+        impact_power=impact_power,
+        percentile=estimate_conviction_percentile(total_score),
+        tier=determine_conviction_tier(total_score),
+        action_count=len(recent),
+        platform_breakdown=platform_breakdown,
+        consistency_rating=rate_active_days(len(days), lookback_days),
+        streak_days=streak_days,
+    )
+
+
+class Partition:
+    """
+    One day's records: an append-only file, its memory map and a user index
+
+    The index orders the partition's rows by user (stably, so each user's
+    rows stay in append order) with indptr giving each user's slice.
+    Rows appended since it was built are tracked per user in a small tail
+    until there are enough of them to rebuild it; partitions loaded at
+    startup are indexed on first read.
+    """
+
+    def __init__(self, path: Path, day: int):
+        self.path = path
+        self.day = day
+        itemsize = record_dtype().itemsize
+        size = path.stat().st_size if path.exists() else 0
+        self.rows = size // itemsize
+        self._file = open(path, "ab", buffering=0)
+        if size % itemsize:
+            # A record torn by a crash mid-write
+            self._file.truncate(self.rows * itemsize)
+        self._map = None
+        self._order = np.empty(0, np.int64)
+        self._indptr = np.zeros(1, np.int64)
+        self._indexed = 0
+        self._tail: Dict[int, List[int]] = {}
+        self._tail_rows = 0
+        self._reindex_after = 0
+
+    def append(self, records: "np.ndarray") -> None:
+        self._file.write(records.tobytes())
+        for row, user in enumerate(records["user"].tolist(), start=self.rows):
+            self._tail.setdefault(user, []).append(row)
+        self.rows += len(records)
+        self._tail_rows += len(records)
+
+    def view(self) -> "np.ndarray":
+        """Every record in the partition, read-only and backed by the page cache"""
+        if self._map is None or len(self._map) != self.rows:
+            if self.rows:
+                # A plain ndarray over the mapping: np.memmap's subclass hooks
+                # cost more than the gathers it is used for
+                with open(self.path, "rb") as f:
+                    buffer = mmap.mmap(
+                        f.fileno(), self.rows * record_dtype().itemsize, access=mmap.ACCESS_READ
+                    )
+                self._map = np.frombuffer(buffer, record_dtype(), count=self.rows)
+            else:
+                self._map = np.empty(0, record_dtype())
+        return self._map
+
+    def _reindex(self) -> None:
+        users = self.view()["user"]
+        self._order = np.argsort(users, kind="stable")
+        counts = np.bincount(users) if len(users) else np.empty(0, np.int64)
+        self._indptr = np.zeros(len(counts) + 1, np.int64)
+        np.cumsum(counts, out=self._indptr[1:])
+        self._indexed = self.rows
+        self._tail.clear()
+        self._tail_rows = 0
+        self._reindex_after = max(REINDEX_MIN_ROWS, self.rows // 8)
+
+    def user_rows(self, user: int) -> "np.ndarray":
+        """Row numbers of the user's records, in append order"""
+        if self._indexed < self.rows and (
+            not self._indexed or self._tail_rows > self._reindex_after
+        ):
+            self._reindex()
+        indptr = self._indptr
+        if user + 1 < len(indptr):
+            start, end = indptr[user], indptr[user + 1]
+            rows = self._order[start:end] if end > start else None
+        else:
+            rows = None
+        tail = self._tail.get(user)
+        if tail:
+            tail = np.array(tail, np.int64)
+            rows = tail if rows is None else np.concatenate([rows, tail])
+        return rows if rows is not None else np.empty(0, np.int64)
+
+    def sync(self) -> None:
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self.sync()
+        self._file.close()
+        self._map = None
+
+
+class ActionLog:
+    """
+    Append-only, day-partitioned action log under one directory
+
+    Each UTC day of action timestamps is a file of fixed-width records
+    (see record_dtype); user ids and artist names are interned in
+    append-only names files, one per line. Reads map the partitions and
+    gather a user's rows through the partition indexes, so a cold start
+    loads only the names and scoring never builds ConvictionAction
+    objects. A user index records which days each user has records on
+    and how many, so a read visits only those partitions and count()
+    touches none. Partitions older than the lookback are deleted on open
+    and when the day rolls over.
+
+    Writes go straight to the files, so they survive a crash of the
+    process; sync() makes them durable and close() syncs. The log has a
+    single writer: use it from one process, and only from the event loop.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self._partitions: Dict[int, Partition] = {}
+        self._days: List[int] = []  # partition days, ascending
+        self._user_index: Dict[str, int] = {}
+        self._user_ids: List[str] = []
+        # Artist codes are 1-based; 0 marks an untagged action
+        self._artist_index: Dict[str, int] = {}
+        self._artist_names: List[str] = []
+        self._users_file = self._artists_file = None
+        self._today: Optional[int] = None
+        # User index: per user code, days[indptr[u]:indptr[u + 1]] are the
+        # days it had records on when the index was built, and totals[u] how
+        # many. Appends since then go to the tail; the whole index is rebuilt
+        # on the first read after partitions expire.
+        self._index_indptr: Optional["np.ndarray"] = None
+        self._index_days: Optional["np.ndarray"] = None
+        self._index_totals: Optional["np.ndarray"] = None
+        self._tail_days: Dict[int, List[int]] = {}
+        self._tail_counts: Dict[int, int] = {}
+
+    # --- lifecycle ---------------------------------------------------------
+
+    @property
+    def is_open(self) -> bool:
+        return self._users_file is not None
+
+    def open(self) -> None:
+        if self.is_open:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._user_ids, self._users_file = self._load_names(USERS_FILE)
+        self._user_index = {user_id: i for i, user_id in enumerate(self._user_ids)}
+        self._artist_names, self._artists_file = self._load_names(ARTISTS_FILE)
+        self._artist_index = {name: i + 1 for i, name in enumerate(self._artist_names)}
+
+        horizon = self._day_now() - settings.CONVICTION_LOOKBACK_DAYS
+        for path in sorted(self.directory.glob("*" + SEGMENT_SUFFIX)):
+            day = _segment_day(path)
+            if day is None:
+                continue
+            if day < horizon:
+                path.unlink()
+            else:
+                self._add_partition(day)
+        self._today = self._day_now()
+
+    def close(self) -> None:
+        if not self.is_open:
+            return
+        for partition in self._partitions.values():
+            partition.close()
+        for f in (self._users_file, self._artists_file):
+            os.fsync(f.fileno())
+            f.close()
+        self._partitions.clear()
+        self._days.clear()
+        self._drop_user_index()
+        self._users_file = self._artists_file = None
+
+    def sync(self) -> None:
+        """fsync everything appended so far; safe to run in a worker thread"""
+        partitions = list(self._partitions.values())
+        files = [self._users_file, self._artists_file]
+        for partition in partitions:
+            try:
+                partition.sync()
+            except ValueError:
+                pass  # dropped as expired since
+        for f in files:
+            if f is not None:
+                os.fsync(f.fileno())
+
+    def _load_names(self, filename: str) -> Tuple[List[str], object]:
+        path = self.directory / filename
+        data = path.read_bytes() if path.exists() else b""
+        complete = data.rfind(b"\n") + 1
+        f = open(path, "ab", buffering=0)
+        if complete != len(data):
+            # A name torn by a crash; no record refers to it yet
+            f.truncate(complete)
+        names = data[:complete].decode().split("\n")[:-1]
+        return names, f
+
+    @staticmethod
+    def _day_now() -> int:
+        return (datetime.utcnow() - EPOCH).days
+
+    def _roll(self) -> None:
+        today = self._day_now()
+        if today != self._today:
+            self._today = today
+            self.drop_expired(today)
+
+    def drop_expired(self, today: Optional[int] = None) -> List[int]:
+        """Delete partitions entirely before the lookback window; returns their days"""
+        if today is None:
+            today = self._day_now()
+        horizon = today - settings.CONVICTION_LOOKBACK_DAYS
+        expired = sorted(day for day in self._partitions if day < horizon)
+        for day in expired:
+            partition = self._partitions.pop(day)
+            self._days.remove(day)
+            partition.close()
+            partition.path.unlink(missing_ok=True)
+        if expired:
+            self._drop_user_index()
+        return expired
+
+    # --- writes ------------------------------------------------------------
+
+    def _add_partition(self, day: int) -> Partition:
+        partition = self._partitions[day] = Partition(self.directory / _segment_name(day), day)
+        bisect.insort(self._days, day)
+        return partition
+
+    def _intern(self, name: str, index: Dict[str, int], names: List[str], f, base: int) -> int:
+        code = index.get(name)
+        if code is None:
+            if "\n" in name:
+                raise ValueError(f"Names cannot contain newlines: {name!r}")
+            f.write(name.encode() + b"\n")
+            code = index[name] = len(names) + base
+            names.append(name)
+        return code
+
+    def append(self, user_id: str, actions: Sequence[ConvictionAction]) -> int:
+        """Write the actions to their days' partitions; returns how many were kept"""
+        if not actions:
+            return 0
+        self._roll()
+        # Interned even if every action is already expired, so the user scores as dormant
+        user = self._intern(user_id, self._user_index, self._user_ids, self._users_file, 0)
+        horizon = self._today - settings.CONVICTION_LOOKBACK_DAYS
+        timestamps = [_micros(a.timestamp) for a in actions]
+        kept = [i for i, ts in enumerate(timestamps) if ts // DAY_US >= horizon]
+        if not kept:
+            return 0
+
+        records = np.zeros(len(kept), record_dtype())
+        records["timestamp"] = [timestamps[i] for i in kept]
+        records["user"] = user
+        records["proof"] = [proof_digest(actions[i].proof_hash) for i in kept]
+        records["artist"] = [
+            self._intern(
+                name, self._artist_index, self._artist_names, self._artists_file, 1
+            ) if (name := actions[i].artist_name) else 0
+            for i in kept
+        ]
+        records["action"] = [ACTION_CODES.index(actions[i].action_type) for i in kept]
+        records["platform"] = [PLATFORM_CODES.index(actions[i].platform) for i in kept]
+        records["verified"] = [bool(actions[i].verified) for i in kept]
+
+        days = records["timestamp"] // DAY_US
+        for day in np.unique(days).tolist():
+            partition = self._partitions.get(day) or self._add_partition(day)
+            partition.append(records[days == day])
+            if self._index_indptr is not None and day not in self._user_days(user):
+                bisect.insort(self._tail_days.setdefault(user, []), day)
+        if self._index_indptr is not None:
+            self._tail_counts[user] = self._tail_counts.get(user, 0) + len(kept)
+        return len(kept)
+
+    # --- user index --------------------------------------------------------
+
+    def _drop_user_index(self) -> None:
+        self._index_indptr = self._index_days = self._index_totals = None
+        self._tail_days.clear()
+        self._tail_counts.clear()
+
+    def _build_user_index(self) -> None:
+        """One bincount per partition, then each day placed in its users' slices"""
+        n = len(self._user_ids)
+        totals = np.zeros(n, np.int64)
+        day_counts = np.zeros(n, np.int64)
+        present = []
+        for day in self._days:
+            per_user = np.bincount(self._partitions[day].view()["user"], minlength=n)
+            users = np.flatnonzero(per_user)
+            present.append((day, users))
+            totals += per_user
+            day_counts[users] += 1
+        indptr = np.zeros(n + 1, np.int64)
+        np.cumsum(day_counts, out=indptr[1:])
+        days = np.empty(indptr[-1], np.int64)
+        cursor = indptr[:-1].copy()
+        # Partitions in day order, so each user's slice fills ascending
+        for day, users in present:
+            days[cursor[users]] = day
+            cursor[users] += 1
+        self._index_indptr, self._index_days, self._index_totals = indptr, days, totals
+
+    def _user_days(self, user: int) -> List[int]:
+        """Days the user has records on, ascending"""
+        if self._index_indptr is None:
+            self._build_user_index()
+        indexed = []
+        if user + 1 < len(self._index_indptr):
+            start, end = self._index_indptr[user], self._index_indptr[user + 1]
+            indexed = self._index_days[start:end].tolist()
+        tail = self._tail_days.get(user)
+        return sorted(indexed + tail) if tail else indexed
+
+    # --- reads -------------------------------------------------------------
+
+    def records(self, user_id: str) -> "np.ndarray":
+        """The user's records in the live partitions, oldest day first"""
+        self._roll()
+        user = self._user_index.get(user_id)
+        parts = []
+        if user is not None:
+            for day in self._user_days(user):
+                partition = self._partitions[day]
+                rows = partition.user_rows(user)
+                if len(rows):
+                    parts.append(partition.view()[rows])
+        return _join(parts)
+
+    def since(self, timestamp_us: int) -> "np.ndarray":
+        """Every record from the timestamp (microseconds since the epoch) on, oldest day first"""
+        self._roll()
+        first = timestamp_us // DAY_US
+        parts = []
+        for day in self._days[bisect.bisect_left(self._days, first):]:
+            records = self._partitions[day].view()
+            if day == first:
+                records = records[records["timestamp"] >= timestamp_us]
+            if len(records):
+                parts.append(records)
+        return _join(parts)
+
+    def count(self, user_id: str) -> int:
+        user = self._user_index.get(user_id)
+        if user is None:
+            return 0
+        if self._index_indptr is None:
+            self._build_user_index()
+        indexed = int(self._index_totals[user]) if user < len(self._index_totals) else 0
+        return indexed + self._tail_counts.get(user, 0)
+
+    def user_ids(self) -> List[str]:
+        """Every user with records, including those whose records have all expired"""
+        return list(self._user_ids)
+
+    def artist_names(self) -> List[str]:
+        """Artist names by record code - 1"""
+        return list(self._artist_names)
+
+    def actions(self, user_id: str) -> List[ConvictionAction]:
+        """The user's records as ConvictionAction objects (proof hashes are not kept)"""
+        records = self.records(user_id)
+        return [
+            ConvictionAction(
+                action_type=ACTION_CODES[action],
+                platform=PLATFORM_CODES[platform],
+                timestamp=EPOCH + timedelta(microseconds=timestamp),
+                verified=bool(verified),
+                artist_name=self._artist_names[artist - 1] if artist else None,
+            )
+            for timestamp, artist, action, platform, verified in zip(
+                records["timestamp"].tolist(),
+                records["artist"].tolist(),
+                records["action"].tolist(),
+                records["platform"].tolist(),
+                records["verified"].tolist(),
+            )
+        ]
+
+    def score(self, user_id: str, now: Optional[datetime] = None) -> ConvictionScore:
+        records = self.records(user_id)
+        if not len(records) and user_id in self._user_index:
+            # Every action has aged out with its partition
+            return _dormant("dormant")
+        return score_records(records, now)
+
+    @traced("segments.score_all")
+    def score_all(self, now: Optional[datetime] = None) -> Tuple[List[str], "np.ndarray"]:
+        """
+        Every user's conviction score in one pass over the partitions
+
+        Scores match score() (total, decay and diversity bonus) and are
+        accumulated per partition with bincount, so a full rescore is a
+        sequential scan of the mapped files. Users without a positive
+        score are left out.
+        """
+        self._roll()
+        now_us = _micros(now or datetime.utcnow())
+        cutoff_us = now_us - settings.CONVICTION_LOOKBACK_DAYS * DAY_US
+        decay_rate = settings.CONVICTION_DECAY_RATE
+        platform_weights, action_weights = _weight_tables()
+        n = len(self._user_ids)
+        totals = np.zeros(n)
+        platforms = np.zeros((len(PLATFORM_CODES), n), bool)
+
+        for partition in self._partitions.values():
+            records = partition.view()
+            if not len(records):
+                continue
+            users, timestamps = records["user"], records["timestamp"]
+            platform, action = records["platform"], records["action"]
+            live = (records["verified"] != 0) & (timestamps >= cutoff_us) & (users < n)
+            if not live.all():
+                users, timestamps = users[live], timestamps[live]
+                platform, action = platform[live], action[live]
+                if not len(users):
+                    continue
+            # A partition spans a day or two of ages: decay them once each
+            age = (now_us - timestamps) // DAY_US
+            youngest = int(age.min())
+            decay = np.exp(-decay_rate * (np.arange(youngest, int(age.max()) + 1) / 7))
+            weights = decay[age - youngest] * platform_weights[platform] * action_weights[action]
+            totals += np.bincount(users, weights=weights, minlength=n)
+            platforms[platform, users] = True
+
+        totals *= 1 + (platforms.sum(axis=0) / len(Platform)) * 0.2
+        scored = np.flatnonzero(totals > 0)
+        return [self._user_ids[u] for u in scored.tolist()], np.round(totals[scored], 2)
+
+    def stats(self) -> dict:
+        return {
+            "partitions": len(self._partitions),
+            "records": sum(p.rows for p in self._partitions.values()),
+            "users": len(self._user_ids),
+            "artists": len(self._artist_names),
+            "oldest_day": _segment_name(min(self._partitions))[:-len(SEGMENT_SUFFIX)]
+            if self._partitions else None,
+        }
+
+
+action_log = ActionLog(settings.ACTION_LOG_DIR)
@@ -0,0 +1,397 @@
+"""
+Palmlion SMS Dispatch
+Async outbound SMS queue for OTP delivery via Africa's Talking
+"""
+import asyncio
+import logging
+import re
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from enum import Enum
+from typing import Dict, List, Optional
+from uuid import uuid4
+
+from app.core.config import settings
+from app.core.lazy import lazy_import
+from app.core.retry import backoff_delay, is_retryable_status
+from app.core.state import StateBackend, state_backend
+
+httpx = lazy_import("httpx")
+
+logger = logging.getLogger("palmlion.sms")
+
+# Africa's Talking per-recipient status codes
+# https://developers.africastalking.com/docs/sms/sending/bulk
+AT_SUCCESS_CODES = {100, 101, 102}  # Processed, Sent, Queued
+AT_RETRYABLE_CODES = {500, 501, 502}  # RiskHold, GatewayError, RejectedByGateway
+
+_NON_DIGITS = re.compile(r"\D")
+
+# State backend namespaces: receipts by message id, and message ids by the
+# gateway's id, which delivery report callbacks refer to
+RECEIPTS = "sms_receipts"
+GATEWAY_IDS = "sms_gateway_ids"
+
+
+class DeliveryStatus(str, Enum):
+    """SMS delivery lifecycle"""
+    QUEUED = "queued"
+    SENT = "sent"
+    DELIVERED = "delivered"
+    FAILED = "failed"
+    REJECTED = "rejected"
+
+
+@dataclass
+class SMSMessage:
+    """An outbound SMS waiting for dispatch"""
+    to: str
+    body: str
+    id: str = field(default_factory=lambda: uuid4().hex)
+    attempts: int = 0
+
+
+@dataclass
+class DeliveryReceipt:
+    """Delivery state of a single outbound SMS"""
+    message_id: str
+    phone: str
+    status: DeliveryStatus
+    attempts: int = 0
+    gateway_message_id: Optional[str] = None
+    status_code: Optional[int] = None
+    cost: Optional[str] = None
+    error: Optional[str] = None
+    updated_at: str = field(default_factory=lambda: datetime.utcnow().isoformat())
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), "status": self.status.value}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "DeliveryReceipt":
+        return cls(**{**data, "status": DeliveryStatus(data["status"])})
+
+
+class SMSQueueFullError(Exception):
+    """Raised when the outbound queue cannot take more messages"""
+
+
+class SMSDispatcher:
+    """
+    Background SMS sender
+
+    enqueue() returns immediately; a worker drains the queue in batches,
+    groups identical bodies into a single Africa's Talking bulk request,
+    and retries gateway failures with jittered backoff. Bulk sends take one
+    body, so OTPs (a unique code each) still go out one request per message;
+    their throughput comes from max_in_flight requests sharing the pooled
+    keep-alive connections. Without an API key the dispatcher runs in demo
+    mode and logs messages instead. Receipts live in the shared state
+    backend for receipt_ttl seconds, so a status poll or delivery report
+    can land on any worker.
+    """
+
+    def __init__(
+        self,
+        backend: StateBackend,
+        api_url: str,
+        username: str,
+        api_key: str,
+        sender_id: str = "",
+        batch_size: int = 100,
+        batch_window: float = 0.05,
+        max_retries: int = 4,
+        max_queue: int = 10_000,
+        max_in_flight: int = 32,
+        receipt_ttl: int = 24 * 3600,
+    ):
+        self.backend = backend
+        self.api_url = api_url
+        self.username = username
+        self.api_key = api_key
+        self.sender_id = sender_id
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.max_retries = max_retries
+        self.max_queue = max_queue
+        self.max_in_flight = max_in_flight
+        self.receipt_ttl = receipt_ttl
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._in_flight: Optional[asyncio.Semaphore] = None
+        self._pending: set = set()
+
+    @property
+    def demo_mode(self) -> bool:
+        return not self.api_key
+
+    async def start(self, transport: Optional["httpx.AsyncBaseTransport"] = None) -> None:
+        """Start the worker; pass a transport to run against a local stand-in"""
+        if self._worker is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._in_flight = asyncio.Semaphore(self.max_in_flight)
+        self._client = httpx.AsyncClient(
+            transport=transport,
+            timeout=httpx.Timeout(10.0, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=self.max_in_flight,
+                max_keepalive_connections=self.max_in_flight,
+            ),
+            headers={"apiKey": self.api_key, "Accept": "application/json"},
+        )
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Flush queued messages, then close the pooled client"""
+        if self._worker is None:
+            return
+        # Sends and scheduled retries can put messages back on the queue
+        while True:
+            await self._queue.join()
+            if not self._pending:
+                break
+            await asyncio.gather(*list(self._pending), return_exceptions=True)
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        await self._client.aclose()
+        self._worker = None
+        self._client = None
+
+    async def enqueue(self, phone: str, body: str) -> str:
+        """Queue an SMS without waiting on the gateway; returns the message id"""
+        message = SMSMessage(to=phone, body=body)
+        if self._queue is None:
+            raise SMSQueueFullError("SMS dispatcher is not running")
+        if self._queue.full():
+            raise SMSQueueFullError("SMS queue is full")
+        # Stored first, so the worker's updates always find the receipt
+        await self._store_receipt(DeliveryReceipt(message.id, phone, DeliveryStatus.QUEUED))
+        try:
+            self._queue.put_nowait(message)
+        except asyncio.QueueFull:
+            await self.backend.delete(RECEIPTS, message.id)
+            raise SMSQueueFullError("SMS queue is full")
+        return message.id
+
+    async def get_receipt(self, message_id: str) -> Optional[DeliveryReceipt]:
+        data = await self.backend.get(RECEIPTS, message_id)
+        return DeliveryReceipt.from_dict(data) if data else None
+
+    async def record_delivery_report(
+        self,
+        gateway_message_id: str,
+        status: str,
+        failure_reason: Optional[str] = None,
+    ) -> Optional[DeliveryReceipt]:
+        """Apply an Africa's Talking delivery report callback to the receipt"""
+        link = await self.backend.get(GATEWAY_IDS, gateway_message_id)
+        receipt = await self.get_receipt(link["message_id"]) if link else None
+        if receipt is None:
+            return None
+
+        if status == "Success":
+            receipt.status = DeliveryStatus.DELIVERED
+        elif status in ("Failed", "Rejected"):
+            receipt.status = DeliveryStatus.FAILED
+            receipt.error = failure_reason
+        receipt.updated_at = datetime.utcnow().isoformat()
+        await self._store_receipt(receipt)
+        return receipt
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue else 0,
+            "in_flight_batches": len(self._pending),
+            "mode": "demo" if self.demo_mode else "live",
+        }
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.monotonic() + self.batch_window
+
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                await asyncio.sleep(min(remaining, 0.005))
+
+            # Africa's Talking bulk send takes one body for many recipients
+            groups: Dict[str, List[SMSMessage]] = {}
+            for message in batch:
+                groups.setdefault(message.body, []).append(message)
+
+            for messages in groups.values():
+                await self._in_flight.acquire()
+                task = asyncio.create_task(self._send_group(messages))
+                self._pending.add(task)
+                task.add_done_callback(self._pending.discard)
+
+            for _ in batch:
+                self._queue.task_done()
+
+    async def _send_group(self, messages: List[SMSMessage]) -> None:
+        for message in messages:
+            message.attempts += 1
+        try:
+            if self.demo_mode:
+                for message in messages:
+                    logger.info(
+                        "Demo SMS", extra={"sms_id": message.id, "to": message.to,
+                                           "body": message.body},
+                    )
+                    await self._update(message, DeliveryStatus.SENT)
+                return
+
+            data = {
+                "username": self.username,
+                "to": ",".join(m.to for m in messages),
+                "message": messages[0].body,
+                "bulkSMSMode": "1",
+            }
+            if self.sender_id:
+                data["from"] = self.sender_id
+
+            try:
+                response = await self._client.post(self.api_url, data=data)
+            except httpx.HTTPError as e:
+                await self._retry(messages, str(e))
+                return
+
+            if response.status_code >= 400:
+                error = f"API error: {response.status_code}"
+                if is_retryable_status(response.status_code):
+                    await self._retry(messages, error)
+                else:
+                    for message in messages:
+                        await self._update(message, DeliveryStatus.REJECTED, error=error)
+                return
+
+            try:
+                payload = response.json()
+            except ValueError:
+                # Accepted but unreadable: resending could deliver the code twice
+                for message in messages:
+                    await self._update(
+                        message, DeliveryStatus.SENT, error="Unreadable gateway response"
+                    )
+                return
+            await self._apply_recipients(messages, payload)
+        finally:
+            self._in_flight.release()
+
+    async def _apply_recipients(self, messages: List[SMSMessage], payload: object) -> None:
+        data = payload.get("SMSMessageData") if isinstance(payload, dict) else None
+        recipients = data.get("Recipients") if isinstance(data, dict) else None
+        recipients = [r for r in recipients or [] if isinstance(r, dict)]
+
+        # The gateway may normalise numbers (dropping "+", adding spaces), so
+        # match on digits; anything left is paired by position, as recipients
+        # come back in the order they were sent
+        by_number: Dict[str, List[int]] = {}
+        for i, recipient in enumerate(recipients):
+            digits = _NON_DIGITS.sub("", str(recipient.get("number") or ""))
+            by_number.setdefault(digits, []).append(i)
+        matched: Dict[str, dict] = {}
+        unmatched = []
+        for message in messages:
+            positions = by_number.get(_NON_DIGITS.sub("", message.to))
+            if positions:
+                matched[message.id] = recipients[positions.pop(0)]
+            else:
+                unmatched.append(message)
+        leftovers = sorted(i for positions in by_number.values() for i in positions)
+        for message, i in zip(unmatched, leftovers):
+            matched[message.id] = recipients[i]
+
+        retry = []
+        for message in messages:
+            recipient = matched.get(message.id)
+            if recipient is None:
+                retry.append(message)
+                continue
+
+            code = recipient.get("statusCode")
+            fields = {
+                "gateway_message_id": recipient.get("messageId"),
+                "status_code": code,
+                "cost": recipient.get("cost"),
+            }
+            if code in AT_SUCCESS_CODES:
+                await self._update(message, DeliveryStatus.SENT, **fields)
+            elif code in AT_RETRYABLE_CODES:
+                retry.append(message)
+            else:
+                await self._update(
+                    message, DeliveryStatus.REJECTED, error=recipient.get("status"), **fields
+                )
+
+        if retry:
+            await self._retry(retry, "Gateway did not accept recipient")
+
+    async def _retry(self, messages: List[SMSMessage], error: str) -> None:
+        for message in messages:
+            if message.attempts > self.max_retries:
+                await self._update(message, DeliveryStatus.FAILED, error=error)
+                continue
+            await self._update(message, DeliveryStatus.QUEUED, error=error)
+            task = asyncio.create_task(self._requeue_later(message))
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+
+    async def _requeue_later(self, message: SMSMessage) -> None:
+        await asyncio.sleep(backoff_delay(message.attempts - 1))
+        try:
+            self._queue.put_nowait(message)
+        except asyncio.QueueFull:
+            await self._update(message, DeliveryStatus.FAILED, error="SMS queue is full")
+
+    async def _update(self, message: SMSMessage, status: DeliveryStatus, **fields) -> None:
+        receipt = await self.get_receipt(message.id)
+        if receipt is None:
+            receipt = DeliveryReceipt(message.id, message.to, status)
+        receipt.status = status
+        receipt.attempts = message.attempts
+        for name, value in fields.items():
+            setattr(receipt, name, value)
+        receipt.updated_at = datetime.utcnow().isoformat()
+        await self._store_receipt(receipt)
+        if fields.get("gateway_message_id"):
+            await self.backend.set(
+                GATEWAY_IDS,
+                receipt.gateway_message_id,
+                {"message_id": message.id},
+                ttl=self.receipt_ttl,
+            )
+
+    async def _store_receipt(self, receipt: DeliveryReceipt) -> None:
+        await self.backend.set(
+            RECEIPTS, receipt.message_id, receipt.to_dict(), ttl=self.receipt_ttl
+        )
+
+
+sms_dispatcher = SMSDispatcher(
+    state_backend,
+    api_url=settings.AFRICAS_TALKING_API_URL,
+    username=settings.AFRICAS_TALKING_USERNAME,
+    api_key=settings.AFRICAS_TALKING_API_KEY,
+    sender_id=settings.AFRICAS_TALKING_SENDER_ID,
+    batch_size=settings.SMS_BATCH_SIZE,
+    batch_window=settings.SMS_BATCH_WINDOW_MS / 1000,
+    max_retries=settings.SMS_MAX_RETRIES,
+    max_queue=settings.SMS_QUEUE_SIZE,
+    max_in_flight=settings.SMS_MAX_IN_FLIGHT,
+    receipt_ttl=settings.SMS_RECEIPT_TTL_HOURS * 3600,
+)
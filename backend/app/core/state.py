@@ -0,0 +1,363 @@
+"""
+Palmlion Shared State
+Namespaced document and list storage shared by every worker and pod
+"""
+import asyncio
+import bisect
+import json
+import time
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Set, Tuple
+
+from app.core.config import settings
+
+# User documents, written by the auth API and read wherever a user's
+# region or name is needed
+USERS = "users"
+
+
+def _encode(value) -> str:
+    return json.dumps(value, separators=(",", ":"), default=str)
+
+
+class StateBackend(ABC):
+    """
+    Key/value documents, append-only lists and ranked sets, grouped by namespace
+
+    Values are JSON documents, so every backend hands out fresh copies and
+    callers never share mutable state through it. Batch methods exist so
+    handlers can fetch what they need in one round trip. broadcast() and
+    listen() carry messages to every worker, the sender included.
+    """
+
+    # Whether stored values outlive the process, and whether other workers see them
+    durable = False
+    shared = False
+
+    @abstractmethod
+    async def get(self, namespace: str, key: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def get_many(self, namespace: str, keys: Sequence[str]) -> Dict[str, dict]:
+        """Documents for the keys that exist"""
+
+    @abstractmethod
+    async def set(self, namespace: str, key: str, value: dict, ttl: Optional[int] = None) -> None:
+        ...
+
+    @abstractmethod
+    async def set_many(self, namespace: str, items: Dict[str, dict]) -> None:
+        ...
+
+    @abstractmethod
+    async def set_if_absent(
+        self, namespace: str, key: str, value: dict, ttl: Optional[int] = None
+    ) -> bool:
+        """Store only if the key is free; True when this call stored it"""
+
+    @abstractmethod
+    async def pop(self, namespace: str, key: str) -> Optional[dict]:
+        """Atomically read and delete, so only one caller can consume a value"""
+
+    @abstractmethod
+    async def delete(self, namespace: str, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def append(self, namespace: str, key: str, values: Sequence[dict]) -> int:
+        """Append to a list; returns the new length"""
+
+    @abstractmethod
+    async def get_lists(self, namespace: str, keys: Sequence[str]) -> Dict[str, List[dict]]:
+        """Lists for many keys; missing keys map to empty lists"""
+
+    async def get_list(self, namespace: str, key: str) -> List[dict]:
+        return (await self.get_lists(namespace, [key]))[key]
+
+    @abstractmethod
+    async def list_keys(self, namespace: str) -> List[str]:
+        """Keys of the namespace's lists; a full scan, for rebuilding derived state"""
+
+    async def get_list_slice(
+        self, namespace: str, key: str, start: int, count: int
+    ) -> List[dict]:
+        """Up to count items of a list, from position start"""
+        return (await self.get_list(namespace, key))[start:start + count]
+
+    @abstractmethod
+    async def set_scores(self, namespace: str, key: str, scores: Dict[str, float]) -> None:
+        """Add members to a ranked set, or move them to a new score"""
+
+    @abstractmethod
+    async def get_top(self, namespace: str, key: str, count: int) -> List[Tuple[str, float]]:
+        """Up to count (member, score) pairs of a ranked set, highest score first"""
+
+    @abstractmethod
+    async def broadcast(self, channel: str, message: dict) -> None:
+        """Send a message to everyone listening on the channel, in any worker"""
+
+    @abstractmethod
+    def listen(self, channel: str) -> AsyncIterator[dict]:
+        """Messages broadcast on the channel from now on, until the iterator is closed"""
+
+    async def close(self) -> None:
+        pass
+
+
+class InMemoryStateBackend(StateBackend):
+    """
+    Single-process backend
+
+    Documents are stored encoded, matching Redis semantics: writes are
+    snapshots and reads return copies. Expired keys are dropped when read.
+    """
+
+    def __init__(self):
+        self._values: Dict[Tuple[str, str], str] = {}
+        self._expires: Dict[Tuple[str, str], float] = {}
+        self._lists: Dict[Tuple[str, str], List[str]] = {}
+        # Ranked sets: member -> score, and (-score, member) kept sorted
+        self._scores: Dict[Tuple[str, str], Dict[str, float]] = {}
+        self._ranked: Dict[Tuple[str, str], List[Tuple[float, str]]] = {}
+        self._listeners: Dict[str, Set[asyncio.Queue]] = {}
+
+    def _live(self, slot: Tuple[str, str]) -> Optional[str]:
+        expires = self._expires.get(slot)
+        if expires is not None and expires <= time.monotonic():
+            self._values.pop(slot, None)
+            self._expires.pop(slot, None)
+            return None
+        return self._values.get(slot)
+
+    def _store(self, slot: Tuple[str, str], value: dict, ttl: Optional[int]) -> None:
+        self._values[slot] = _encode(value)
+        if ttl:
+            self._expires[slot] = time.monotonic() + ttl
+        else:
+            self._expires.pop(slot, None)
+
+    async def get(self, namespace: str, key: str) -> Optional[dict]:
+        raw = self._live((namespace, key))
+        return json.loads(raw) if raw is not None else None
+
+    async def get_many(self, namespace: str, keys: Sequence[str]) -> Dict[str, dict]:
+        found = {}
+        for key in keys:
+            raw = self._live((namespace, key))
+            if raw is not None:
+                found[key] = json.loads(raw)
+        return found
+
+    async def set(self, namespace: str, key: str, value: dict, ttl: Optional[int] = None) -> None:
+        self._store((namespace, key), value, ttl)
+
+    async def set_many(self, namespace: str, items: Dict[str, dict]) -> None:
+        for key, value in items.items():
+            self._store((namespace, key), value, None)
+
+    async def set_if_absent(
+        self, namespace: str, key: str, value: dict, ttl: Optional[int] = None
+    ) -> bool:
+        slot = (namespace, key)
+        if self._live(slot) is not None:
+            return False
+        self._store(slot, value, ttl)
+        return True
+
+    async def pop(self, namespace: str, key: str) -> Optional[dict]:
+        slot = (namespace, key)
+        raw = self._live(slot)
+        self._values.pop(slot, None)
+        self._expires.pop(slot, None)
+        return json.loads(raw) if raw is not None else None
+
+    async def delete(self, namespace: str, key: str) -> bool:
+        slot = (namespace, key)
+        existed = self._live(slot) is not None or slot in self._lists or slot in self._scores
+        self._values.pop(slot, None)
+        self._expires.pop(slot, None)
+        self._lists.pop(slot, None)
+        self._scores.pop(slot, None)
+        self._ranked.pop(slot, None)
+        return existed
+
+    async def append(self, namespace: str, key: str, values: Sequence[dict]) -> int:
+        items = self._lists.setdefault((namespace, key), [])
+        items.extend(_encode(v) for v in values)
+        return len(items)
+
+    async def get_lists(self, namespace: str, keys: Sequence[str]) -> Dict[str, List[dict]]:
+        return {
+            key: [json.loads(raw) for raw in self._lists.get((namespace, key), ())]
+            for key in keys
+        }
+
+    async def list_keys(self, namespace: str) -> List[str]:
+        return [key for (ns, key), items in self._lists.items() if ns == namespace and items]
+
+    async def get_list_slice(
+        self, namespace: str, key: str, start: int, count: int
+    ) -> List[dict]:
+        items = self._lists.get((namespace, key), ())
+        return [json.loads(raw) for raw in items[start:start + count]]
+
+    async def set_scores(self, namespace: str, key: str, scores: Dict[str, float]) -> None:
+        slot = (namespace, key)
+        current = self._scores.setdefault(slot, {})
+        ranked = self._ranked.setdefault(slot, [])
+        for member, score in scores.items():
+            old = current.get(member)
+            if old == score:
+                continue
+            if old is not None:
+                del ranked[bisect.bisect_left(ranked, (-old, member))]
+            current[member] = score
+            bisect.insort(ranked, (-score, member))
+
+    async def get_top(self, namespace: str, key: str, count: int) -> List[Tuple[str, float]]:
+        ranked = self._ranked.get((namespace, key), [])
+        return [(member, -score) for score, member in ranked[:max(count, 0)]]
+
+    async def broadcast(self, channel: str, message: dict) -> None:
+        encoded = _encode(message)
+        for queue in self._listeners.get(channel, ()):
+            queue.put_nowait(encoded)
+
+    async def listen(self, channel: str) -> AsyncIterator[dict]:
+        queue: asyncio.Queue = asyncio.Queue()
+        self._listeners.setdefault(channel, set()).add(queue)
+        try:
+            while True:
+                yield json.loads(await queue.get())
+        finally:
+            self._listeners[channel].discard(queue)
+
+
+class RedisStateBackend(StateBackend):
+    """
+    Multi-worker backend
+
+    One pooled client is shared by all requests in a worker. Documents are
+    JSON strings under "{prefix}:{namespace}:{key}", lists are Redis lists
+    and ranked sets are sorted sets; broadcasts go over Redis pub/sub.
+    Batch reads use MGET or a non-transactional pipeline, so a handler
+    pays one round trip however many keys it touches.
+    """
+
+    durable = True
+    shared = True
+
+    def __init__(self, redis_url: str, prefix: str = "palmlion", max_connections: int = 64):
+        import redis.asyncio as redis
+
+        self._pool = redis.ConnectionPool.from_url(
+            redis_url, max_connections=max_connections, decode_responses=True
+        )
+        self._redis = redis.Redis(connection_pool=self._pool)
+        self._prefix = prefix
+
+    def _key(self, namespace: str, key: str) -> str:
+        return f"{self._prefix}:{namespace}:{key}"
+
+    async def get(self, namespace: str, key: str) -> Optional[dict]:
+        raw = await self._redis.get(self._key(namespace, key))
+        return json.loads(raw) if raw is not None else None
+
+    async def get_many(self, namespace: str, keys: Sequence[str]) -> Dict[str, dict]:
+        if not keys:
+            return {}
+        values = await self._redis.mget([self._key(namespace, k) for k in keys])
+        return {k: json.loads(v) for k, v in zip(keys, values) if v is not None}
+
+    async def set(self, namespace: str, key: str, value: dict, ttl: Optional[int] = None) -> None:
+        await self._redis.set(self._key(namespace, key), _encode(value), ex=ttl)
+
+    async def set_many(self, namespace: str, items: Dict[str, dict]) -> None:
+        if not items:
+            return
+        await self._redis.mset({self._key(namespace, k): _encode(v) for k, v in items.items()})
+
+    async def set_if_absent(
+        self, namespace: str, key: str, value: dict, ttl: Optional[int] = None
+    ) -> bool:
+        stored = await self._redis.set(self._key(namespace, key), _encode(value), ex=ttl, nx=True)
+        return bool(stored)
+
+    async def pop(self, namespace: str, key: str) -> Optional[dict]:
+        name = self._key(namespace, key)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            raw, _ = await pipe.get(name).delete(name).execute()
+        return json.loads(raw) if raw is not None else None
+
+    async def delete(self, namespace: str, key: str) -> bool:
+        return bool(await self._redis.delete(self._key(namespace, key)))
+
+    async def append(self, namespace: str, key: str, values: Sequence[dict]) -> int:
+        if not values:
+            return await self._redis.llen(self._key(namespace, key))
+        return await self._redis.rpush(self._key(namespace, key), *[_encode(v) for v in values])
+
+    async def get_lists(self, namespace: str, keys: Sequence[str]) -> Dict[str, List[dict]]:
+        if not keys:
+            return {}
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.lrange(self._key(namespace, key), 0, -1)
+            results = await pipe.execute()
+        return {key: [json.loads(raw) for raw in items] for key, items in zip(keys, results)}
+
+    async def list_keys(self, namespace: str) -> List[str]:
+        prefix = self._key(namespace, "")
+        keys = []
+        async for name in self._redis.scan_iter(match=prefix + "*", count=1000, _type="list"):
+            keys.append(name[len(prefix):])
+        return keys
+
+    async def get_list_slice(
+        self, namespace: str, key: str, start: int, count: int
+    ) -> List[dict]:
+        if count <= 0:
+            return []
+        items = await self._redis.lrange(self._key(namespace, key), start, start + count - 1)
+        return [json.loads(raw) for raw in items]
+
+    async def set_scores(self, namespace: str, key: str, scores: Dict[str, float]) -> None:
+        if scores:
+            await self._redis.zadd(self._key(namespace, key), scores)
+
+    async def get_top(self, namespace: str, key: str, count: int) -> List[Tuple[str, float]]:
+        if count <= 0:
+            return []
+        top = await self._redis.zrevrange(self._key(namespace, key), 0, count - 1, withscores=True)
+        return [(member, float(score)) for member, score in top]
+
+    async def broadcast(self, channel: str, message: dict) -> None:
+        await self._redis.publish(self._key("channel", channel), _encode(message))
+
+    async def listen(self, channel: str) -> AsyncIterator[dict]:
+        # Pub/sub holds a connection of its own for as long as it listens
+        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(self._key("channel", channel))
+        try:
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    yield json.loads(message["data"])
+        finally:
+            await pubsub.aclose()
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+        await self._pool.disconnect()
+
+
+def create_state_backend() -> StateBackend:
+    """Build the backend selected by STATE_BACKEND"""
+    if settings.STATE_BACKEND == "redis":
+        return RedisStateBackend(
+            str(settings.REDIS_URL), max_connections=settings.STATE_REDIS_MAX_CONNECTIONS
+        )
+    return InMemoryStateBackend()
+
+
+state_backend = create_state_backend()
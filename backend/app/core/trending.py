@@ -0,0 +1,294 @@
+"""
+Palmlion Trending Engine
+Sliding-window Count-Min sketches and Space-Saving heavy hitters per region
+"""
+import heapq
+import math
+import time
+from array import array
+from operator import sub
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.core.analytics import ALL_REGIONS, RegionalAnalytics
+from app.core.config import settings
+from app.core.conviction import ConvictionAction
+from app.core.metrics import TRENDING_EVENTS
+
+# What can trend; tracks come from an action's metadata["track"]
+KINDS = ("artist", "track", "mission")
+
+_MASK32 = (1 << 32) - 1
+
+# (kind, key, label, sketch cells)
+Event = Tuple[str, str, str, List[int]]
+
+
+class PaneClock:
+    """Which fixed-width panes of a ring the window has slid past"""
+
+    __slots__ = ("width", "panes", "head")
+
+    def __init__(self, span: float, panes: int):
+        self.width = span / panes
+        self.panes = panes
+        self.head: Optional[int] = None
+
+    def advance(self, now: float) -> range:
+        """Absolute numbers of the panes that became current since the last call"""
+        head = int(now // self.width)
+        if self.head is None or head - self.head >= self.panes:
+            self.head = head
+            return range(head - self.panes + 1, head + 1)
+        if head <= self.head:
+            return range(0)
+        expired = range(self.head + 1, head + 1)
+        self.head = head
+        return expired
+
+    @property
+    def slot(self) -> int:
+        """Ring slot of the current pane"""
+        return self.head % self.panes
+
+
+class SlidingCountMin:
+    """
+    Count-Min sketch over a sliding window
+
+    One int32 sketch per pane plus their running sum, so an update
+    touches `depth` counters twice and an estimate reads `depth`
+    counters. When a pane expires it is subtracted from the sum and
+    replaced with a zeroed one.
+    """
+
+    def __init__(self, span: float, panes: int, width: int, depth: int):
+        self.clock = PaneClock(span, panes)
+        self.span = span
+        self._size = width * depth
+        self._panes = [array("i", bytes(4 * self._size)) for _ in range(panes)]
+        self._total = array("i", bytes(4 * self._size))
+
+    def advance(self, now: float) -> List[int]:
+        """Slide the window to now; returns the ring slots that were expired"""
+        expired = []
+        for pane in self.clock.advance(now):
+            slot = pane % self.clock.panes
+            counts = self._panes[slot]
+            if any(counts):
+                self._total = array("i", map(sub, self._total, counts))
+                self._panes[slot] = array("i", bytes(4 * self._size))
+            expired.append(slot)
+        return expired
+
+    def add(self, cells: Sequence[int]) -> None:
+        """Count one event in the current pane; call advance() first"""
+        pane, total = self._panes[self.clock.slot], self._total
+        for cell in cells:
+            pane[cell] += 1
+            total[cell] += 1
+
+    def estimate(self, cells: Sequence[int]) -> int:
+        """Upper bound of the event's count over the window"""
+        total = self._total
+        return min(total[cell] for cell in cells)
+
+
+def sketch_cells(key: str, width: int, depth: int) -> List[int]:
+    """Flat counter index per sketch row, by double hashing one 64-bit hash"""
+    value = hash(key)
+    h1, h2 = value & _MASK32, ((value >> 32) & _MASK32) | 1
+    return [row * width + (h1 + row * h2) % width for row in range(depth)]
+
+
+class SpaceSaving:
+    """
+    Top-k candidates of a stream in bounded memory (Metwally et al.)
+
+    A new item evicts the smallest counter and inherits its count as an
+    overestimate. The min-heap holds one (count, key) per item and is only
+    corrected when a popped entry turns out to be stale, so counting an
+    item that is already tracked is a dict update.
+    """
+
+    __slots__ = ("capacity", "counts", "labels", "_heap")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counts: Dict[str, int] = {}
+        self.labels: Dict[str, str] = {}
+        self._heap: List[Tuple[int, str]] = []
+
+    def offer(self, key: str, label: str, count: int = 1) -> None:
+        counts = self.counts
+        if key in counts:
+            counts[key] += count
+            return
+        if len(counts) < self.capacity:
+            counts[key] = count
+        else:
+            # Heap counts only ever lag behind, so a current entry is the minimum
+            while True:
+                recorded, victim = self._heap[0]
+                if counts[victim] == recorded:
+                    break
+                heapq.heapreplace(self._heap, (counts[victim], victim))
+            heapq.heappop(self._heap)
+            del counts[victim], self.labels[victim]
+            counts[key] = recorded + count
+        self.labels[key] = label
+        heapq.heappush(self._heap, (counts[key], key))
+
+    def clear(self) -> None:
+        self.counts.clear()
+        self.labels.clear()
+        self._heap.clear()
+
+
+class RegionTrends:
+    """
+    Sketches and candidates for one region
+
+    `recent` covers the trending window and `baseline` the longer window
+    it is compared with; both have the same shape, so an event's cells
+    are hashed once, and every kind shares them through prefixed keys.
+    Candidates are Space-Saving summaries per kind and recent pane, so a
+    burst that started seconds ago is already a candidate and items that
+    faded out of the window drop out.
+    """
+
+    def __init__(self, now: float, width: int, depth: int):
+        panes = settings.TRENDING_PANES
+        self.width, self.depth = width, depth
+        self.recent = SlidingCountMin(settings.TRENDING_WINDOW_SECONDS, panes, width, depth)
+        self.baseline = SlidingCountMin(settings.TRENDING_BASELINE_SECONDS, panes, width, depth)
+        self.candidates = {
+            kind: [SpaceSaving(settings.TRENDING_CANDIDATES) for _ in range(panes)]
+            for kind in KINDS
+        }
+        self.started = now
+
+    def advance(self, now: float) -> None:
+        for slot in self.recent.advance(now):
+            for summaries in self.candidates.values():
+                summaries[slot].clear()
+        self.baseline.advance(now)
+
+    def add(self, events: Sequence[Event], now: float) -> None:
+        self.advance(now)
+        slot = self.recent.clock.slot
+        for kind, key, label, cells in events:
+            self.recent.add(cells)
+            self.baseline.add(cells)
+            self.candidates[kind][slot].offer(key, label)
+
+    def top(self, kind: str, limit: int, now: float) -> List[dict]:
+        self.advance(now)
+        labels: Dict[str, str] = {}
+        for summary in self.candidates[kind]:
+            labels.update(summary.labels)
+
+        # Expected count in the trending window at the baseline's rate, from
+        # the part of the baseline outside the trending window that has
+        # been observed so far
+        window = self.recent.span
+        observed = min(self.baseline.span, now - self.started)
+        rate_scale = window / max(observed - window, window)
+
+        items = []
+        for key, label in labels.items():
+            cells = sketch_cells(key, self.width, self.depth)
+            recent = self.recent.estimate(cells)
+            if recent <= 0:
+                continue
+            baseline = self.baseline.estimate(cells)
+            expected = max(baseline - recent, 0) * rate_scale
+            items.append({
+                "name": label,
+                "recent_count": recent,
+                "baseline_count": baseline,
+                "expected_count": round(expected, 2),
+                "score": round((recent - expected) / math.sqrt(expected + 1), 3),
+            })
+        return heapq.nlargest(limit, items, key=lambda item: item["score"])
+
+
+class TrendingEngine:
+    """
+    Streaming trending artists, tracks and missions per region
+
+    record_actions() and record_mission() hash each event once and update
+    the region's and the "all" sketches and candidates: a fixed number of
+    counter increments per event, whatever the event rate. Memory is
+    bounded by TRENDING_MAX_REGIONS x two sketches of width x depth x
+    panes; events from regions beyond the cap only count towards "all".
+    Sketches live in this process, like the realtime hub.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self.clock = clock
+        self._regions: Dict[str, RegionTrends] = {}
+        # (width, depth, max regions), read from settings on first use
+        self._shape: Optional[Tuple[int, int, int]] = None
+
+    def _region(self, region: str, now: float) -> Optional[RegionTrends]:
+        trends = self._regions.get(region)
+        width, depth, max_regions = self._shape
+        if trends is None and len(self._regions) <= max_regions:
+            trends = self._regions[region] = RegionTrends(now, width, depth)
+        return trends
+
+    def _record(self, region: Optional[str], named: List[Tuple[str, str]]) -> None:
+        if not named:
+            return
+        if self._shape is None:
+            self._shape = (
+                settings.TRENDING_SKETCH_WIDTH,
+                settings.TRENDING_SKETCH_DEPTH,
+                settings.TRENDING_MAX_REGIONS,
+            )
+        width, depth, _ = self._shape
+        now = self.clock()
+        events = []
+        kinds: Dict[str, int] = {}
+        for kind, label in named:
+            key = f"{kind}:{label.lower()}"
+            events.append((kind, key, label, sketch_cells(key, width, depth)))
+            kinds[kind] = kinds.get(kind, 0) + 1
+        region = RegionalAnalytics.normalize(region)
+        for name in (ALL_REGIONS, region):
+            trends = self._region(name, now) if name else None
+            if trends is not None:
+                trends.add(events, now)
+        for kind, count in kinds.items():
+            TRENDING_EVENTS.inc(kind, amount=count)
+
+    @staticmethod
+    def _named(kind: str, name: object) -> Iterable[Tuple[str, str]]:
+        label = str(name).strip() if name is not None else ""
+        if label:
+            yield kind, label
+
+    def record_actions(self, region: Optional[str], actions: Sequence[ConvictionAction]) -> None:
+        """Feed verified actions: their artist and, when tagged, their track"""
+        named = []
+        for action in actions:
+            if action.verified:
+                named.extend(self._named("artist", action.artist_name))
+                named.extend(self._named("track", (action.metadata or {}).get("track")))
+        self._record(region, named)
+
+    def record_mission(self, region: Optional[str], mission_id: str, artist_name: str) -> None:
+        """Feed one mission submission, counting towards the mission and its artist"""
+        self._record(region, [*self._named("mission", mission_id),
+                              *self._named("artist", artist_name)])
+
+    def top(self, region: Optional[str], kind: str, limit: int = 10) -> List[dict]:
+        """Fastest-rising items of a kind, scored against their baseline rate"""
+        if kind not in KINDS:
+            raise ValueError(f"Unknown kind: {kind}")
+        name = RegionalAnalytics.normalize(region) or ALL_REGIONS
+        trends = self._regions.get(name)
+        return trends.top(kind, limit, self.clock()) if trends is not None else []
+
+
+trending_engine = TrendingEngine()
@@ -2,14 +2,19 @@
 Palmlion Verification Engine
 Verify African superfan actions via streaming, social, and telco APIs
 """
+import functools
+import time
 from dataclasses import dataclass
 from datetime import datetime
 from enum import Enum
 from typing import Optional
 
-import httpx
-
 from app.core.config import settings
+from app.core.lazy import lazy_import
+from app.core.metrics import VERIFICATION_LATENCY, VERIFICATION_RESULTS
+from app.core.profiling import span
+
+httpx = lazy_import("httpx")
 
 
 class VerificationStatus(str, Enum):
@@ -41,6 +46,26 @@ class VerificationResult:
     error: Optional[str] = None
 
 
+def instrumented(provider: str):
+    """Record provider latency, verification outcome and a profiling span for a verify_* call"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs) -> VerificationResult:
+            start = time.perf_counter()
+            with span(f"verify.{provider}"):
+                result = await func(*args, **kwargs)
+            VERIFICATION_LATENCY.observe(time.perf_counter() - start, provider)
+            if result.verified:
+                outcome = "verified"
+            else:
+                outcome = "error" if result.error else "rejected"
+            VERIFICATION_RESULTS.inc(provider, outcome)
+            return result
+        return wrapper
+    return decorator
+
+
+@instrumented("boomplay")
 async def verify_boomplay_streams(
     user_id: str,
     track_id: str,
@@ -93,6 +118,7 @@ async def verify_boomplay_streams(
             )
 
 
+@instrumented("audiomack")
 async def verify_audiomack_plays(
     user_id: str,
     track_id: str,
@@ -144,6 +170,7 @@ async def verify_audiomack_plays(
             )
 
 
+@instrumented("africas_talking")
 async def verify_phone_via_africas_talking(
     phone_number: str,
     otp_code: str,
@@ -166,6 +193,7 @@ async def verify_phone_via_africas_talking(
     )
 
 
+@instrumented("mtn_momo")
 async def verify_mtn_momo_payment(
     phone_number: str,
     transaction_id: str,
@@ -221,6 +249,7 @@ async def verify_mtn_momo_payment(
             )
 
 
+@instrumented("telegram")
 async def verify_telegram_membership(
     telegram_user_id: str,
     chat_id: str,
@@ -6,42 +6,20 @@ Target: African superfans, music analytics, conviction scoring
 Markets: Lagos, Nairobi, Johannesburg, Accra, Kampala
 Excludes: Casual listeners, passive Western APIs that extract African data
 """
+import logging
 from contextlib import asynccontextmanager
 from datetime import datetime
+from typing import TYPE_CHECKING, Optional, Sequence
 
-from fastapi import FastAPI, Request
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-
-from app.api.v1.router import api_router
 from app.core.config import settings
 
+if TYPE_CHECKING:
+    import httpx
+    from fastapi import FastAPI
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    """Application lifespan events"""
-    print(f"""
-╔═══════════════════════════════════════════════════════════════╗
-║                                                               ║
-║     🦁 PALMLION - African Music Analytics Engine 🦁           ║
-║                                                               ║
-║     API:     http://localhost:4001                            ║
-║     Docs:    http://localhost:4001/docs                       ║
-║     Health:  http://localhost:4001/health                     ║
-║                                                               ║
-║     Markets: Lagos | Nairobi | Joburg | Accra | Kampala       ║
-║                                                               ║
-║     African data. African sovereignty.                        ║
-║                                                               ║
-╚═══════════════════════════════════════════════════════════════╝
-    """)
-    yield
-    print("[Palmlion] Shutting down...")
-
+logger = logging.getLogger("palmlion")
 
-app = FastAPI(
-    title="Palmlion API",
-    description="""
+DESCRIPTION = """
 ## Palmlion - African Music Analytics & Conviction Scoring Engine
 
 ### Target Audience
@@ -62,77 +40,210 @@ Lagos, Nairobi, Johannesburg, Accra, Kampala
 - Convicta: Export conviction data
 - Issuance: Trigger fractional IP stakes
 - #PalmDash: Telegram/WhatsApp missions
-    """,
-    version=settings.APP_VERSION,
-    lifespan=lifespan,
-    docs_url="/docs",
-    redoc_url="/redoc",
-)
-
-# CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=settings.CORS_ORIGINS,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    """Log all API requests"""
-    start_time = datetime.utcnow()
-    response = await call_next(request)
-    duration = (datetime.utcnow() - start_time).total_seconds()
-
-    if request.url.path != "/health":
-        print(f"[{request.method}] {request.url.path} - {response.status_code} ({duration:.3f}s)")
-
-    return response
-
-
-@app.get("/health", tags=["Health"])
-async def health_check():
-    """Health check endpoint"""
-    return {
-        "status": "healthy",
-        "app": "palmlion",
-        "version": settings.APP_VERSION,
-        "timestamp": datetime.utcnow().isoformat(),
-    }
-
-
-@app.get("/", tags=["Root"])
-async def root():
-    """Root endpoint - platform info"""
-    return {
-        "app": "Palmlion",
-        "tagline": "African Music Analytics & Conviction Scoring Engine",
-        "version": settings.APP_VERSION,
-        "docs": "/docs",
-        "health": "/health",
-        "api": "/api/v1",
-    }
-
-
-# Include API routes
-app.include_router(api_router, prefix=settings.API_V1_PREFIX)
-
-
-@app.exception_handler(Exception)
-async def global_exception_handler(request: Request, exc: Exception):
-    """Handle unexpected exceptions"""
-    print(f"[Error] {request.url.path}: {exc}")
-    return JSONResponse(
-        status_code=500,
-        content={
-            "error": "Internal server error",
-            "detail": str(exc) if settings.DEBUG else "An unexpected error occurred",
-        },
+"""
+
+
+@asynccontextmanager
+async def lifespan(app: "FastAPI"):
+    """Application lifespan events"""
+    from app.core.actions import action_store
+    from app.core.ingest import ingest_pipeline
+    from app.core.issuance import mint_pipeline
+    from app.core.lifecycle import mission_lifecycle
+    from app.core.log import setup_logging, shutdown_logging
+    from app.core.outbox import convicta_outbox, convicta_pusher
+    from app.core.progress import progress_backend
+    from app.core.proofs import proof_index
+    from app.core.reach import fan_reach
+    from app.core.realtime import realtime_hub
+    from app.core.sms import sms_dispatcher
+    from app.core.state import state_backend
+
+    setup_logging(settings.LOG_LEVEL, settings.ACCESS_LOG)
+    print(f"""
+╔═══════════════════════════════════════════════════════════════╗
+║                                                               ║
+║     🦁 PALMLION - African Music Analytics Engine 🦁           ║
+║                                                               ║
+║     API:     http://localhost:4001                            ║
+║     Docs:    http://localhost:4001/docs                       ║
+║     Health:  http://localhost:4001/health                     ║
+║                                                               ║
+║     Markets: Lagos | Nairobi | Joburg | Accra | Kampala       ║
+║                                                               ║
+║     African data. African sovereignty.                        ║
+║                                                               ║
+╚═══════════════════════════════════════════════════════════════╝
+    """)
+    if not settings.access_tokens_allowed:
+        logger.warning("JWT_SECRET_KEY is the default; access tokens are disabled")
+    # Outbound provider calls go through app.state.provider_transport when set
+    transport = getattr(app.state, "provider_transport", None)
+    action_store.open()
+    await action_store.restore()
+    await action_store.seed_demo()
+    await action_store.start()
+    proof_index.open()
+    await ingest_pipeline.start()
+    await sms_dispatcher.start(transport)
+    await realtime_hub.start()
+    await mission_lifecycle.start()
+    await mint_pipeline.start(transport)
+    convicta_outbox.open()
+    await convicta_pusher.start(transport)
+    yield
+    logger.info("Shutting down")
+    await ingest_pipeline.stop()
+    await action_store.stop()
+    proof_index.close()
+    await mission_lifecycle.stop()
+    await convicta_pusher.stop()
+    await mint_pipeline.stop()
+    convicta_outbox.close()
+    await realtime_hub.stop()
+    await sms_dispatcher.stop()
+    await progress_backend.close()
+    await fan_reach.close()
+    action_store.close()
+    await state_backend.close()
+    shutdown_logging()
+
+
+def create_app(
+    enabled_routers: Optional[Sequence[str]] = None,
+    provider_transport: Optional["httpx.AsyncBaseTransport"] = None,
+) -> "FastAPI":
+    """
+    Build the API application
+
+    FastAPI, the routers and their dependencies are imported here rather
+    than when app.main is imported, so workers and CLIs that only need
+    app.core stay light. enabled_routers (default: settings.ENABLED_ROUTERS,
+    empty for all) limits which API routers are mounted and imported.
+    provider_transport, if given, carries the SMS, Issuance and Convicta
+    calls instead of the network (used by the load tests).
+
+    Run with `uvicorn app.main:create_app --factory`, or `app.main:app`.
+    """
+    from fastapi import FastAPI, Request
+    from fastapi.middleware.cors import CORSMiddleware
+    from fastapi.responses import JSONResponse, Response
+
+    from app.api.v1.router import build_api_router, cache_policies
+    from app.core.admission import AdmissionMiddleware
+    from app.core.cache import ResponseCache, ResponseCacheMiddleware
+    from app.core.metrics import PROMETHEUS_CONTENT_TYPE, REGISTRY, MetricsMiddleware
+    from app.core.responses import ORJSONResponse
+
+    app = FastAPI(
+        title="Palmlion API",
+        description=DESCRIPTION,
+        version=settings.APP_VERSION,
+        lifespan=lifespan,
+        default_response_class=ORJSONResponse,
+        docs_url="/docs",
+        redoc_url="/redoc",
+    )
+    app.state.provider_transport = provider_transport
+
+    if enabled_routers is None:
+        enabled_routers = settings.ENABLED_ROUTERS
+
+    # Per-route-class concurrency limits; innermost, so cache hits and exempt
+    # routes never wait behind saturated write paths
+    if settings.ADMISSION_ENABLED:
+        app.add_middleware(AdmissionMiddleware, prefix=settings.API_V1_PREFIX)
+
+    # Read-mostly GETs answered from memory, with ETag/304 and Cache-Control.
+    # Added early so it sits inside CORS and never replays another origin's headers.
+    if settings.RESPONSE_CACHE_ENABLED:
+        app.add_middleware(
+            ResponseCacheMiddleware,
+            cache=ResponseCache(max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES),
+            policies=cache_policies(enabled_routers, prefix=settings.API_V1_PREFIX),
+        )
+
+    # CORS middleware
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=settings.CORS_ORIGINS,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
     )
 
+    # Per-route latency histograms, status counters and structured access logs
+    app.add_middleware(MetricsMiddleware)
+
+    # Sampling profiles for requests carrying a signed X-Palmlion-Profile header
+    if settings.profiling_allowed:
+        from app.core.profiling import ProfilingMiddleware, profiler
+        app.add_middleware(ProfilingMiddleware, secret=settings.SECRET_KEY, profiler=profiler)
+
+    @app.get("/metrics", tags=["Health"], include_in_schema=False)
+    async def metrics() -> Response:
+        """Prometheus metrics"""
+        return Response(REGISTRY.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+    @app.get("/health", tags=["Health"])
+    async def health_check():
+        """Health check endpoint"""
+        return {
+            "status": "healthy",
+            "app": "palmlion",
+            "version": settings.APP_VERSION,
+            "timestamp": datetime.utcnow().isoformat(),
+        }
+
+    @app.get("/", tags=["Root"])
+    async def root():
+        """Root endpoint - platform info"""
+        return {
+            "app": "Palmlion",
+            "tagline": "African Music Analytics & Conviction Scoring Engine",
+            "version": settings.APP_VERSION,
+            "docs": "/docs",
+            "health": "/health",
+            "api": "/api/v1",
+        }
+
+    # Include API routes
+    app.include_router(build_api_router(enabled_routers), prefix=settings.API_V1_PREFIX)
+
+    @app.exception_handler(Exception)
+    async def global_exception_handler(request: Request, exc: Exception):
+        """Handle unexpected exceptions"""
+        logger.exception("Unhandled error", extra={"path": request.url.path})
+        return JSONResponse(
+            status_code=500,
+            content={
+                "error": "Internal server error",
+                "detail": str(exc) if settings.DEBUG else "An unexpected error occurred",
+            },
+        )
+
+    return app
+
+
+_app: Optional["FastAPI"] = None
+
+
+def __getattr__(name: str):
+    # `app.main:app` builds the default application on first access
+    global _app
+    if name == "app":
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("app.main:app", host="0.0.0.0", port=4001, reload=settings.DEBUG)
+    uvicorn.run(
+        "app.main:create_app",
+        factory=True,
+        host="0.0.0.0",
+        port=4001,
+        reload=settings.DEBUG,
+    )
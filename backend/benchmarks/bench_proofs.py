@@ -0,0 +1,76 @@
+"""
+Palmlion Proof Index Benchmark
+Claims, negative and positive lookups and bytes per proof across generations
+
+Run from backend/:  python -m benchmarks.bench_proofs [--proofs 1000000] [--generations 3]
+"""
+import argparse
+import shutil
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+from app.core.proofs import ProofIndex
+from app.core.segments import EPOCH
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--proofs", type=int, default=1_000_000, help="proofs per generation")
+    parser.add_argument("--generations", type=int, default=3)
+    parser.add_argument("--batch", type=int, default=5000, help="digests per claim() call")
+    parser.add_argument("--fp-rate", type=float, default=0.01)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="palmlion-proofs-")
+    rng = np.random.default_rng(7)
+    try:
+        index = ProofIndex(
+            directory, generations=args.generations, capacity=args.proofs, fp_rate=args.fp_rate,
+        )
+        index.open()
+        today = (datetime.utcnow() - EPOCH).days
+        claimed = []
+        start = time.perf_counter()
+        # Fill every live generation, oldest first
+        for g in range(args.generations + 1):
+            index.rotate(today + g * index.period_days)
+            digests = rng.integers(2, 2 ** 64, args.proofs, dtype=np.uint64, endpoint=False)
+            for i in range(0, len(digests), args.batch):
+                index.claim(digests[i:i + args.batch].tolist())
+            claimed.append(digests)
+        elapsed = time.perf_counter() - start
+        total = len(index)
+        stats = index.stats()
+        print(f"{stats['generations']} generations of {stats['period_days']} days, {total} proofs")
+        print(f"  claim                   : {elapsed / total * 1e9:10.0f} ns/proof")
+
+        unseen = rng.integers(2, 2 ** 64, 1_000_000, dtype=np.uint64, endpoint=False)
+        batches = [unseen[i:i + args.batch].tolist() for i in range(0, len(unseen), args.batch)]
+        for batch in batches:
+            index.seen(batch)  # fault the pages in
+        start = time.perf_counter()
+        for batch in batches:
+            index.seen(batch)
+        elapsed = time.perf_counter() - start
+        print(f"  negative lookup         : {elapsed / len(unseen) * 1e9:10.0f} ns/proof")
+
+        seen = np.concatenate([c[:250_000] for c in claimed])
+        batches = [seen[i:i + args.batch].tolist() for i in range(0, len(seen), args.batch)]
+        start = time.perf_counter()
+        found = sum(sum(index.seen(batch)) for batch in batches)
+        elapsed = time.perf_counter() - start
+        print(f"  positive lookup         : {elapsed / len(seen) * 1e9:10.0f} ns/proof"
+              f"  ({found}/{len(seen)} found)")
+
+        print(f"  Bloom filters           : {stats['bloom_bytes'] / total:10.2f} bytes/proof")
+        print(f"  tables (on disk)        : {stats['table_bytes'] / total:10.2f} bytes/proof")
+        index.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
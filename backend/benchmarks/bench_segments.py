@@ -0,0 +1,95 @@
+"""
+Palmlion Action Segments Benchmark
+Cold start, per-user scoring and full rescans: segment log vs action objects
+
+Run from backend/:  python -m benchmarks.bench_segments [--users 100000] [--actions 50]
+"""
+import argparse
+import random
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from app.core.conviction import ActionType, ConvictionAction, Platform, calculate_conviction_score
+from app.core.segments import ActionLog, record_dtype
+
+
+def generate(users: int, actions: int, seed: int = 7) -> dict:
+    rnd = random.Random(seed)
+    now = datetime.utcnow()
+    action_types, platforms = list(ActionType), list(Platform)
+    return {
+        f"fan-{u}": [
+            ConvictionAction(
+                rnd.choice(action_types),
+                rnd.choice(platforms),
+                now - timedelta(seconds=rnd.randrange(89 * 86400)),
+                rnd.random() < 0.9,
+                artist_name=rnd.choice(("Burna Boy", "Tems", "Wizkid", None)),
+            )
+            for _ in range(rnd.randint(1, 2 * actions))
+        ]
+        for u in range(users)
+    }
+
+
+def timed(fn) -> tuple:
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--actions", type=int, default=50, help="mean actions per user")
+    parser.add_argument("--sample", type=int, default=2000, help="users scored one at a time")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="palmlion-segments-")
+    try:
+        fans = generate(args.users, args.actions)
+        total = sum(len(actions) for actions in fans.values())
+        log = ActionLog(directory)
+        log.open()
+        elapsed, _ = timed(lambda: [log.append(u, a) for u, a in fans.items()])
+        print(f"{args.users} users, {total} actions")
+        print(f"  append                      : {total / elapsed:12.0f} actions/s")
+        log.close()
+
+        # What a restart costs: objects rebuilt from JSON dicts vs mapping files
+        dicts = {u: [a.to_dict() for a in actions] for u, actions in fans.items()}
+        elapsed, _ = timed(
+            lambda dicts=dicts: {
+                u: [ConvictionAction.from_dict(d) for d in ds] for u, ds in dicts.items()
+            }
+        )
+        print(f"  rehydrate objects           : {elapsed * 1000:12.1f} ms")
+        del dicts
+        log = ActionLog(directory)
+        elapsed, _ = timed(log.open)
+        print(f"  open segment log            : {elapsed * 1000:12.1f} ms")
+
+        sample = random.Random(1).sample(list(fans), min(args.sample, len(fans)))
+        elapsed, _ = timed(lambda: [log.records(u) for u in sample[:1]])
+        print(f"  first read (index build)    : {elapsed * 1000:12.1f} ms")
+        elapsed, _ = timed(lambda: [calculate_conviction_score(fans[u]) for u in sample])
+        print(f"  score, action objects       : {elapsed / len(sample) * 1e6:12.1f} us/user")
+        elapsed, _ = timed(lambda: [log.score(u) for u in sample])
+        print(f"  score, segments             : {elapsed / len(sample) * 1e6:12.1f} us/user")
+
+        elapsed, _ = timed(lambda: [calculate_conviction_score(a) for a in fans.values()])
+        print(f"  rescore all, action objects : {elapsed * 1000:12.1f} ms")
+        log.score_all()  # fault the pages in
+        elapsed, (scored, _) = timed(log.score_all)
+        scanned = total * record_dtype().itemsize
+        print(f"  rescore all, segments       : {elapsed * 1000:12.1f} ms"
+              f"  ({scanned / elapsed / 1e9:.2f} GB/s, {len(scored)} scored)")
+        log.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
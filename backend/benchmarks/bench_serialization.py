@@ -0,0 +1,88 @@
+"""
+Palmlion Serialization Benchmark
+Compares the old dict + jsonable_encoder path with typed models + orjson
+
+Run from backend/:  python -m benchmarks.bench_serialization [--users 1000]
+"""
+import argparse
+import asyncio
+import time
+from typing import Callable
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+from app.api.v1 import export, missions
+from app.core.actions import action_store
+from app.core.responses import ORJSONResponse
+
+
+def legacy_render(payload: dict) -> bytes:
+    """What FastAPI did for routes returning untyped dicts"""
+    return JSONResponse(jsonable_encoder(payload)).body
+
+
+def typed_renderer(model, exclude_none: bool = False) -> Callable[[dict], bytes]:
+    """What FastAPI does for a route with a response_model and ORJSONResponse"""
+    adapter = TypeAdapter(model)
+
+    def render(payload: dict) -> bytes:
+        value = adapter.validate_python(payload)
+        return ORJSONResponse(
+            adapter.dump_python(value, mode="json", exclude_none=exclude_none)
+        ).body
+    return render
+
+
+def measure(render: Callable[[dict], bytes], payload: dict, seconds: float) -> tuple:
+    render(payload)  # warm up
+    calls = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        render(payload)
+        calls += 1
+    elapsed = time.perf_counter() - start
+    return calls / elapsed, len(render(payload))
+
+
+def report(name: str, payload: dict, typed: Callable[[dict], bytes], seconds: float) -> None:
+    legacy_rate, legacy_size = measure(legacy_render, payload, seconds)
+    typed_rate, typed_size = measure(typed, payload, seconds)
+    print(f"{name}")
+    print(f"  dict + jsonable_encoder + json : {legacy_rate:10.1f} responses/s"
+          f"  ({legacy_size} bytes)")
+    print(f"  response_model + orjson        : {typed_rate:10.1f} responses/s"
+          f"  ({typed_size} bytes)")
+    print(f"  speedup                        : {typed_rate / legacy_rate:10.2f}x")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--users", type=int, default=1000, help="records in the /export/batch payload"
+    )
+    parser.add_argument("--seconds", type=float, default=2.0, help="time per measurement")
+    args = parser.parse_args()
+
+    asyncio.run(action_store.seed_demo())
+    batch_request = export.BatchExportRequest(user_ids=["demo-user-1"] * args.users)
+    batch_payload = asyncio.run(export.batch_export(batch_request))
+    report(
+        f"/export/batch ({args.users} records)",
+        batch_payload,
+        typed_renderer(export.BatchExportResponse, exclude_none=True),
+        args.seconds,
+    )
+
+    missions_payload = asyncio.run(missions.get_missions())
+    report(
+        f"/missions ({missions_payload['total']} missions)",
+        missions_payload,
+        typed_renderer(missions.MissionListResponse),
+        args.seconds,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Palmlion Import-Time Benchmark
+Fails when cold imports exceed their budget or pull in deferred dependencies
+
+Run from backend/:  python -m benchmarks.import_time [--repeat 5] [--update]
+
+Each module is imported in a fresh interpreter with `python -X importtime`.
+The best cumulative time over the repeats is compared against import_budget.json, and
+the modules listed under "forbid" must not be imported at all (numpy,
+httpx and fastapi are deferred until first use or until create_app()).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, Set, Tuple
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+BUDGET_FILE = Path(__file__).resolve().parent / "import_budget.json"
+
+# Headroom applied to measured times by --update
+UPDATE_HEADROOM = 2.0
+
+
+def import_profile(module: str) -> Tuple[float, Set[str], Dict[str, int]]:
+    """Cold-import a module; returns (cumulative ms, imported modules, self time per module)"""
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr}")
+
+    total_us = 0
+    imported: Set[str] = set()
+    self_times: Dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if not parts[0].strip().isdigit():
+            continue  # header row
+        self_us, cumulative_us, name = int(parts[0]), int(parts[1]), parts[2].strip()
+        imported.add(name)
+        self_times[name] = self_us
+        if name == module:
+            total_us = cumulative_us
+    return total_us / 1000, imported, self_times
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5, help="cold imports per module")
+    parser.add_argument("--update", action="store_true", help="rewrite budgets from this run")
+    parser.add_argument("--top", type=int, default=5, help="slowest imports to list on failure")
+    args = parser.parse_args()
+
+    budgets = json.loads(BUDGET_FILE.read_text())
+    failures = []
+
+    for module, budget in budgets.items():
+        runs = [import_profile(module) for _ in range(args.repeat)]
+        best_ms = min(ms for ms, _, _ in runs)
+        imported = set.union(*(names for _, names, _ in runs))
+        leaked = sorted(name for name in budget.get("forbid", []) if name in imported)
+
+        status = "ok"
+        if best_ms > budget["max_ms"]:
+            status = "SLOW"
+            failures.append(module)
+        if leaked:
+            status = "LEAK"
+            failures.append(module)
+        print(f"{status:4}  {module:32} {best_ms:8.1f} ms  (budget {budget['max_ms']} ms)")
+        if leaked:
+            print(f"      imports deferred dependencies: {', '.join(leaked)}")
+        if status != "ok":
+            _, _, self_times = runs[-1]
+            slowest = sorted(self_times.items(), key=lambda i: -i[1])[: args.top]
+            for name, us in slowest:
+                print(f"      {us / 1000:8.1f} ms  {name}")
+
+        if args.update:
+            budget["max_ms"] = round(best_ms * UPDATE_HEADROOM)
+
+    if args.update:
+        BUDGET_FILE.write_text(json.dumps(budgets, indent=2) + "\n")
+        print(f"Updated {BUDGET_FILE.name}")
+        return 0
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,4 @@
+"""
+Palmlion Load Tests
+End-to-end traffic mixes against the API with SLO reporting
+"""
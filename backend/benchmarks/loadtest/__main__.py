@@ -0,0 +1,161 @@
+"""
+Palmlion Load Test
+Drives every /api/v1 route with realistic traffic mixes and checks SLOs
+
+Run from backend/:
+    python -m benchmarks.loadtest [--scenario mixed] [--duration 10] [--concurrency 32]
+    python -m benchmarks.loadtest --base-url http://localhost:4001   # against uvicorn
+    python -m benchmarks.loadtest --baseline data/loadtest/<earlier>.json
+
+By default the app runs in this process over httpx.ASGITransport, with
+Africa's Talking, Issuance and Convicta answered by local stubs (see
+stubs.py). Results are written as JSON under data/loadtest/; pass one
+back as --baseline to see what a change did to throughput and p95.
+The exit status is 1 when any target in slo.json is missed.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+from datetime import datetime
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[2]
+SLO_FILE = Path(__file__).resolve().parent / "slo.json"
+RESULTS_DIR = BACKEND_DIR / "data" / "loadtest"
+
+# Headroom applied to measured values by --update-slo, and the smallest
+# latency target it writes (sub-millisecond targets only measure noise)
+UPDATE_HEADROOM = 2.0
+MIN_TARGET_MS = 10.0
+
+
+def parse_args() -> argparse.Namespace:
+    from benchmarks.loadtest.scenarios import SCENARIOS
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument(
+        "--scenario", action="append", choices=[*SCENARIOS, "all"],
+        help="scenario to run; repeatable (default: all)",
+    )
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per scenario")
+    parser.add_argument("--concurrency", type=int, default=32, help="virtual users")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for the traffic mix")
+    parser.add_argument("--base-url", help="target a running server instead of the in-process app")
+    parser.add_argument("--provider-latency-ms", type=float, default=20.0,
+                        help="mean latency of the stubbed providers")
+    parser.add_argument("--provider-error-rate", type=float, default=0.0,
+                        help="fraction of stubbed provider calls that fail with 503")
+    parser.add_argument("--output", type=Path, help="results file (default: data/loadtest/...)")
+    parser.add_argument("--baseline", type=Path, help="earlier results file to compare against")
+    parser.add_argument("--slo", type=Path, default=SLO_FILE, help="SLO targets")
+    parser.add_argument("--update-slo", action="store_true",
+                        help="rewrite the SLO latency targets from this run")
+    return parser.parse_args()
+
+
+async def run(args: argparse.Namespace, names: list) -> dict:
+    from app.core.config import settings
+    from benchmarks.loadtest.report import print_summary
+    from benchmarks.loadtest.runner import in_process_client, run_scenario, url_client
+    from benchmarks.loadtest.scenarios import SCENARIOS, World, prepare
+
+    if args.base_url:
+        client_context = url_client(args.base_url, args.concurrency)
+    else:
+        client_context = in_process_client(args.provider_latency_ms, args.provider_error_rate)
+
+    results = {}
+    async with client_context as client:
+        world = World(in_process=not args.base_url)
+        await prepare(client, settings.API_V1_PREFIX, world)
+        for name in names:
+            scenario = SCENARIOS[name]
+            summary = await run_scenario(
+                client, settings.API_V1_PREFIX, world, scenario,
+                args.duration, args.concurrency, args.seed,
+            )
+            print_summary(name, scenario.description, summary)
+            results[name] = summary
+    return results
+
+
+def update_slo(path: Path, slo: dict, results: dict) -> None:
+    """Set per-route p95/p99 targets and scenario throughput floors from measured values"""
+    routes = slo.setdefault("routes", {})
+    for summary in results.values():
+        for route, stats in summary["routes"].items():
+            target = routes.setdefault(route, {})
+            for key in ("p95_ms", "p99_ms"):
+                measured = max(MIN_TARGET_MS, round(stats[key] * UPDATE_HEADROOM, 1))
+                target[key] = max(target.get(key, 0), measured)
+    scenarios = slo.setdefault("scenarios", {})
+    for name, summary in results.items():
+        scenarios.setdefault(name, {})["min_rps"] = round(summary["total"]["rps"] / UPDATE_HEADROOM)
+    path.write_text(json.dumps(slo, indent=2, sort_keys=True) + "\n")
+    print(f"\nUpdated {path.name}")
+
+
+def main() -> int:
+    args = parse_args()
+    if not args.base_url:
+        # Provider settings must be in place before app.core reads them
+        from benchmarks.loadtest.stubs import provider_environment
+
+        for key, value in provider_environment().items():
+            os.environ.setdefault(key, value)
+
+    from benchmarks.loadtest.report import check_slo, compare
+    from benchmarks.loadtest.runner import git_revision
+    from benchmarks.loadtest.scenarios import SCENARIOS
+
+    names = list(SCENARIOS) if not args.scenario or "all" in args.scenario else args.scenario
+    results = asyncio.run(run(args, names))
+
+    slo = json.loads(args.slo.read_text()) if args.slo.exists() else {}
+    if args.update_slo:
+        update_slo(args.slo, slo, results)
+        violations = []
+    else:
+        violations = [line for name in names for line in check_slo(name, results[name], slo)]
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())
+        for name in names:
+            lines = compare(name, results[name], baseline)
+            if lines:
+                print(f"\n{name} vs {args.baseline.name}")
+                print("\n".join(lines))
+
+    generated_at = datetime.utcnow()
+    output = args.output or RESULTS_DIR / f"{generated_at:%Y%m%dT%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({
+        "generated_at": generated_at.isoformat(),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "target": args.base_url or "asgi",
+        "config": {
+            "duration_s": args.duration,
+            "concurrency": args.concurrency,
+            "seed": args.seed,
+            "provider_latency_ms": args.provider_latency_ms,
+            "provider_error_rate": args.provider_error_rate,
+        },
+        "scenarios": results,
+        "slo_violations": violations,
+    }, indent=2) + "\n")
+    print(f"\nResults written to {output}")
+
+    if violations:
+        print(f"\n{len(violations)} SLO violation(s):")
+        for line in violations:
+            print(f"  {line}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""
+Palmlion Load Test Reporting
+Per-route percentiles, SLO checks and comparison with a baseline run
+"""
+import math
+from typing import Dict, List, Sequence
+
+from benchmarks.loadtest.scenarios import Recorder
+
+PERCENTILES = (50, 90, 95, 99)
+
+# Latency growth against a baseline that is reported as a regression
+REGRESSION_THRESHOLD = 0.2
+
+
+def percentile(ordered: Sequence[float], q: float) -> float:
+    """Nearest-rank percentile of an ascending sequence"""
+    if not ordered:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def _latency_stats(latencies: List[float], statuses: Dict[int, int], elapsed: float) -> dict:
+    ordered = sorted(latencies)
+    requests = len(ordered)
+    errors = sum(count for status, count in statuses.items() if not 200 <= status < 400)
+    stats = {
+        "requests": requests,
+        "errors": errors,
+        "error_rate": round(errors / requests, 4) if requests else 0.0,
+        "rps": round(requests / elapsed, 1) if elapsed else 0.0,
+    }
+    for q in PERCENTILES:
+        stats[f"p{q}_ms"] = round(percentile(ordered, q) * 1000, 3)
+    stats["max_ms"] = round(ordered[-1] * 1000, 3) if ordered else 0.0
+    stats["statuses"] = {str(status): count for status, count in sorted(statuses.items())}
+    return stats
+
+
+def summarize(recorder: Recorder, elapsed: float) -> dict:
+    """Throughput and latency percentiles per route and overall"""
+    routes = {
+        route: _latency_stats(latencies, recorder.statuses[route], elapsed)
+        for route, latencies in sorted(recorder.latencies.items())
+    }
+    merged_statuses: Dict[int, int] = {}
+    for statuses in recorder.statuses.values():
+        for status, count in statuses.items():
+            merged_statuses[status] = merged_statuses.get(status, 0) + count
+    everything = [x for latencies in recorder.latencies.values() for x in latencies]
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "total": _latency_stats(everything, merged_statuses, elapsed),
+        "routes": routes,
+    }
+
+
+def check_slo(scenario: str, summary: dict, slo: dict) -> List[str]:
+    """Every SLO target the scenario's results miss, as readable lines"""
+    violations = []
+    default = slo.get("default", {})
+    for route, stats in summary["routes"].items():
+        targets = {**default, **slo.get("routes", {}).get(route, {})}
+        for q in PERCENTILES:
+            limit = targets.get(f"p{q}_ms")
+            if limit is not None and stats[f"p{q}_ms"] > limit:
+                violations.append(
+                    f"{scenario}: {route} p{q} {stats[f'p{q}_ms']:.1f} ms > {limit} ms"
+                )
+        limit = targets.get("error_rate")
+        if limit is not None and stats["error_rate"] > limit:
+            violations.append(
+                f"{scenario}: {route} error rate {stats['error_rate']:.2%} > {limit:.2%}"
+            )
+
+    min_rps = slo.get("scenarios", {}).get(scenario, {}).get("min_rps")
+    if min_rps is not None and summary["total"]["rps"] < min_rps:
+        violations.append(f"{scenario}: throughput {summary['total']['rps']} rps < {min_rps} rps")
+    return violations
+
+
+def compare(scenario: str, summary: dict, baseline: dict) -> List[str]:
+    """p95 and throughput changes against the same scenario in a previous results file"""
+    previous = baseline.get("scenarios", {}).get(scenario)
+    if previous is None:
+        return []
+    lines = []
+    before, after = previous["total"]["rps"], summary["total"]["rps"]
+    if before:
+        lines.append(f"  throughput {before} -> {after} rps ({(after - before) / before:+.1%})")
+    for route, stats in summary["routes"].items():
+        old = previous["routes"].get(route)
+        if not old or not old["p95_ms"]:
+            continue
+        change = (stats["p95_ms"] - old["p95_ms"]) / old["p95_ms"]
+        marker = "  REGRESSION" if change > REGRESSION_THRESHOLD else ""
+        lines.append(
+            f"  {route:44} p95 {old['p95_ms']:8.2f} -> {stats['p95_ms']:8.2f} ms "
+            f"({change:+.1%}){marker}"
+        )
+    return lines
+
+
+def print_summary(scenario: str, description: str, summary: dict) -> None:
+    total = summary["total"]
+    print(f"\n{scenario}: {description}")
+    print(
+        f"  {total['requests']} requests in {summary['elapsed_s']} s, "
+        f"{total['rps']} rps, {total['error_rate']:.2%} errors"
+    )
+    print(f"  {'route':44} {'req':>7} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'err':>6}")
+    for route, stats in summary["routes"].items():
+        print(
+            f"  {route:44} {stats['requests']:7} {stats['rps']:8.1f} {stats['p50_ms']:8.2f} "
+            f"{stats['p95_ms']:8.2f} {stats['p99_ms']:8.2f} {stats['error_rate']:6.1%}"
+        )
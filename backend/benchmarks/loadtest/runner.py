@@ -0,0 +1,102 @@
+"""
+Palmlion Load Test Runner
+Closed-loop virtual users driving a scenario against an app or a URL
+"""
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+import httpx
+
+from benchmarks.loadtest.report import summarize
+from benchmarks.loadtest.scenarios import OPERATIONS, Recorder, Scenario, Session, World
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    prefix: str,
+    world: World,
+    scenario: Scenario,
+    duration: float,
+    concurrency: int,
+    seed: int = 0,
+) -> dict:
+    """
+    Run `concurrency` virtual users for `duration` seconds
+
+    Each user picks its next operation from the scenario's weights and
+    issues it as soon as the previous one finished, so throughput is
+    what the server sustains at that concurrency. Periodic operations
+    run once per interval each, on top of the users.
+    """
+    recorder = Recorder()
+    names = list(scenario.weights)
+    weights = [scenario.weights[name] for name in names]
+    deadline = time.perf_counter() + duration
+
+    async def virtual_user(index: int) -> None:
+        rng = random.Random(seed * 1_000_003 + index)
+        session = Session(client, prefix, recorder, world, rng)
+        while time.perf_counter() < deadline:
+            await OPERATIONS[rng.choices(names, weights)[0]](session)
+            # In-process calls can complete without suspending; yield so
+            # the other users and the periodic jobs get their turn
+            await asyncio.sleep(0)
+
+    async def periodic(index: int, name: str, interval: float) -> None:
+        session = Session(client, prefix, recorder, world, random.Random(-seed - index - 1))
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            await OPERATIONS[name](session)
+            await asyncio.sleep(
+                max(0.0, min(interval - (time.perf_counter() - started), deadline - started))
+            )
+
+    jobs = enumerate(scenario.periodic.items())
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(virtual_user(i) for i in range(concurrency)),
+        *(periodic(i, name, interval) for i, (name, interval) in jobs),
+    )
+    return summarize(recorder, time.perf_counter() - start)
+
+
+@asynccontextmanager
+async def in_process_client(
+    provider_latency_ms: float,
+    provider_error_rate: float,
+) -> AsyncIterator[httpx.AsyncClient]:
+    """Client bound to a fresh app over ASGITransport, with providers stubbed"""
+    from app.main import create_app
+    from benchmarks.loadtest.stubs import provider_transport
+
+    transport = provider_transport(provider_latency_ms, provider_error_rate)
+    app = create_app(provider_transport=transport)
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://loadtest", timeout=60.0
+        ) as client:
+            yield client
+
+
+@asynccontextmanager
+async def url_client(base_url: str, concurrency: int) -> AsyncIterator[httpx.AsyncClient]:
+    """Client for a server that is already running, e.g. a local uvicorn"""
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60.0) as client:
+        yield client
+
+
+def git_revision() -> Optional[str]:
+    import subprocess
+
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5
+        )
+    except OSError:
+        return None
+    return result.stdout.strip() or None
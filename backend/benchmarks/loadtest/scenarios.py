@@ -0,0 +1,506 @@
+"""
+Palmlion Load Test Scenarios
+API operations and the traffic mixes that combine them
+"""
+import json
+import os
+import random
+import time
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+REGIONS = ["lagos", "nairobi", "johannesburg", "accra", "kampala"]
+PHONE_PREFIXES = ["+234", "+254", "+27", "+233", "+256"]
+MISSION_IDS = ["mission-1", "mission-2", "mission-3"]
+MINT_MISSION = "mission-2"  # threshold 1: one proof completes it
+ARTISTS = ["Burna Boy", "Tems", "Wizkid", "Tyla", "Sauti Sol"]
+
+
+class Recorder:
+    """Latency samples and status codes per route template"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+
+    def record(self, route: str, status: int, latency: float) -> None:
+        self.latencies[route].append(latency)
+        self.statuses[route][status] += 1
+
+
+@dataclass
+class World:
+    """State shared by every virtual user in a run"""
+    in_process: bool
+    # demo-user-1 has seeded actions but no account record
+    users: List[str] = field(default_factory=lambda: ["demo-user-1"])
+    accounts: List[str] = field(default_factory=list)
+    sms_ids: List[str] = field(default_factory=list)
+    mint_ids: List[str] = field(default_factory=list)
+    # Users who completed MINT_MISSION during prepare(), so mints are allowed
+    mint_users: List[str] = field(default_factory=list)
+
+    def user(self, rng: random.Random) -> str:
+        return rng.choice(self.users)
+
+    def add_account(self, user_id: str) -> None:
+        self.users.append(user_id)
+        self.accounts.append(user_id)
+
+
+class Session:
+    """One virtual user: a client, a random stream and the shared world"""
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        prefix: str,
+        recorder: Recorder,
+        world: World,
+        rng: random.Random,
+    ):
+        self.client = client
+        self.prefix = prefix
+        self.recorder = recorder
+        self.world = world
+        self.rng = rng
+
+    async def call(self, method: str, route: str, path: str, **kwargs) -> Optional[httpx.Response]:
+        """Issue a request and record it under "METHOD route"; None on transport errors"""
+        label = f"{method} {route}"
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, self.prefix + path, **kwargs)
+            await response.aread()
+        except httpx.HTTPError:
+            self.recorder.record(label, 0, time.perf_counter() - start)
+            return None
+        self.recorder.record(label, response.status_code, time.perf_counter() - start)
+        return response
+
+
+Operation = Callable[[Session], Awaitable[None]]
+OPERATIONS: Dict[str, Operation] = {}
+
+
+def operation(name: str):
+    def register(func: Operation) -> Operation:
+        OPERATIONS[name] = func
+        return func
+    return register
+
+
+def _ok(response: Optional[httpx.Response]) -> bool:
+    return response is not None and response.status_code == 200
+
+
+# --- Auth -------------------------------------------------------------------
+
+@operation("register_phone")
+async def register_phone(s: Session) -> None:
+    phone = s.rng.choice(PHONE_PREFIXES) + str(s.rng.randrange(10 ** 8, 10 ** 9))
+    response = await s.call(
+        "POST", "/auth/register/phone", "/auth/register/phone",
+        json={"phone": phone, "region": s.rng.choice(REGIONS)},
+    )
+    if not _ok(response):
+        return
+    s.world.sms_ids.append(response.json()["sms_id"])
+    if not s.world.in_process:
+        return  # the OTP is only readable from inside the server process
+
+    from app.api.v1.auth import OTPS
+    from app.core.state import state_backend
+
+    stored = await state_backend.get(OTPS, phone)
+    if stored is None:
+        return
+    response = await s.call(
+        "POST", "/auth/verify-otp", "/auth/verify-otp",
+        json={"phone": phone, "code": stored["code"]},
+    )
+    if _ok(response):
+        s.world.add_account(response.json()["id"])
+
+
+@operation("register_telegram")
+async def register_telegram(s: Session) -> None:
+    telegram_id = str(s.rng.getrandbits(48))
+    response = await s.call(
+        "POST", "/auth/register/telegram", "/auth/register/telegram",
+        json={"telegram_id": telegram_id, "region": s.rng.choice(REGIONS)},
+    )
+    if _ok(response):
+        s.world.add_account(response.json()["id"])
+
+
+@operation("sms_status")
+async def sms_status(s: Session) -> None:
+    if s.world.sms_ids:
+        sms_id = s.rng.choice(s.world.sms_ids)
+        await s.call("GET", "/auth/sms/{sms_id}", f"/auth/sms/{sms_id}")
+
+
+@operation("delivery_report")
+async def delivery_report(s: Session) -> None:
+    await s.call(
+        "POST", "/auth/sms/delivery-report", "/auth/sms/delivery-report",
+        params={"token": os.environ.get("AFRICAS_TALKING_CALLBACK_TOKEN", "")},
+        data={"id": f"ATXid_{s.rng.getrandbits(48):x}", "status": "Success"},
+    )
+
+
+@operation("profile")
+async def profile(s: Session) -> None:
+    if s.world.accounts:
+        user_id = s.rng.choice(s.world.accounts)
+        await s.call("GET", "/auth/me", "/auth/me", params={"user_id": user_id})
+
+
+# --- Conviction -------------------------------------------------------------
+
+@operation("score")
+async def score(s: Session) -> None:
+    await s.call("GET", "/conviction/score", "/conviction/score",
+                 params={"user_id": s.world.user(s.rng)})
+
+
+@operation("breakdown")
+async def breakdown(s: Session) -> None:
+    await s.call("GET", "/conviction/breakdown", "/conviction/breakdown",
+                 params={"user_id": s.world.user(s.rng)})
+
+
+@operation("history")
+async def history(s: Session) -> None:
+    await s.call("GET", "/conviction/history", "/conviction/history",
+                 params={"user_id": s.world.user(s.rng), "days": 30})
+
+
+@operation("leaderboard")
+async def leaderboard(s: Session) -> None:
+    params = {"limit": 50}
+    if s.rng.random() < 0.7:
+        params["region"] = s.rng.choice(REGIONS)
+    await s.call("GET", "/conviction/leaderboard", "/conviction/leaderboard", params=params)
+
+
+@operation("tiers")
+async def tiers(s: Session) -> None:
+    await s.call("GET", "/conviction/tiers", "/conviction/tiers")
+
+
+@operation("artist_superfans")
+async def artist_superfans(s: Session) -> None:
+    artist = s.rng.choice(ARTISTS)
+    await s.call("GET", "/conviction/artists/{artist_name}/superfans",
+                 f"/conviction/artists/{artist}/superfans", params={"limit": 50})
+
+
+@operation("fan_artists")
+async def fan_artists(s: Session) -> None:
+    await s.call("GET", "/conviction/artists", "/conviction/artists",
+                 params={"user_id": s.world.user(s.rng)})
+
+
+# --- Analytics --------------------------------------------------------------
+
+@operation("city_dashboard")
+async def city_dashboard(s: Session) -> None:
+    region = s.rng.choice(REGIONS)
+    window = s.rng.choice(["1h", "24h", "7d"])
+    await s.call("GET", "/analytics/regions/{region}", f"/analytics/regions/{region}",
+                 params={"window": window})
+
+
+@operation("regions_overview")
+async def regions_overview(s: Session) -> None:
+    await s.call("GET", "/analytics/regions", "/analytics/regions")
+
+
+@operation("trending")
+async def trending(s: Session) -> None:
+    kind = s.rng.choice(["artist", "track", "mission"])
+    if s.rng.random() < 0.5:
+        await s.call("GET", "/trending", "/trending", params={"kind": kind})
+    else:
+        region = s.rng.choice(REGIONS)
+        await s.call("GET", "/trending/{region}", f"/trending/{region}", params={"kind": kind})
+
+
+@operation("artist_reach")
+async def artist_reach(s: Session) -> None:
+    window = s.rng.choice(["1d", "7d", "30d"])
+    if s.rng.random() < 0.5:
+        await s.call("GET", "/analytics/reach", "/analytics/reach", params={"window": window})
+    else:
+        artist = s.rng.choice(ARTISTS)
+        await s.call("GET", "/analytics/reach/{artist_name}", f"/analytics/reach/{artist}",
+                     params={"window": window})
+
+
+# --- Missions ---------------------------------------------------------------
+
+@operation("missions_feed")
+async def missions_feed(s: Session) -> None:
+    await s.call("GET", "/missions", "/missions", params={"user_id": s.world.user(s.rng)})
+
+
+@operation("mission_detail")
+async def mission_detail(s: Session) -> None:
+    mission_id = s.rng.choice(MISSION_IDS)
+    await s.call("GET", "/missions/{mission_id}", f"/missions/{mission_id}",
+                 params={"user_id": s.world.user(s.rng)})
+
+
+@operation("submit")
+async def submit(s: Session) -> None:
+    mission_id = s.rng.choice(MISSION_IDS)
+    await s.call(
+        "POST", "/missions/{mission_id}/submit", f"/missions/{mission_id}/submit",
+        params={"user_id": s.world.user(s.rng)},
+        json={
+            "mission_id": mission_id,
+            "proof_type": "link",
+            # Unique across runs: proofs stay claimed for the conviction lookback
+            "proof_data": f"https://t.me/c/{uuid.uuid4().hex}",
+        },
+    )
+
+
+@operation("mission_status")
+async def mission_status(s: Session) -> None:
+    mission_id = s.rng.choice(MISSION_IDS)
+    await s.call("GET", "/missions/{mission_id}/verify", f"/missions/{mission_id}/verify",
+                 params={"user_id": s.world.user(s.rng)})
+
+
+# --- Verification -----------------------------------------------------------
+
+@operation("link_account")
+async def link_account(s: Session) -> None:
+    user_id = s.world.user(s.rng)
+    if s.rng.random() < 0.5:
+        await s.call("POST", "/verify/boomplay", "/verify/boomplay",
+                     params={"user_id": user_id}, json={"boomplay_user_id": f"bp{user_id}"})
+    else:
+        await s.call("POST", "/verify/audiomack", "/verify/audiomack",
+                     params={"user_id": user_id}, json={"audiomack_url_slug": f"am{user_id}"})
+
+
+@operation("account_status")
+async def account_status(s: Session) -> None:
+    await s.call("GET", "/verify/status", "/verify/status", params={"user_id": s.world.user(s.rng)})
+
+
+@operation("verify_streams")
+async def verify_streams(s: Session) -> None:
+    # demo-user-1 is linked to Boomplay during setup
+    await s.call(
+        "POST", "/verify/streams", "/verify/streams",
+        params={"user_id": "demo-user-1"},
+        json={"platform": "boomplay", "track_id": "tems-free-mind", "min_plays": 60},
+    )
+
+
+@operation("oauth_url")
+async def oauth_url(s: Session) -> None:
+    platform = s.rng.choice(["boomplay", "audiomack"])
+    await s.call("GET", "/verify/oauth/{platform}", f"/verify/oauth/{platform}")
+
+
+# --- Export -----------------------------------------------------------------
+
+def _batch(s: Session, size: int) -> dict:
+    return {"user_ids": [s.world.user(s.rng) for _ in range(size)]}
+
+
+@operation("export_user")
+async def export_user(s: Session) -> None:
+    user_id = s.world.user(s.rng)
+    await s.call("GET", "/export/conviction/{user_id}", f"/export/conviction/{user_id}")
+
+
+@operation("export_reach")
+async def export_reach(s: Session) -> None:
+    artist = s.rng.choice(ARTISTS)
+    await s.call("GET", "/export/reach/{artist_name}", f"/export/reach/{artist}",
+                 params={"window": "30d"})
+
+
+@operation("export_push")
+async def export_push(s: Session) -> None:
+    user_id = s.world.user(s.rng)
+    await s.call("POST", "/export/conviction/{user_id}/push", f"/export/conviction/{user_id}/push",
+                 json={"convicta_user_id": f"cv-{user_id}"})
+
+
+@operation("export_batch")
+async def export_batch(s: Session) -> None:
+    await s.call("POST", "/export/batch", "/export/batch", json=_batch(s, 100))
+
+
+@operation("export_stream")
+async def export_stream(s: Session) -> None:
+    await s.call("POST", "/export/batch/stream", "/export/batch/stream", json=_batch(s, 500))
+
+
+@operation("export_columnar")
+async def export_columnar(s: Session) -> None:
+    await s.call("POST", "/export/batch/columnar", "/export/batch/columnar", json=_batch(s, 500))
+
+
+@operation("batch_push")
+async def batch_push(s: Session) -> None:
+    await s.call("POST", "/export/batch/push", "/export/batch/push", json=_batch(s, 100))
+
+
+@operation("changes")
+async def changes(s: Session) -> None:
+    await s.call("GET", "/export/changes", "/export/changes", params={"since": 0, "limit": 1000})
+
+
+@operation("outbox_status")
+async def outbox_status(s: Session) -> None:
+    await s.call("GET", "/export/outbox", "/export/outbox")
+
+
+@operation("trigger_mint")
+async def trigger_mint(s: Session) -> None:
+    response = await s.call(
+        "POST", "/export/trigger-mint/{user_id}",
+        f"/export/trigger-mint/{s.rng.choice(s.world.mint_users)}",
+        params={
+            "stake_percentage": 0.01,
+            "wallet_address": f"0x{s.rng.getrandbits(160):040x}",
+            "mission_id": MINT_MISSION,
+        },
+    )
+    if _ok(response):
+        s.world.mint_ids.append(response.json()["mint_id"])
+
+
+@operation("mint_status")
+async def mint_status(s: Session) -> None:
+    if s.world.mint_ids:
+        mint_id = s.rng.choice(s.world.mint_ids)
+        await s.call("GET", "/export/mint/{mint_id}", f"/export/mint/{mint_id}")
+
+
+@operation("mint_pipeline")
+async def mint_pipeline_status(s: Session) -> None:
+    await s.call("GET", "/export/mints", "/export/mints")
+
+
+# --- Ingestion --------------------------------------------------------------
+
+@operation("ingest")
+async def ingest(s: Session) -> None:
+    now = time.time()
+    lines = [
+        json.dumps({
+            "user_id": s.world.user(s.rng),
+            "action_type": s.rng.choice(["stream", "stream", "share", "playlist_add"]),
+            "platform": s.rng.choice(["boomplay", "audiomack"]),
+            "timestamp": now - s.rng.randrange(86400),
+            "proof_hash": f"lt:{s.rng.getrandbits(64):016x}",
+            "artist_name": s.rng.choice(ARTISTS),
+        })
+        for _ in range(500)
+    ]
+    headers = {"Content-Type": "application/x-ndjson"}
+    if os.environ.get("INGEST_API_KEY"):
+        headers["Authorization"] = f"Bearer {os.environ['INGEST_API_KEY']}"
+    await s.call("POST", "/ingest/events", "/ingest/events", content="\n".join(lines),
+                 headers=headers)
+
+
+@operation("ingest_status")
+async def ingest_status(s: Session) -> None:
+    await s.call("GET", "/ingest/status", "/ingest/status")
+
+
+@dataclass(frozen=True)
+class Scenario:
+    """
+    A weighted mix of operations for the virtual users
+
+    periodic operations (name -> interval in seconds) run on their own
+    schedule alongside the users, like the Convicta sync jobs do; in a
+    closed loop they would otherwise tie up most users in slow calls.
+    """
+    name: str
+    description: str
+    weights: Dict[str, float]
+    periodic: Dict[str, float] = field(default_factory=dict)
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    scenario.name: scenario
+    for scenario in (
+        Scenario(
+            "registration_burst",
+            "Signup wave after a Telegram announcement: phone and Telegram registrations",
+            {"register_phone": 5, "register_telegram": 3, "sms_status": 1, "profile": 1},
+        ),
+        Scenario(
+            "mission_storm",
+            "Viral mission: proof submissions dominate, with feed and status checks",
+            {
+                "submit": 6, "missions_feed": 2, "mission_status": 1, "verify_streams": 1,
+                "trending": 1,
+            },
+        ),
+        Scenario(
+            "leaderboard_polling",
+            "City dashboards and the frontend polling leaderboards and scores",
+            {
+                "leaderboard": 6, "tiers": 2, "score": 2, "city_dashboard": 3,
+                "regions_overview": 1, "trending": 3,
+            },
+        ),
+        Scenario(
+            "mixed",
+            "Steady-state traffic touching every /api/v1 route",
+            {
+                "register_phone": 2, "register_telegram": 2, "sms_status": 1,
+                "delivery_report": 1, "profile": 2,
+                "score": 6, "breakdown": 2, "history": 1, "leaderboard": 8, "tiers": 2,
+                "city_dashboard": 2, "regions_overview": 1, "artist_superfans": 2, "fan_artists": 1,
+                "trending": 2, "artist_reach": 1,
+                "missions_feed": 8, "mission_detail": 3, "submit": 5, "mission_status": 2,
+                "link_account": 1, "account_status": 2, "verify_streams": 2, "oauth_url": 1,
+                "export_user": 2, "export_reach": 0.5, "export_push": 0.5, "changes": 0.5,
+                "outbox_status": 0.5,
+                "trigger_mint": 1, "mint_status": 1, "mint_pipeline": 0.5,
+                "ingest_status": 0.5,
+            },
+            periodic={
+                "export_batch": 1.0, "batch_push": 2.0, "export_stream": 5.0,
+                "export_columnar": 5.0, "ingest": 1.0,
+            },
+        ),
+    )
+}
+
+
+async def prepare(client: httpx.AsyncClient, prefix: str, world: World) -> None:
+    """Seed state that operations rely on, without recording it"""
+    seed = Session(client, prefix, Recorder(), world, random.Random("prepare"))
+    await seed.call("POST", "/verify/boomplay", "/verify/boomplay",
+                    params={"user_id": "demo-user-1"}, json={"boomplay_user_id": "bp-demo"})
+    for _ in range(20):
+        await register_telegram(seed)
+    for user_id in list(world.users):
+        response = await seed.call(
+            "POST", "/missions/{mission_id}/submit", f"/missions/{MINT_MISSION}/submit",
+            params={"user_id": user_id},
+            json={"mission_id": MINT_MISSION, "proof_type": "link",
+                  "proof_data": f"https://t.me/palmpride/{uuid.uuid4().hex}"},
+        )
+        if _ok(response):
+            world.mint_users.append(user_id)
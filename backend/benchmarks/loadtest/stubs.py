@@ -0,0 +1,82 @@
+"""
+Palmlion Load Test Provider Stubs
+Local stand-ins for Africa's Talking, Issuance and Convicta
+"""
+import asyncio
+import json
+import os
+import random
+import tempfile
+from urllib.parse import parse_qs
+
+import httpx
+
+SMS_HOST = "sms.stub"
+ISSUANCE_HOST = "issuance.stub"
+CONVICTA_HOST = "convicta.stub"
+
+
+def provider_environment(data_dir: str = "") -> dict:
+    """
+    Settings that put every outbound provider in live mode against the stubs
+
+    Must be applied to os.environ before app settings are first read.
+    """
+    return {
+        "AFRICAS_TALKING_API_KEY": "loadtest",
+        "AFRICAS_TALKING_USERNAME": "loadtest",
+        "AFRICAS_TALKING_API_URL": f"http://{SMS_HOST}/version1/messaging",
+        "AFRICAS_TALKING_CALLBACK_TOKEN": "loadtest",
+        "ISSUANCE_API_URL": f"http://{ISSUANCE_HOST}",
+        "ISSUANCE_API_KEY": "loadtest",
+        "CONVICTA_API_URL": f"http://{CONVICTA_HOST}",
+        "CONVICTA_API_KEY": "loadtest",
+        "INGEST_API_KEY": "loadtest",
+        "OUTBOX_DIR": os.path.join(data_dir or tempfile.mkdtemp(prefix="palmlion-lt-"), "outbox"),
+        "ACCESS_LOG": "false",
+        "LOG_LEVEL": "WARNING",
+    }
+
+
+def provider_transport(latency_ms: float = 20.0, error_rate: float = 0.0) -> httpx.MockTransport:
+    """
+    One transport answering all three providers
+
+    Each call sleeps for a jittered latency around latency_ms, and a
+    fraction error_rate of calls fail with a retryable 503.
+    """
+    async def handle(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(random.uniform(0.5, 1.5) * latency_ms / 1000)
+        if error_rate and random.random() < error_rate:
+            return httpx.Response(503, json={"error": "stub outage"})
+
+        host = request.url.host
+        if host == SMS_HOST:
+            form = parse_qs(request.content.decode())
+            numbers = form.get("to", [""])[0].split(",")
+            return httpx.Response(200, json={"SMSMessageData": {"Recipients": [
+                {
+                    "number": number,
+                    "statusCode": 101,
+                    "status": "Success",
+                    "messageId": f"ATXid_{random.getrandbits(48):x}",
+                    "cost": "KES 0.8000",
+                }
+                for number in numbers
+            ]}})
+        if host == ISSUANCE_HOST:
+            mints = json.loads(request.content)["mints"]
+            return httpx.Response(200, json={"results": [
+                {
+                    "idempotency_key": mint["idempotency_key"],
+                    "status": "minted",
+                    "mint_id": f"iss_{random.getrandbits(48):x}",
+                }
+                for mint in mints
+            ]})
+        if host == CONVICTA_HOST:
+            records = json.loads(request.content)["records"]
+            return httpx.Response(200, json={"accepted": len(records)})
+        return httpx.Response(404, json={"error": f"no stub for {host}"})
+
+    return httpx.MockTransport(handle)